@@ -0,0 +1,192 @@
+import threading
+import time
+from collections import deque
+import numpy as np
+from work_queue import WorkQueue, QueueFullError
+from metrics import span
+
+# Tenta importar o Twilio, se não tiver instalado, não quebra
+try:
+    from twilio.rest import Client
+    from twilio.http.http_client import TwilioHttpClient
+    TWILIO_INSTALLED = True
+except ImportError:
+    TWILIO_INSTALLED = False
+
+COOLDOWN_PADRAO = 300  # Segundos mínimos entre dois SMS do mesmo paciente
+
+
+# --- PROVEDORES DE SMS ---
+class TwilioProvider:
+    """Um único Client do Twilio (sessão HTTP com pool de conexões) reaproveitado em todos os envios."""
+
+    def __init__(self, sid, token, remetente, timeout=10):
+        if not TWILIO_INSTALLED:
+            raise RuntimeError("Biblioteca Twilio não instalada via pip.")
+        self.remetente = remetente
+        self._client = Client(sid, token, http_client=TwilioHttpClient(pool_connections=True, timeout=timeout))
+
+    def enviar(self, destino, mensagem):
+        return self._client.messages.create(body=mensagem, from_=self.remetente, to=destino).sid
+
+
+class FakeSmsProvider:
+    """Provedor local para testes e benchmarks: guarda as mensagens em vez de enviar."""
+
+    def __init__(self, latencia=0.0, falhas=0):
+        self.latencia = latencia
+        self.falhas = falhas  # Quantos envios vão falhar antes de começar a funcionar
+        self.enviados = []  # (destino, mensagem)
+        self._lock = threading.Lock()
+
+    def enviar(self, destino, mensagem):
+        if self.latencia:
+            time.sleep(self.latencia)
+        with self._lock:
+            if self.falhas > 0:
+                self.falhas -= 1
+                raise ConnectionError("Falha simulada do provedor de SMS")
+            self.enviados.append((destino, mensagem))
+            return f"fake-{len(self.enviados)}"
+
+
+# --- ALERTA (pode juntar vários eventos do mesmo paciente) ---
+class _Alerta:
+    def __init__(self, paciente, status, link):
+        self.paciente = paciente
+        self.status = status
+        self.link = link
+        self.quantidade = 1
+        self.primeiro = time.time()
+
+    def juntar(self, status, link):
+        self.status = status
+        self.link = link
+        self.quantidade += 1
+
+    def mensagem(self):
+        if self.quantidade == 1:
+            return f"🚨 ALERTA HEARTGUARD: {self.paciente} apresenta {self.status}. Acompanhe: {self.link}"
+        minutos = max(1, round((time.time() - self.primeiro) / 60))
+        return (f"🚨 ALERTA HEARTGUARD: {self.paciente} apresenta {self.status} "
+                f"({self.quantidade} alertas em {minutos} min). Acompanhe: {self.link}")
+
+
+class AlertDispatcher:
+    """
+    Envio de SMS de alerta fora do caminho da requisição.
+
+    - alertar() só enfileira: a API nunca espera o provedor.
+    - Cooldown por paciente: no máximo um SMS a cada `cooldown` segundos. Alertas que
+      chegam nesse intervalo (ou enquanto o SMS anterior ainda está na fila) são
+      juntados num único SMS de resumo, enviado quando o cooldown acaba.
+    - Fila e threads próprias (WorkQueue) com nova tentativa e backoff exponencial.
+    - stats(): profundidade da fila, enviados/falhas/juntados e latência de envio.
+    """
+
+    def __init__(self, provider, registry, cooldown=COOLDOWN_PADRAO, workers=2, max_pending=500,
+                 max_retries=3, backoff=1.0):
+        self.provider = provider
+        self.registry = registry
+        self.cooldown = cooldown
+        self._fila = WorkQueue(max_workers=workers, max_pending=max_pending, max_retries=max_retries,
+                               backoff=backoff, nome="heartguard-sms")
+        self._lock = threading.Lock()
+        self._ultimo_envio = {}  # paciente -> time.monotonic() do último SMS entregue
+        self._pendentes = {}  # paciente -> _Alerta ainda não enviado (na fila ou aguardando cooldown)
+        self._timers = {}  # paciente -> threading.Timer do resumo pós-cooldown
+        self._latencias = deque(maxlen=1000)
+        self.contadores = {"alerts": 0, "sent": 0, "failed": 0, "coalesced": 0, "deferred": 0,
+                           "no_phone": 0, "dropped": 0}
+
+    # --- ENTRADA (chamada pela API) ---
+    def alertar(self, paciente, status, link):
+        """Devolve 'queued', 'deferred' (aguarda cooldown), 'coalesced' ou 'disabled'."""
+        if self.provider is None:
+            print("⚠️ Aviso SMS: nenhum provedor de SMS configurado. Pulei o envio.")
+            return "disabled"
+        with self._lock:
+            self.contadores["alerts"] += 1
+            pendente = self._pendentes.get(paciente)
+            if pendente is not None:
+                pendente.juntar(status, link)
+                self.contadores["coalesced"] += 1
+                return "coalesced"
+            alerta = _Alerta(paciente, status, link)
+            self._pendentes[paciente] = alerta
+            espera = self._ultimo_envio.get(paciente, -float("inf")) + self.cooldown - time.monotonic()
+            if espera > 0:
+                timer = threading.Timer(espera, self._enfileirar, args=(alerta,))
+                timer.daemon = True
+                self._timers[paciente] = timer
+                timer.start()
+                self.contadores["deferred"] += 1
+                return "deferred"
+        self._enfileirar(alerta)
+        return "queued"
+
+    def _enfileirar(self, alerta):
+        with self._lock:
+            self._timers.pop(alerta.paciente, None)
+        try:
+            self._fila.submit(self._enviar, alerta, on_failure=self._falhou(alerta))
+        except QueueFullError:
+            with self._lock:
+                self._pendentes.pop(alerta.paciente, None)
+                self.contadores["dropped"] += 1
+            print(f"❌ Fila de SMS cheia: alerta de {alerta.paciente} descartado.")
+
+    # --- ENVIO (threads da fila) ---
+    def _enviar(self, alerta):
+        with self._lock:
+            # A partir daqui novos alertas do paciente abrem outro resumo (sujeito ao cooldown)
+            if self._pendentes.get(alerta.paciente) is alerta:
+                del self._pendentes[alerta.paciente]
+
+        telefone = self.registry.telefone(alerta.paciente)
+        if not telefone:
+            with self._lock:
+                self.contadores["no_phone"] += 1
+            print(f"❌ Erro SMS: Paciente '{alerta.paciente}' sem telefone no cadastro de pacientes")
+            return None
+
+        print(f"📧 Tentando enviar SMS para {alerta.paciente}...")
+        inicio = time.perf_counter()
+        with span("sms_send"):
+            sid = self.provider.enviar(telefone, alerta.mensagem())  # Se falhar, a fila tenta de novo
+        with self._lock:
+            # O cooldown só começa com um SMS entregue: sem telefone ou falha não atrasam o próximo alerta
+            self._ultimo_envio[alerta.paciente] = time.monotonic()
+            self._latencias.append(time.perf_counter() - inicio)
+            self.contadores["sent"] += 1
+        print(f"✅ SMS enviado com sucesso! ID: {sid}")
+        return sid
+
+    def _falhou(self, alerta):
+        def on_failure(e):
+            with self._lock:
+                self.contadores["failed"] += 1
+            print(f"❌ FALHA NO ENVIO DO SMS para {alerta.paciente} (Mas o sistema continua rodando): {e}")
+        return on_failure
+
+    # --- MÉTRICAS ---
+    def stats(self):
+        with self._lock:
+            latencias = np.array(self._latencias) * 1000
+            return {
+                **self.contadores,
+                "queue_depth": self._fila.pending,
+                "waiting_cooldown": len(self._timers),
+                "latency_ms": {
+                    "p50": round(float(np.percentile(latencias, 50)), 1) if len(latencias) else None,
+                    "p95": round(float(np.percentile(latencias, 95)), 1) if len(latencias) else None,
+                    "max": round(float(latencias.max()), 1) if len(latencias) else None,
+                },
+            }
+
+    def shutdown(self):
+        with self._lock:
+            timers = list(self._timers.values())
+        for timer in timers:
+            timer.cancel()
+        self._fila.shutdown(wait=True)
@@ -1,80 +1,184 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from contextlib import asynccontextmanager
+from pydantic import BaseModel, ValidationError
+import asyncio
+import hashlib
+import json
 from datetime import datetime
 import pandas as pd
+import numpy as np
 import os
+import threading
+import time
 from rag_engine import MedicalAssistant
+from history_store import HistoryStore
+from patient_registry import PatientRegistry
+from last_event_cache import LastEventCache
+from event_broker import EventBroker, TODOS
+from work_queue import WorkQueue
+from beat_classifier import BeatClassifierService, MODELO_PADRAO
+import ecg_segmentation
+from vitals import VitalSigns, classificar_ritmo
+from waveform_store import WaveformStore, ESCALA_PADRAO, CorpoGrandeError, descomprimir, decodificar_amostras
+from metrics import metricas, span, contar, ProfilerAmostral
+import wire_format
+from wire_format import FormatoNaoSuportadoError
 
-# Tenta importar o Twilio, se não tiver instalado, não quebra
-try:
-    from twilio.rest import Client
-    TWILIO_INSTALLED = True
-except ImportError:
-    TWILIO_INSTALLED = False
-    print("Aviso: Biblioteca Twilio não instalada via pip.")
+from alert_dispatcher import AlertDispatcher, TwilioProvider, FakeSmsProvider, TWILIO_INSTALLED
+from rule_engine import RuleEngine
 
-app = FastAPI()
-assistant = MedicalAssistant()
+history = HistoryStore()
+patients = PatientRegistry()
+last_events = LastEventCache(history)  # Último evento de cada paciente (para o /latest_status/{patient_id})
+LONG_POLL_MAX = 30  # Segundos máximos de espera do ?wait= no /latest_status/{patient_id}
+SSE_HEARTBEAT = 15  # Segundos entre comentários de keep-alive no SSE
+broker = EventBroker()  # Push em tempo real (WebSocket/SSE) por paciente
 
-HISTORY_FILE = "historico_pacientes.csv"
-PATIENTS_FILE = "cadastro_pacientes.csv"
+# --- MODELO DO RAG (carregado em segundo plano no startup) ---
+# O import do api.py fica leve: /health responde na hora e /ready só fica OK
+# quando o modelo de embeddings e o índice FAISS estiverem carregados.
+MODEL_WAIT_TIMEOUT = 120  # Segundos que uma tarefa da fila espera o modelo ficar pronto
+assistant = None
+assistant_erro = None  # Mensagem da falha no carregamento (o /ready responde "failed")
+assistant_pronto = threading.Event()
+carga_terminou = threading.Event()  # Setado com sucesso ou falha: ninguém espera o timeout à toa
+
+def carregar_assistente():
+    global assistant, assistant_erro
+    try:
+        assistant = MedicalAssistant()
+        assistant_pronto.set()
+    except Exception as e:
+        assistant_erro = str(e) or type(e).__name__
+        print(f"❌ Falha ao carregar o RAG: {e}")
+    finally:
+        carga_terminou.set()
+
+def obter_assistente():
+    if not carga_terminou.wait(MODEL_WAIT_TIMEOUT):
+        raise RuntimeError("Modelo do RAG ainda carregando")
+    if assistant_erro is not None:
+        raise RuntimeError(f"Modelo do RAG não carregou: {assistant_erro}")
+    return assistant
+
+@asynccontextmanager
+async def lifespan(app):
+    threading.Thread(target=carregar_assistente, name="heartguard-carga-rag", daemon=True).start()
+    last_events.iniciar(asyncio.get_running_loop())
+    broker.iniciar(asyncio.get_running_loop())
+    yield
+    work_queue.shutdown(wait=True)
+    alerts.shutdown()
+    classifier.shutdown()
+    if assistant is not None:
+        assistant.salvar_cache()
+
+app = FastAPI(lifespan=lifespan)
+
+# --- MÉTRICAS (texto do Prometheus em /metrics) ---
+# Latência por rota (rota do FastAPI, não a URL: /latest_status/{patient_id} é uma série só)
+# e, se HEARTGUARD_PROFILER_TAXA > 0, cProfile de uma fração das requisições.
+profiler = ProfilerAmostral()
+metricas.descrever("heartguard_http_request_seconds", "histogram", "Latência das requisições HTTP por rota.")
+metricas.descrever("heartguard_events_total", "counter", "Eventos gravados por classe de ritmo (AAMI).")
+
+@app.middleware("http")
+async def medir_requisicao(request: Request, call_next):
+    # O header força o perfil desta requisição (só com o profiler ligado)
+    perfil = profiler.iniciar(forcar=profiler.taxa > 0 and request.headers.get("x-heartguard-profile") == "1")
+    inicio = time.perf_counter()
+    status = 500
+    try:
+        resposta = await call_next(request)
+        status = resposta.status_code
+        return resposta
+    finally:
+        rota = request.scope.get("route")
+        rota = rota.path if rota is not None else "desconhecida"
+        metricas.observar("heartguard_http_request_seconds", time.perf_counter() - inicio,
+                          method=request.method, route=rota, status=status)
+        if perfil is not None:
+            profiler.terminar(perfil, request.method, rota, status)
+
+# Fila de trabalho para RAG e SMS (fora do caminho da requisição)
+WORKERS = 4
+MAX_PENDING = 200
+work_queue = WorkQueue(max_workers=WORKERS, max_pending=MAX_PENDING)
+
+MAX_BATCH = 1000  # Máximo de eventos por chamada do /analyze_batch
+
+# Corpo máximo (comprimido e descomprimido) do /analyze e do /analyze_batch
+MAX_VITALS_BYTES = 64 * 1024
+MAX_BATCH_BYTES = 8 * 1024 * 1024
+
+# Classificação de batimentos no servidor (mesmos modelos TFLite do relógio)
+classifier = BeatClassifierService()
+MAX_ECG_SECONDS = 600  # Máximo de sinal por chamada do /classify
+
+# "Caixa Preta": ECG bruto de cada evento (int16 em arquivos memmap por paciente)
+waveforms = WaveformStore()
+MAX_WAVEFORM_BYTES = 4 * 1024 * 1024  # Corpo comprimido (e descomprimido) máximo por upload
+
+ANALISE_PENDENTE_MSG = "Análise em processamento. Consulte /report/{event_id}."
+ANALISE_ERRO_MSG = "Erro na IA. Consulte médico imediatamente."
 
 # --- CONFIG TWILIO (SE NÃO TIVER CONTA, DEIXE ASSIM) ---
 TWILIO_SID = "SEU_SID_AQUI" 
 TWILIO_TOKEN = "SEU_TOKEN_AQUI"
 TWILIO_PHONE = "SEU_NUMERO_TWILIO" 
 
-# Modelo de dados
-class VitalSigns(BaseModel):
-    patient_name: str
-    ecg_status: str
-    bp_value: str
-    spo2_value: str
-    location_type: str
-    timestamp: str
-
-# Função de SMS Blindada (Não trava o app se falhar)
-def enviar_sms_dinamico(nome_paciente, status, link):
-    print(f"📧 Tentando enviar SMS para {nome_paciente}...")
-    
+# --- ALERTAS POR SMS (fila própria, cooldown por paciente e cliente Twilio reaproveitado) ---
+def criar_provedor_sms():
+    if os.environ.get("HEARTGUARD_SMS_PROVIDER") == "fake":
+        return FakeSmsProvider()
     if not TWILIO_INSTALLED:
-        print("❌ Erro SMS: Biblioteca Twilio não instalada.")
-        return
-
+        print("Aviso: Biblioteca Twilio não instalada via pip.")
+        return None
     if "SEU_SID" in TWILIO_SID: # Verifica se configurou as chaves
-        print("⚠️ Aviso SMS: Credenciais do Twilio não configuradas no api.py. Pulei o envio.")
-        return
+        print("⚠️ Aviso SMS: Credenciais do Twilio não configuradas no api.py. SMS desativado.")
+        return None
+    return TwilioProvider(TWILIO_SID, TWILIO_TOKEN, TWILIO_PHONE)
 
-    try:
-        if os.path.exists(PATIENTS_FILE):
-            df_pacientes = pd.read_csv(PATIENTS_FILE)
-            paciente = df_pacientes[df_pacientes["Nome"] == nome_paciente]
-            
-            if not paciente.empty:
-                telefone_destino = str(paciente.iloc[0]["Telefone_Emergencia"])
-                
-                client = Client(TWILIO_SID, TWILIO_TOKEN)
-                msg = f"🚨 ALERTA HEARTGUARD: {nome_paciente} apresenta {status}. Acompanhe: {link}"
-                
-                message = client.messages.create(body=msg, from_=TWILIO_PHONE, to=telefone_destino)
-                print(f"✅ SMS enviado com sucesso! ID: {message.sid}")
-            else:
-                print(f"❌ Erro SMS: Paciente '{nome_paciente}' não encontrado no cadastro_pacientes.csv")
-        else:
-            print("❌ Erro SMS: Arquivo cadastro_pacientes.csv ainda não existe.")
-            
-    except Exception as e:
-        # AQUI ESTÁ A PROTEÇÃO: Se der erro, só imprime e continua a vida
-        print(f"❌ FALHA NO ENVIO DO SMS (Mas o sistema continua rodando): {e}")
+alerts = AlertDispatcher(criar_provedor_sms(), patients)
 
-# Inicializa CSV
-# ... (Mantenha os imports anteriores)
+# Regras dos sinais vitais contra os alvos do cadastro (estado por paciente em memória;
+# o arquivo HEARTGUARD_REGRAS é recarregado quando muda). Ver rule_engine.py.
+rules = RuleEngine(patients)
+ALERT_LINK = "https://hospital-dashboard.com"  # Link fictício para demonstração se não tiver ngrok configurado
 
-# 1. ATUALIZE O ARQUIVO DE PACIENTES PARA TER MAIS COLUNAS
-if not os.path.exists(PATIENTS_FILE):
-    # Criamos com colunas extras para os limites e remédios
-    df = pd.DataFrame(columns=["Nome", "Telefone", "Target_Sys", "Target_Dia", "Target_SpO2", "Medicacao"])
-    df.to_csv(PATIENTS_FILE, index=False)
+def alertar_regras(data, evento_id):
+    """Avalia as regras com o evento novo e manda os disparos para o SMS e para o push."""
+    for disparo in rules.avaliar(data):
+        print(f"📏 Regra {disparo.regra} ({disparo.severidade}): {disparo.paciente} | {disparo.mensagem}")
+        alerts.alertar(disparo.paciente, disparo.mensagem, ALERT_LINK)
+        broker.publicar(disparo.paciente, "rule_alert", {
+            "event_id": evento_id,
+            "patient": disparo.paciente,
+            "rule": disparo.regra,
+            "severity": disparo.severidade,
+            "message": disparo.mensagem,
+            "alert": True,
+        })
+
+@metricas.coletor
+def metricas_filas():
+    sms = alerts.stats()
+    series = [
+        ("heartguard_work_queue_pending", "gauge", "Tarefas do RAG na fila (inclui vagas reservadas).",
+         [({}, work_queue.pending)]),
+        ("heartguard_alerts_total", "counter", "Alertas de SMS por resultado.",
+         [({"resultado": r}, sms[r]) for r in ("alerts", "sent", "failed", "coalesced", "deferred", "no_phone", "dropped")]),
+        ("heartguard_sms_queue_depth", "gauge", "SMS na fila de envio.", [({}, sms["queue_depth"])]),
+    ]
+    if assistant_pronto.is_set():
+        caches = assistant.cache_stats()
+        for resultado in ("hits", "misses"):
+            series.append((f"heartguard_rag_cache_{resultado}_total", "counter", f"Cache do RAG: {resultado}.",
+                           [({"cache": nome}, c[resultado]) for nome, c in caches.items()]))
+    return series
 
 # 2. MODELO DE DADOS PARA CADASTRO (Novo)
 class PatientConfig(BaseModel):
@@ -90,89 +194,522 @@ class PatientConfig(BaseModel):
 async def register_patient(config: PatientConfig):
     print(f"📝 Cadastrando: {config.name} | Med: {config.medication}")
     try:
-        df = pd.read_csv(PATIENTS_FILE)
-        # Remove se já existir (atualização)
-        df = df[df["Nome"] != config.name]
-        
-        novo_paciente = {
-            "Nome": config.name,
-            "Telefone": config.phone,
-            "Target_Sys": config.target_sys,
-            "Target_Dia": config.target_dia,
-            "Target_SpO2": config.target_spo2,
-            "Medicacao": config.medication
-        }
-        
-        df = pd.concat([df, pd.DataFrame([novo_paciente])], ignore_index=True)
-        df.to_csv(PATIENTS_FILE, index=False)
-        return {"status": "success", "message": "Paciente cadastrado com sucesso!"}
+        # Atualiza se já existir (mesmo nome)
+        paciente = patients.upsert(
+            config.name,
+            telefone=config.phone,
+            target_sys=config.target_sys,
+            target_dia=config.target_dia,
+            target_spo2=config.target_spo2,
+            medicacao=config.medication
+        )
+        return {"status": "success", "message": "Paciente cadastrado com sucesso!", "patient_id": paciente["id"]}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 # 4. ROTA DE LEITURA (Atualize a 'get_latest_status' para retornar a medicação também!)
 @app.get("/latest_status")
 async def get_latest_status():
-    # ... (código igual ao anterior, mas vamos tentar pegar o nome do remédio do CSV)
+    # ... (código igual ao anterior, mas vamos tentar pegar o nome do remédio do cadastro)
     try:
-        if os.path.exists(HISTORY_FILE):
-            df_hist = pd.read_csv(HISTORY_FILE)
-            if not df_hist.empty:
-                ultimo = df_hist.iloc[-1].to_dict()
-                
-                # Tenta achar o remédio desse paciente no outro arquivo
-                medication = "o medicamento prescrito" # Padrão
-                if os.path.exists(PATIENTS_FILE):
-                    df_pat = pd.read_csv(PATIENTS_FILE)
-                    patient_row = df_pat[df_pat["Nome"] == ultimo["Paciente"]]
-                    if not patient_row.empty:
-                        medication = str(patient_row.iloc[0]["Medicacao"])
-
-                response = {k: (v if pd.notna(v) else "") for k, v in ultimo.items()}
-                response["Medicacao_Cadastrada"] = medication # Adiciona no retorno
-                return response
+        ultimo = history.latest()
+        if ultimo is not None:
+            ultimo.pop("id", None)
+
+            # Remédio cadastrado para esse paciente (busca O(1) no cadastro em memória)
+            medication = patients.medicacao(ultimo["Paciente"]) or "o medicamento prescrito" # Padrão
+
+            response = {k: (v if pd.notna(v) else "") for k, v in ultimo.items()}
+            response["Medicacao_Cadastrada"] = medication # Adiciona no retorno
+            return response
     except Exception as e:
         print(f"Erro: {e}")
     # ... (retorno de erro igual antes)
+
+# 5. STATUS POR PACIENTE (cache em memória + ETag + long-poll/SSE)
+#    O /latest_status acima devolve o último evento de QUALQUER paciente;
+#    o app da família deve usar este, com o id do cadastro ou o nome do paciente.
+def resolver_paciente(patient_id):
+    if patient_id.isdigit():
+        registro = patients.get_by_id(int(patient_id))
+        if registro is None:
+            raise HTTPException(status_code=404, detail="Paciente não cadastrado.")
+        return registro["Nome"]
+    return patient_id
+
+def status_com_medicacao(nome, etag, evento):
+    medication = patients.medicacao(nome) or "o medicamento prescrito"
+    resposta = dict(evento, Medicacao_Cadastrada=medication)
+    return f'"{etag}-{hashlib.sha1(medication.encode("utf-8")).hexdigest()[:8]}"', resposta
+
+@app.get("/latest_status/{patient_id}")
+async def get_patient_latest_status(patient_id: str, request: Request, wait: float = 0):
+    nome = resolver_paciente(patient_id)
+    etag, evento = last_events.get(nome)
+    if evento is None and wait <= 0:
+        raise HTTPException(status_code=404, detail="Nenhum evento para este paciente.")
+
+    # Long-poll: se o cliente já tem a versão atual, segura a resposta até mudar (ou até `wait` s)
+    if_none_match = request.headers.get("if-none-match")
+    if wait > 0 and (evento is None or status_com_medicacao(nome, etag, evento)[0] == if_none_match):
+        etag, evento = await last_events.esperar(nome, etag, min(wait, LONG_POLL_MAX))
+        if evento is None:
+            raise HTTPException(status_code=404, detail="Nenhum evento para este paciente.")
+
+    etag_completa, resposta = status_com_medicacao(nome, etag, evento)
+    headers = {"ETag": etag_completa, "Cache-Control": "no-cache"}
+    if if_none_match == etag_completa:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=resposta, headers=headers)
+
+@app.get("/latest_status/{patient_id}/stream")
+async def stream_patient_status(patient_id: str, request: Request):
+    """Server-Sent Events: envia o status atual e depois cada mudança do paciente."""
+    nome = resolver_paciente(patient_id)
+
+    async def eventos():
+        etag = None
+        while not await request.is_disconnected():
+            novo_etag, evento = await last_events.esperar(nome, etag, SSE_HEARTBEAT)
+            if evento is None or novo_etag == etag:
+                yield ": keep-alive\n\n"
+                continue
+            etag = novo_etag
+            etag_completa, resposta = status_com_medicacao(nome, etag, evento)
+            yield f"id: {etag_completa}\nevent: status\ndata: {json.dumps(resposta, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(eventos(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- NOTIFICAÇÕES (cache do /latest_status + push WebSocket/SSE) ---
+def notificar_evento(evento_id, evento):
+    last_events.publicar(evento_id, evento)
+    broker.publicar(evento["Paciente"], "event", {
+        "event_id": evento_id,
+        "patient": evento["Paciente"],
+        "alert": classificar_ritmo(evento.get("Ritmo") or evento["ECG"]).perigo,
+        "data": {k: v for k, v in evento.items() if k != "Timestamp_Dispositivo"}
+    })
+
+def notificar_analise(evento_id, paciente, analise):
+    # Chamada pelas threads da fila de trabalho (o cache e o broker são thread-safe)
+    last_events.analise_pronta(evento_id, paciente, analise)
+    broker.publicar(paciente, "analysis", {"event_id": evento_id, "patient": paciente, "medical_advice": analise})
+
+# Tarefas da fila de trabalho
+def gerar_relatorio(evento_id, data):
+    with span("rag_advice"):
+        analise_medica = obter_assistente().get_advice(*data.consulta_rag())
+    history.update_analysis(evento_id, analise_medica)
+    notificar_analise(evento_id, data.patient_name, analise_medica)
+
+def relatorio_falhou(evento_id, paciente):
+    def on_failure(e):
+        print(f"Erro no RAG (evento {evento_id}): {e}")
+        history.update_analysis(evento_id, ANALISE_ERRO_MSG)
+        notificar_analise(evento_id, paciente, ANALISE_ERRO_MSG)
+    return on_failure
+
+# --- LEITURA DO CORPO (JSON, msgpack ou binário; gzip/zstd) ---
+async def ler_corpo(request: Request, limite):
+    """Corpo descomprimido conforme o Content-Encoding, com limite de tamanho."""
+    corpo = await request.body()
+    if len(corpo) > limite:
+        raise HTTPException(status_code=413, detail=f"Máximo de {limite} bytes por corpo.")
+    try:
+        # Descompressão com teto (um corpo pequeno não infla para GBs) e fora do event loop
+        return await run_in_threadpool(descomprimir, corpo, request.headers.get("content-encoding"), limite)
+    except CorpoGrandeError:
+        raise HTTPException(status_code=413, detail=f"Máximo de {limite} bytes por corpo.")
+    except (ValueError, OSError, EOFError) as e:
+        raise HTTPException(status_code=400, detail=f"Corpo inválido: {e}")
+
+async def ler_sinais(request: Request):
+    """VitalSigns do corpo, no formato do Content-Type (ver wire_format.py). JSON é o padrão."""
+    dados = await ler_corpo(request, MAX_VITALS_BYTES)
+    try:
+        return wire_format.ler_evento(dados, request.headers.get("content-type"))
+    except ValidationError as e:
+        # Mesmo 422 que o FastAPI devolvia quando validava o JSON sozinho
+        raise RequestValidationError([dict(erro, loc=("body", *erro["loc"])) for erro in e.errors(include_url=False)])
+    except FormatoNaoSuportadoError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Corpo inválido: {e}")
+
 @app.post("/analyze")
-async def analyze_vitals(data: VitalSigns):
+async def analyze_vitals(request: Request):
+    data = await ler_sinais(request)
     print(f"📲 Recebido: {data.ecg_status} | Paciente: {data.patient_name}")
-    
-    # 1. RAG
+
+    perigo = data.rhythm.perigo
+
+    # 0. Backpressure: reserva a vaga do RAG na fila (o SMS tem fila própria).
+    #    Se a fila estiver cheia, o relógio tenta de novo depois.
+    if not work_queue.reservar():
+        raise HTTPException(status_code=503, detail="Servidor ocupado. Tente novamente.", headers={"Retry-After": "5"})
+
+    # 1. Salvar Histórico (a análise da IA é preenchida depois pela fila)
     try:
-        analise_medica = assistant.get_advice(
-            data.ecg_status, data.bp_value, data.spo2_value, data.location_type
-        )
+        novo_evento = data.evento(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        evento_id = history.append(novo_evento)
+        with span("notify"):
+            notificar_evento(evento_id, novo_evento)
+        contar("heartguard_events_total", ritmo=data.rhythm.value)
     except Exception as e:
-        analise_medica = "Erro na IA. Consulte médico imediatamente."
-        print(f"Erro no RAG: {e}")
-    
-    # 2. Salvar Histórico
+        work_queue.liberar()
+        print(f"Erro ao salvar histórico: {e}")
+        return {"status": "error", "message": str(e)}
+
+    # 2. RAG em segundo plano (usa a vaga reservada acima)
+    work_queue.submit(gerar_relatorio, evento_id, data, on_failure=relatorio_falhou(evento_id, data.patient_name), reservado=True)
+
+    # 3. Tentar Enviar SMS (Se for perigo ou se alguma regra dos sinais vitais disparar).
+    #    Alertas repetidos viram um SMS de resumo.
+    with span("sms_enqueue"):
+        if perigo:
+            alerts.alertar(data.patient_name, data.ecg_status, ALERT_LINK)
+        alertar_regras(data, evento_id)
+
+    return {
+        "status": "received",
+        "event_id": evento_id,
+        "medical_advice": ANALISE_PENDENTE_MSG.format(event_id=evento_id)
+    }
+
+# --- INGESTÃO EM LOTE (relógio que volta a ficar online) ---
+def gerar_relatorios_lote(eventos_ids, datas):
+    # Uma chamada de embedding + uma busca FAISS para o lote todo
+    with span("rag_advice_batch"):
+        analises = obter_assistente().get_advice_batch(
+            [d.consulta_rag() for d in datas]
+        )
+    for evento_id, data, analise_medica in zip(eventos_ids, datas, analises):
+        history.update_analysis(evento_id, analise_medica)
+        notificar_analise(evento_id, data.patient_name, analise_medica)
+
+def relatorios_lote_falharam(eventos_ids, datas):
+    def on_failure(e):
+        print(f"Erro no RAG em lote ({len(eventos_ids)} eventos): {e}")
+        for evento_id, data in zip(eventos_ids, datas):
+            history.update_analysis(evento_id, ANALISE_ERRO_MSG)
+            notificar_analise(evento_id, data.patient_name, ANALISE_ERRO_MSG)
+    return on_failure
+
+async def ler_lote(request: Request):
+    """Lê o corpo como array JSON, NDJSON (um evento por linha), msgpack ou binário (wire_format.py)."""
+    dados = await ler_corpo(request, MAX_BATCH_BYTES)
     try:
-        novo_evento = {
-            "Data": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "Paciente": data.patient_name,
-            "ECG": data.ecg_status,
-            "PA": data.bp_value,
-            "SpO2": data.spo2_value,
-            "Local": data.location_type,
-            "Analise_IA": analise_medica
-        }
-        df = pd.read_csv(HISTORY_FILE)
-        df = pd.concat([df, pd.DataFrame([novo_evento])], ignore_index=True)
-        df.to_csv(HISTORY_FILE, index=False)
+        return wire_format.ler_lote(dados, request.headers.get("content-type"))
+    except FormatoNaoSuportadoError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Corpo inválido: {e}")
+
+@app.post("/analyze_batch")
+async def analyze_batch(request: Request):
+    itens = await ler_lote(request)
+    if len(itens) > MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"Máximo de {MAX_BATCH} eventos por lote.")
+    print(f"📦 Lote recebido: {len(itens)} eventos")
+
+    # 1. Valida cada evento e remove duplicados dentro do próprio lote
+    resultados = [None] * len(itens)
+    validos = []  # (posição no lote, VitalSigns)
+    vistos = set()
+    for pos, item in enumerate(itens):
+        try:
+            data = VitalSigns.model_validate(item)
+        except ValidationError as e:
+            resultados[pos] = {"index": pos, "status": "invalid", "errors": e.errors(include_url=False)}
+            continue
+        chave = (data.patient_name, data.timestamp)
+        if chave in vistos:
+            resultados[pos] = {"index": pos, "status": "duplicate"}
+            continue
+        vistos.add(chave)
+        validos.append((pos, data))
+
+    # 2. Backpressure: 1 vaga para o RAG do lote (o SMS tem fila própria)
+    if validos and not work_queue.reservar():
+        raise HTTPException(status_code=503, detail="Servidor ocupado. Tente novamente.", headers={"Retry-After": "5"})
+
+    # 3. Grava tudo numa transação (duplicados já gravados antes são ignorados)
+    agora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    eventos = [data.evento(agora) for _, data in validos]
+    try:
+        ids = history.append_many(eventos)
     except Exception as e:
-        print(f"Erro ao salvar CSV: {e}")
-    
-    # 3. Tentar Enviar SMS (Se for perigo)
-    if "PERIGO" in data.ecg_status or "VENTRICULAR" in data.ecg_status:
-        # Link fictício para demonstração se não tiver ngrok configurado
-        link = "https://hospital-dashboard.com" 
-        enviar_sms_dinamico(data.patient_name, data.ecg_status, link)
-    
+        if validos:
+            work_queue.liberar()
+        print(f"Erro ao salvar lote: {e}")
+        raise HTTPException(status_code=500, detail=f"Erro ao salvar lote: {e}")
+
+    novos_ids, novos_dados = [], []
+    for (pos, data), evento, evento_id in zip(validos, eventos, ids):
+        if evento_id is None:
+            resultados[pos] = {"index": pos, "status": "duplicate"}
+        else:
+            resultados[pos] = {"index": pos, "status": "received", "event_id": evento_id}
+            novos_ids.append(evento_id)
+            novos_dados.append(data)
+            notificar_evento(evento_id, evento)
+            contar("heartguard_events_total", ritmo=data.rhythm.value)
+
+    # 4. RAG do lote em segundo plano
+    if novos_ids:
+        work_queue.submit(gerar_relatorios_lote, novos_ids, novos_dados,
+                          on_failure=relatorios_lote_falharam(novos_ids, novos_dados), reservado=True)
+    elif validos:
+        work_queue.liberar()
+
+    # 5. Alerta dos eventos de perigo novos e das regras, na ordem do lote
+    #    (o dispatcher junta os do mesmo paciente num SMS)
+    for evento_id, d in zip(novos_ids, novos_dados):
+        if d.rhythm.perigo:
+            alerts.alertar(d.patient_name, d.ecg_status, ALERT_LINK)
+        alertar_regras(d, evento_id)
+
     return {
         "status": "received",
-        "medical_advice": analise_medica
+        "received": len(novos_ids),
+        "duplicates": sum(1 for r in resultados if r["status"] == "duplicate"),
+        "invalid": sum(1 for r in resultados if r["status"] == "invalid"),
+        "results": resultados
+    }
+
+# --- CLASSIFICAÇÃO DE BATIMENTOS (TFLite no servidor) ---
+class ECGSamples(BaseModel):
+    samples: list[float]
+    fs: int = ecg_segmentation.FS
+    model: str = MODELO_PADRAO
+    patient_name: str | None = None
+
+def segmentar_batimentos(amostras, fs):
+    """Janelas de batimento do sinal bruto (mesma normalização do treino) e os picos R."""
+    sinal = ecg_segmentation.reamostrar(amostras, fs)
+    picos = ecg_segmentation.detectar_picos_r(sinal)
+    return ecg_segmentation.extrair_janelas(ecg_segmentation.normalizar_registro(sinal), picos)
+
+@app.post("/classify")
+async def classify_beats(data: ECGSamples):
+    if data.model not in classifier.disponiveis():
+        raise HTTPException(status_code=404, detail=f"Modelo '{data.model}' não encontrado. Disponíveis: {classifier.disponiveis()}")
+    if data.fs <= 0 or len(data.samples) > MAX_ECG_SECONDS * data.fs:
+        raise HTTPException(status_code=413, detail=f"Máximo de {MAX_ECG_SECONDS}s de sinal por chamada.")
+
+    # 1. Segmenta o sinal bruto em janelas de batimento (numa thread: até 600 s de sinal travariam o loop)
+    janelas, picos = await run_in_threadpool(segmentar_batimentos, data.samples, data.fs)
+
+    # 2. Classifica (em micro-lotes junto com as outras requisições simultâneas)
+    probs = await classifier.classificar(janelas, data.model)
+    classes = classifier.classes(data.model)
+    indices = probs.argmax(axis=1) if len(probs) else np.zeros(0, dtype=int)
+
+    batimentos = [
+        {
+            "sample": int(round(pico * data.fs / ecg_segmentation.FS)),
+            "class": classes[idx],
+            "probabilities": {c: round(float(p), 4) for c, p in zip(classes, linha)},
+        }
+        for pico, idx, linha in zip(picos, indices, probs)
+    ]
+    return {
+        "model": data.model,
+        "classes": classes,
+        "beats_detected": len(batimentos),
+        "summary": {c: int((indices == i).sum()) for i, c in enumerate(classes)},
+        "beats": batimentos
+    }
+
+# --- CAIXA PRETA: ECG BRUTO DO EVENTO ---
+# O relógio envia o trecho antes/depois do evento como binário (int16 ou delta),
+# opcionalmente com Content-Encoding gzip/zstd.
+@app.post("/waveform/{event_id}")
+async def upload_waveform(event_id: int, request: Request, fs: float = ecg_segmentation.FS,
+                          pre_event: int | None = None, encoding: str = "int16", scale: float = ESCALA_PADRAO):
+    evento = history.get(event_id)
+    if evento is None:
+        raise HTTPException(status_code=404, detail="Evento não encontrado.")
+    corpo = await request.body()
+    if len(corpo) > MAX_WAVEFORM_BYTES:
+        raise HTTPException(status_code=413, detail=f"Máximo de {MAX_WAVEFORM_BYTES} bytes por onda.")
+    try:
+        # Descompressão com teto e fora do event loop (ver ler_corpo)
+        dados = await run_in_threadpool(descomprimir, corpo, request.headers.get("content-encoding"),
+                                        MAX_WAVEFORM_BYTES)
+        amostras = decodificar_amostras(dados, encoding)
+    except CorpoGrandeError:
+        raise HTTPException(status_code=413, detail=f"Máximo de {MAX_WAVEFORM_BYTES} bytes por onda.")
+    except (ValueError, OSError, EOFError) as e:
+        raise HTTPException(status_code=400, detail=f"Onda inválida: {e}")
+    if fs <= 0 or scale <= 0 or len(amostras) > MAX_ECG_SECONDS * fs:
+        raise HTTPException(status_code=400, detail=f"fs/scale inválidos ou mais de {MAX_ECG_SECONDS}s de sinal.")
+    if pre_event is not None and not 0 <= pre_event <= len(amostras):
+        raise HTTPException(status_code=400, detail="pre_event fora do sinal.")
+
+    gravou = waveforms.append(event_id, evento["Paciente"], amostras, fs, pre_event, scale)
+    print(f"💾 Onda do evento {event_id}: {len(amostras)} amostras ({len(corpo)} bytes recebidos)")
+    return {"event_id": event_id, "status": "received" if gravou else "duplicate", "samples": len(amostras)}
+
+@app.get("/waveform/{event_id}")
+async def get_waveform(event_id: int, start: float | None = None, end: float | None = None, points: int = 2000):
+    """Onda em mV já decimada para a resolução da tela (start/end em segundos relativos ao evento)."""
+    trecho = waveforms.janela(event_id, start, end, min(max(points, 2), 20000))
+    if trecho is None:
+        raise HTTPException(status_code=404, detail="Evento sem onda de ECG.")
+    return {
+        "event_id": event_id,
+        "fs": trecho["fs"],
+        "total_samples": trecho["total_amostras"],
+        "decimated": trecho["decimado"],
+        "t": np.round(trecho["t"], 4).tolist(),
+        "mv": np.round(trecho["mv"], 4).tolist()
     }
+
+# --- PUSH EM TEMPO REAL (pub/sub por paciente) ---
+# /events e /ws: todos os pacientes (equipe médica). /events/{patient_id} e /ws/{patient_id}: um paciente.
+# ?alerts_only=true entrega só os eventos de perigo.
+def canais_de(patient_id):
+    return [TODOS] if patient_id is None else [resolver_paciente(patient_id)]
+
+def filtrar(mensagem, alerts_only):
+    return not alerts_only or mensagem[2]
+
+async def sse_eventos(request, canais, alerts_only):
+    assinatura = broker.assinar(canais)
+    try:
+        yield ": conectado\n\n"
+        while not await request.is_disconnected():
+            mensagem = await assinatura.proxima(SSE_HEARTBEAT)
+            if mensagem is None:
+                yield ": keep-alive\n\n"
+            elif filtrar(mensagem, alerts_only):
+                yield f"event: {mensagem[0]}\ndata: {mensagem[1]}\n\n"
+    finally:
+        broker.cancelar(assinatura)
+
+@app.get("/events")
+async def events_all(request: Request, alerts_only: bool = False):
+    return StreamingResponse(sse_eventos(request, canais_de(None), alerts_only), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/events/{patient_id}")
+async def events_patient(patient_id: str, request: Request, alerts_only: bool = False):
+    return StreamingResponse(sse_eventos(request, canais_de(patient_id), alerts_only), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def ws_eventos(websocket, patient_id, alerts_only):
+    try:
+        canais = canais_de(patient_id)
+    except HTTPException:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    assinatura = broker.assinar(canais)
+    try:
+        while True:
+            mensagem = await assinatura.proxima(SSE_HEARTBEAT)
+            if mensagem is None:
+                await websocket.send_text('{"type": "ping"}')
+            elif filtrar(mensagem, alerts_only):
+                await websocket.send_text(f'{{"type": "{mensagem[0]}", "payload": {mensagem[1]}}}')
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        broker.cancelar(assinatura)
+
+@app.websocket("/ws")
+async def ws_all(websocket: WebSocket, alerts_only: bool = False):
+    await ws_eventos(websocket, None, alerts_only)
+
+@app.websocket("/ws/{patient_id}")
+async def ws_patient(websocket: WebSocket, patient_id: str, alerts_only: bool = False):
+    await ws_eventos(websocket, patient_id, alerts_only)
+
+@app.get("/stats/push")
+async def push_stats():
+    return broker.stats()
+
+# Relatório da IA de um evento (o relógio ou um cliente consulta depois)
+@app.get("/report/{event_id}")
+async def get_report(event_id: int):
+    evento = history.get(event_id)
+    if evento is None:
+        raise HTTPException(status_code=404, detail="Evento não encontrado.")
+    analise = evento["Analise_IA"]
+    pronto = analise is not None and pd.notna(analise)
+    return {
+        "event_id": event_id,
+        "status": "done" if pronto else "processing",
+        "medical_advice": analise if pronto else None
+    }
+
+# Contadores de acerto do cache do RAG
+@app.get("/stats/rag_cache")
+async def rag_cache_stats():
+    if not assistant_pronto.is_set():
+        raise HTTPException(status_code=503, detail="Modelo do RAG ainda carregando.")
+    return assistant.cache_stats()
+
+# Latência da recuperação (densa/BM25) e recall da última avaliação (rag_eval.py)
+@app.get("/stats/rag_retrieval")
+async def rag_retrieval_stats():
+    if not assistant_pronto.is_set():
+        raise HTTPException(status_code=503, detail="Modelo do RAG ainda carregando.")
+    return assistant.retrieval_stats()
+
+# Fila e latência dos alertas por SMS
+@app.get("/stats/alerts")
+async def alert_stats():
+    return alerts.stats()
+
+# Regras dos sinais vitais: origem, disparos e pacientes acompanhados
+@app.get("/stats/rules")
+async def rule_stats():
+    return rules.stats()
+
+# Estado das regras de um paciente (EWMA, média da janela, tendência, regras ativas)
+@app.get("/rules/{patient_id}")
+async def patient_rules(patient_id: str):
+    estado = rules.estado(resolver_paciente(patient_id))
+    if estado is None:
+        raise HTTPException(status_code=404, detail="Nenhum evento deste paciente desde que a API iniciou.")
+    return estado
+
+# Métricas no formato do Prometheus (spans do caminho quente, contadores e filas)
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(metricas.exportar(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Últimos perfis (cProfile + spans) das requisições sorteadas pelo profiler
+@app.get("/metrics/profiles")
+async def metrics_profiles():
+    return {"rate": profiler.taxa, "profiles": list(profiler.perfis)}
+
+# Liga/desliga o profiler sem reiniciar: POST /metrics/profiler?rate=0.01 (0 desliga)
+@app.post("/metrics/profiler")
+async def set_profiler(rate: float):
+    if not 0 <= rate <= 1:
+        raise HTTPException(status_code=400, detail="rate deve estar entre 0 e 1.")
+    profiler.taxa = rate
+    print(f"🔬 Profiler: {rate:.0%} das requisições")
+    return {"rate": profiler.taxa}
+
+# --- SAÚDE DO PROCESSO ---
+# /health: o processo está vivo (liveness). /ready: pode receber tráfego (readiness).
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready():
+    if assistant_erro is not None:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": assistant_erro})
+    if not assistant_pronto.is_set():
+        return JSONResponse(status_code=503, content={"status": "loading"})
+    return {"status": "ready", "faiss": assistant.vector_db is not None}
+
 # ... (todo o seu código anterior continua igual) ...
 
 #
\ No newline at end of file
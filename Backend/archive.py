@@ -0,0 +1,320 @@
+"""
+Arquivo colunar (Parquet) do histórico antigo, para análises de coorte.
+
+Uso:
+    python archive.py compactar                      # move eventos com mais de 30 dias
+    python archive.py compactar --dias 7 --a-cada 24 # roda de novo a cada 24 h
+    python archive.py contar --ritmo V --por Local --inicio 2026-09-01 --fim 2026-09-30
+
+A compactação tira do heartguard.db (o banco "quente" da API) os eventos com
+análise pronta mais antigos que --dias. Eles vão para:
+
+    historico_arquivo/eventos/mes=YYYY-MM/grupo=NN/part-<primeiro id>-<último id>.parquet
+    historico_arquivo/relatorios/part-<primeiro id>-<último id>.parquet
+
+Partição por mês e por grupo de paciente (hash do nome em GRUPOS_PACIENTE grupos).
+Dentro de cada arquivo, as linhas ficam ordenadas por paciente e data.
+PA e SpO2 ficam só nas colunas numéricas, e o texto da Analise_IA (quase sempre
+repetido, vem do cache do RAG) fica uma vez só na tabela de relatórios,
+referenciado por relatorio_id. O último evento de cada paciente nunca é
+arquivado, e os rollups do dashboard continuam no banco.
+
+O EventArchive consulta com poda de partição, predicate pushdown (estatísticas
+dos row groups) e leitura só das colunas pedidas, sem tocar no banco quente.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+import zlib
+from datetime import datetime, timedelta
+import pandas as pd
+
+# Tenta importar o pyarrow; sem ele, o arquivo colunar fica desligado
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    PYARROW_INSTALLED = True
+except ImportError:
+    PYARROW_INSTALLED = False
+
+ARCHIVE_DIR = "historico_arquivo"
+EVENTOS_DIR = "eventos"
+RELATORIOS_DIR = "relatorios"
+JOURNAL_FILE = "_pendente.json"  # Arquivos escritos cujos eventos ainda não saíram do banco
+DIAS_QUENTES = int(os.getenv("HEARTGUARD_ARQUIVO_DIAS", "30"))
+GRUPOS_PACIENTE = 16
+LOTE = 100_000  # Eventos por rodada da compactação
+
+# Coluna do arquivo -> nome público (o mesmo do HistoryStore)
+_MAPA_COLUNAS = {
+    "id": "id",
+    "data": "Data",
+    "paciente": "Paciente",
+    "ecg": "ECG",
+    "local": "Local",
+    "ritmo": "Ritmo",
+    "sistolica": "PA_Sys",
+    "diastolica": "PA_Dia",
+    "spo2": "SpO2_Num",
+    "relatorio_id": "Relatorio_Id",
+}
+_COLUNAS_PUBLICAS = {v: k for k, v in _MAPA_COLUNAS.items()}
+
+if PYARROW_INSTALLED:
+    SCHEMA_EVENTOS = pa.schema([
+        ("id", pa.int64()),
+        ("data", pa.timestamp("s")),
+        ("paciente", pa.string()),
+        ("ecg", pa.string()),
+        ("local", pa.string()),
+        ("ritmo", pa.string()),
+        ("sistolica", pa.int16()),
+        ("diastolica", pa.int16()),
+        ("spo2", pa.int16()),
+        ("relatorio_id", pa.int64()),
+    ])
+    SCHEMA_RELATORIOS = pa.schema([("relatorio_id", pa.int64()), ("texto", pa.string())])
+    PARTICOES = ds.partitioning(pa.schema([("mes", pa.string()), ("grupo", pa.int8())]), flavor="hive")
+
+
+def grupo_do_paciente(paciente):
+    """Grupo (partição) do paciente: estável entre execuções, ao contrário do hash() do Python."""
+    return zlib.crc32(str(paciente).encode("utf-8")) % GRUPOS_PACIENTE
+
+
+def id_relatorio(texto):
+    return int.from_bytes(hashlib.blake2b(texto.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+def _escrever(tabela, caminho):
+    """Escreve o Parquet num .tmp e renomeia: um arquivo nunca fica pela metade."""
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    tmp = caminho + ".tmp"
+    pq.write_table(tabela, tmp, compression="zstd")
+    os.replace(tmp, caminho)
+
+
+class EventArchive:
+    def __init__(self, pasta=ARCHIVE_DIR):
+        if not PYARROW_INSTALLED:
+            raise RuntimeError("pyarrow não instalado (pip install pyarrow).")
+        self.pasta = pasta
+        self._relatorios_conhecidos = None
+
+    # --- COMPACTAÇÃO ---
+    def _journal(self):
+        return os.path.join(self.pasta, JOURNAL_FILE)
+
+    def _concluir_pendente(self, store):
+        """Termina uma compactação interrompida: apaga do banco o que já está nos arquivos."""
+        if not os.path.exists(self._journal()):
+            return 0
+        with open(self._journal(), encoding="utf-8") as f:
+            arquivos = json.load(f)["arquivos"]
+        ids = []
+        for arquivo in arquivos:
+            caminho = os.path.join(self.pasta, arquivo)
+            if os.path.exists(caminho):
+                ids.extend(pq.read_table(caminho, columns=["id"]).column("id").to_pylist())
+        store.remover(ids)
+        os.remove(self._journal())
+        print(f"♻️ Compactação anterior concluída: {len(ids)} eventos removidos do banco.")
+        return len(ids)
+
+    def _conhecidos(self):
+        if self._relatorios_conhecidos is None:
+            pasta = os.path.join(self.pasta, RELATORIOS_DIR)
+            if os.path.isdir(pasta):
+                ids = ds.dataset(pasta, format="parquet").to_table(columns=["relatorio_id"]).column("relatorio_id")
+                self._relatorios_conhecidos = set(ids.to_pylist())
+            else:
+                self._relatorios_conhecidos = set()
+        return self._relatorios_conhecidos
+
+    def _arquivar_lote(self, store, df):
+        primeiro, ultimo = int(df["id"].iloc[0]), int(df["id"].iloc[-1])
+        sufixo = f"part-{primeiro:012d}-{ultimo:012d}.parquet"
+
+        # Relatórios repetidos viram um id; só os textos novos vão para a tabela lateral
+        textos = df["Analise_IA"].astype(str)
+        unicos = {texto: id_relatorio(texto) for texto in textos.unique()}
+        conhecidos = self._conhecidos()
+        novos = {texto: rid for texto, rid in unicos.items() if rid not in conhecidos}
+
+        df = df.assign(
+            Data=pd.to_datetime(df["Data"], errors="coerce"),
+            Relatorio_Id=textos.map(unicos),
+            mes=lambda d: d["Data"].dt.strftime("%Y-%m").fillna("sem_data"),
+            grupo=df["Paciente"].map(grupo_do_paciente),
+        )
+        arquivos = {
+            os.path.join(EVENTOS_DIR, f"mes={mes}", f"grupo={grupo:02d}", sufixo): parte
+            for (mes, grupo), parte in df.groupby(["mes", "grupo"], sort=False)
+        }
+
+        # 1. Journal antes de escrever: se cair no meio, a próxima rodada termina o serviço
+        os.makedirs(self.pasta, exist_ok=True)
+        with open(self._journal() + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"arquivos": list(arquivos)}, f)
+        os.replace(self._journal() + ".tmp", self._journal())
+
+        # 2. Relatórios novos e eventos (ordenados por paciente/data: row groups com min/max estreitos)
+        if novos:
+            tabela = pa.table({"relatorio_id": list(novos.values()), "texto": list(novos)}, schema=SCHEMA_RELATORIOS)
+            _escrever(tabela, os.path.join(self.pasta, RELATORIOS_DIR, sufixo))
+            conhecidos.update(novos.values())
+        for arquivo, parte in arquivos.items():
+            parte = parte.sort_values(["Paciente", "Data", "id"])
+            colunas = {col: parte[publica] for col, publica in _MAPA_COLUNAS.items()}
+            tabela = pa.Table.from_pandas(pd.DataFrame(colunas), schema=SCHEMA_EVENTOS, preserve_index=False)
+            _escrever(tabela, os.path.join(self.pasta, arquivo))
+
+        # 3. Só agora sai do banco quente
+        store.remover(df["id"])
+        os.remove(self._journal())
+        return len(df), len(novos)
+
+    def compactar(self, store, dias=DIAS_QUENTES, lote=LOTE):
+        """Move para o arquivo os eventos com mais de `dias` dias. Devolve quantos foram movidos."""
+        inicio = time.perf_counter()
+        self._concluir_pendente(store)
+        corte = (datetime.now() - timedelta(days=dias)).strftime("%Y-%m-%d %H:%M:%S")
+        movidos, relatorios, depois_id = 0, 0, 0
+        while True:
+            df = store.antigos(corte, depois_id, limit=lote)
+            if df.empty:
+                break
+            n, novos = self._arquivar_lote(store, df)
+            movidos += n
+            relatorios += novos
+            depois_id = int(df["id"].iloc[-1])
+            print(f"📦 {movidos} eventos arquivados...")
+        print(f"✅ Compactação: {movidos} eventos anteriores a {corte} arquivados "
+              f"({relatorios} relatórios novos) em {time.perf_counter() - inicio:.1f}s")
+        return movidos
+
+    # --- CONSULTAS ---
+    def _dataset(self):
+        pasta = os.path.join(self.pasta, EVENTOS_DIR)
+        if not os.path.isdir(pasta):
+            return None
+        return ds.dataset(pasta, format="parquet", partitioning=PARTICOES, schema=SCHEMA_EVENTOS.append(
+            pa.field("mes", pa.string())).append(pa.field("grupo", pa.int8())))
+
+    @staticmethod
+    def _filtro(paciente=None, inicio=None, fim=None, ritmo=None, local=None):
+        """
+        Expressão do pyarrow: mes/grupo podam pastas inteiras; o resto vai para as
+        estatísticas dos row groups (predicate pushdown) e só depois para as linhas.
+        """
+        filtros = []
+        if paciente is not None:
+            pacientes = [paciente] if isinstance(paciente, str) else list(paciente)
+            filtros.append(ds.field("grupo").isin([grupo_do_paciente(p) for p in pacientes]))
+            filtros.append(ds.field("paciente").isin(pacientes))
+        if inicio is not None:
+            inicio = pd.Timestamp(inicio)
+            filtros.append(ds.field("mes") >= inicio.strftime("%Y-%m"))
+            filtros.append(ds.field("data") >= pa.scalar(inicio.to_pydatetime(), pa.timestamp("s")))
+        if fim is not None:
+            fim = pd.Timestamp(fim)
+            if fim == fim.normalize():
+                fim += pd.Timedelta(days=1) - pd.Timedelta(seconds=1)  # "2026-09-30" inclui o dia todo
+            filtros.append(ds.field("mes") <= fim.strftime("%Y-%m"))
+            filtros.append(ds.field("data") <= pa.scalar(fim.to_pydatetime(), pa.timestamp("s")))
+        for campo, valor in (("ritmo", ritmo), ("local", local)):
+            if valor is not None:
+                filtros.append(ds.field(campo).isin([valor] if isinstance(valor, str) else list(valor)))
+        expressao = None
+        for f in filtros:
+            expressao = f if expressao is None else expressao & f
+        return expressao
+
+    def eventos(self, colunas=None, relatorios=False, **filtros):
+        """
+        Eventos arquivados como DataFrame (nomes públicos: Data, Paciente, PA_Sys...).
+        colunas: só essas são lidas do disco. relatorios=True junta o texto da Analise_IA.
+        filtros: paciente, inicio, fim, ritmo, local (str ou lista).
+        """
+        dataset = self._dataset()
+        colunas = list(colunas or _COLUNAS_PUBLICAS)
+        if relatorios and "Relatorio_Id" not in colunas:
+            colunas.append("Relatorio_Id")
+        if dataset is None:
+            return pd.DataFrame(columns=colunas + (["Analise_IA"] if relatorios else []))
+        tabela = dataset.to_table(columns=[_COLUNAS_PUBLICAS[c] for c in colunas], filter=self._filtro(**filtros))
+        df = tabela.to_pandas().rename(columns=_MAPA_COLUNAS)
+        for col in ("PA_Sys", "PA_Dia", "SpO2_Num"):
+            if col in df:
+                df[col] = df[col].astype("Int64")
+        if relatorios:
+            textos = self.relatorios(df["Relatorio_Id"].dropna().unique())
+            df["Analise_IA"] = df["Relatorio_Id"].map(textos)
+        return df
+
+    def contar(self, por=("Local",), **filtros):
+        """Nº de eventos por grupo (ex.: por=["Local"], ritmo="V", inicio=..., fim=...)."""
+        por = list(por)
+        dataset = self._dataset()
+        if dataset is None:
+            return pd.DataFrame(columns=por + ["N"])
+        colunas = [_COLUNAS_PUBLICAS[c] for c in por]
+        tabela = dataset.to_table(columns=colunas, filter=self._filtro(**filtros))
+        contagem = tabela.group_by(colunas).aggregate([([], "count_all")]).to_pandas()
+        contagem = contagem.rename(columns={**_MAPA_COLUNAS, "count_all": "N"})
+        return contagem.sort_values(por, ignore_index=True)
+
+    def relatorios(self, relatorio_ids):
+        """Texto de cada relatorio_id pedido (dict id -> texto)."""
+        pasta = os.path.join(self.pasta, RELATORIOS_DIR)
+        ids = [int(i) for i in relatorio_ids]
+        if not ids or not os.path.isdir(pasta):
+            return {}
+        tabela = ds.dataset(pasta, format="parquet").to_table(filter=ds.field("relatorio_id").isin(ids))
+        return dict(zip(tabela.column("relatorio_id").to_pylist(), tabela.column("texto").to_pylist()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arquivo Parquet do histórico antigo (compactação e consultas).")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    compactar = comandos.add_parser("compactar", help="Move os eventos antigos do banco para o arquivo")
+    compactar.add_argument("--dias", type=int, default=DIAS_QUENTES, help="Eventos mais novos que isso ficam no banco")
+    compactar.add_argument("--lote", type=int, default=LOTE)
+    compactar.add_argument("--a-cada", type=float, default=None, help="Repete a cada N horas (sem isso, roda uma vez)")
+
+    contar = comandos.add_parser("contar", help="Conta eventos arquivados por grupo")
+    contar.add_argument("--por", nargs="+", default=["Local"], choices=[c for c in _COLUNAS_PUBLICAS if c != "id"])
+    contar.add_argument("--paciente", nargs="+", default=None)
+    contar.add_argument("--ritmo", nargs="+", default=None, help="Classes AAMI (N, S, V, F, Q)")
+    contar.add_argument("--local", nargs="+", default=None)
+    contar.add_argument("--inicio", default=None)
+    contar.add_argument("--fim", default=None)
+
+    for sub in (compactar, contar):
+        sub.add_argument("--pasta", default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    arquivo = EventArchive(args.pasta)
+    if args.comando == "compactar":
+        from history_store import HistoryStore
+
+        store = HistoryStore()
+        while True:
+            arquivo.compactar(store, args.dias, args.lote)
+            if args.a_cada is None:
+                break
+            time.sleep(args.a_cada * 3600)
+    else:
+        inicio = time.perf_counter()
+        df = arquivo.contar(args.por, paciente=args.paciente, ritmo=args.ritmo, local=args.local,
+                            inicio=args.inicio, fim=args.fim)
+        print(df.to_string(index=False))
+        print(f"⏱️ {df['N'].sum() if len(df) else 0} eventos em {time.perf_counter() - inicio:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
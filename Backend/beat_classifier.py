@@ -0,0 +1,175 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Modelos TFLite treinados nos notebooks (os mesmos que rodam no relógio)
+MODELS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "Mobile_app", "HeartGuard", "app", "src", "main", "assets"
+)
+MODELOS = {
+    "padrao": "model_padrao.tflite",
+    "quantizado": "model_quantizado.tflite",
+    "br_nativa": "model_br_nativa.tflite",
+}
+MODELO_PADRAO = "padrao"
+
+# Classes AAMI (mesma ordem do notebook): 0=N, 1=S, 2=V, 3=F, 4=Q
+CLASSES_AAMI = ["N", "S", "V", "F", "Q"]
+# O modelo BR nativo foi re-treinado como binário (Normal x Anormal)
+CLASSES_BINARIAS = ["Normal", "Anormal"]
+
+
+def criar_interpreter(caminho, threads=1):
+    """Usa o runtime TFLite que estiver instalado (LiteRT, tflite-runtime ou TensorFlow)."""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+    return Interpreter(model_path=caminho, num_threads=threads)
+
+
+class TFLiteBeatModel:
+    """Um modelo TFLite em CPU que classifica lotes de janelas de 360 amostras."""
+
+    def __init__(self, caminho, threads=1, max_batch=256):
+        inicio = time.perf_counter()
+        self.caminho = caminho
+        self.max_batch = max_batch
+        self._interpreter = criar_interpreter(caminho, threads)
+        self._interpreter.allocate_tensors()
+        self._entrada = self._interpreter.get_input_details()[0]
+        self._saida = self._interpreter.get_output_details()[0]
+        self._batch_atual = int(self._entrada["shape"][0])
+        self._lock = threading.Lock()  # O interpreter não é thread-safe
+        self.tamanho_janela = int(self._entrada["shape"][1])
+        n_classes = int(self._saida["shape"][-1])
+        self.classes = CLASSES_AAMI if n_classes == len(CLASSES_AAMI) else (
+            CLASSES_BINARIAS if n_classes == 2 else [str(i) for i in range(n_classes)]
+        )
+        self.tempo_carga = time.perf_counter() - inicio
+
+    def _ajustar_batch(self, n):
+        if n != self._batch_atual:
+            self._interpreter.resize_tensor_input(self._entrada["index"], [n, self.tamanho_janela, 1])
+            self._interpreter.allocate_tensors()
+            self._batch_atual = n
+
+    def predict(self, janelas):
+        """janelas: (N, 360) float -> probabilidades (N, nº de classes) float32."""
+        janelas = np.asarray(janelas, dtype=np.float32)
+        saida = np.empty((len(janelas), len(self.classes)), dtype=np.float32)
+        escala_in, zero_in = self._entrada["quantization"]
+        escala_out, zero_out = self._saida["quantization"]
+        with self._lock:
+            for i in range(0, len(janelas), self.max_batch):
+                lote = janelas[i:i + self.max_batch]
+                x = lote[..., np.newaxis]
+                if escala_in:  # Modelo quantizado (int8): quantiza a entrada
+                    info = np.iinfo(self._entrada["dtype"])
+                    x = np.clip(np.round(x / escala_in + zero_in), info.min, info.max)
+                self._ajustar_batch(len(lote))
+                self._interpreter.set_tensor(self._entrada["index"], x.astype(self._entrada["dtype"]))
+                self._interpreter.invoke()
+                y = self._interpreter.get_tensor(self._saida["index"])
+                if escala_out:
+                    y = (y.astype(np.float32) - zero_out) * escala_out
+                saida[i:i + len(lote)] = y
+        return saida
+
+
+class MicroBatcher:
+    """
+    Junta janelas de requisições simultâneas num único invoke do modelo.
+    Espera até max_espera segundos (ou até max_batch janelas) antes de rodar o lote.
+    """
+
+    def __init__(self, modelo, max_batch=256, max_espera=0.005):
+        self.modelo = modelo
+        self.max_batch = max_batch
+        self.max_espera = max_espera
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="heartguard-tflite")
+        self._fila = []  # (janelas, future)
+        self._total = 0
+        self._cheio = asyncio.Event()
+        self._task = None
+
+    async def classificar(self, janelas):
+        loop = asyncio.get_running_loop()
+        futuro = loop.create_future()
+        self._fila.append((janelas, futuro))
+        self._total += len(janelas)
+        if self._total >= self.max_batch:
+            self._cheio.set()
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._processar())
+        return await futuro
+
+    async def _processar(self):
+        loop = asyncio.get_running_loop()
+        while self._fila:
+            try:
+                await asyncio.wait_for(self._cheio.wait(), self.max_espera)
+            except asyncio.TimeoutError:
+                pass
+            self._cheio.clear()
+            lote, self._fila, self._total = self._fila, [], 0
+            try:
+                probs = await loop.run_in_executor(
+                    self._executor, self.modelo.predict, np.concatenate([j for j, _ in lote])
+                )
+            except Exception as e:
+                for _, futuro in lote:
+                    if not futuro.done():
+                        futuro.set_exception(e)
+                continue
+            inicio = 0
+            for janelas, futuro in lote:
+                if not futuro.done():
+                    futuro.set_result(probs[inicio:inicio + len(janelas)])
+                inicio += len(janelas)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+class BeatClassifierService:
+    """Carrega os modelos sob demanda e mantém um MicroBatcher por modelo."""
+
+    def __init__(self, models_dir=MODELS_DIR, threads=1, max_batch=256, max_espera=0.005):
+        self.models_dir = models_dir
+        self.threads = threads
+        self.max_batch = max_batch
+        self.max_espera = max_espera
+        self._batchers = {}
+        self._lock = threading.Lock()
+
+    def disponiveis(self):
+        return [nome for nome, arquivo in MODELOS.items() if os.path.exists(os.path.join(self.models_dir, arquivo))]
+
+    def _batcher(self, nome):
+        if nome not in MODELOS:
+            raise KeyError(nome)
+        with self._lock:
+            if nome not in self._batchers:
+                modelo = TFLiteBeatModel(os.path.join(self.models_dir, MODELOS[nome]), self.threads, self.max_batch)
+                print(f"🧠 Modelo TFLite '{nome}' carregado em {modelo.tempo_carga * 1000:.0f} ms ({modelo.classes})")
+                self._batchers[nome] = MicroBatcher(modelo, self.max_batch, self.max_espera)
+            return self._batchers[nome]
+
+    def classes(self, nome):
+        return self._batcher(nome).modelo.classes
+
+    async def classificar(self, janelas, nome=MODELO_PADRAO):
+        if len(janelas) == 0:
+            return np.zeros((0, len(self.classes(nome))), dtype=np.float32)
+        return await self._batcher(nome).classificar(janelas)
+
+    def shutdown(self):
+        for batcher in self._batchers.values():
+            batcher.shutdown()
@@ -0,0 +1,425 @@
+"""
+Benchmark de carga do caminho de ingestão da API (latência, vazão, CPU e memória).
+
+Uso:
+    python bench_ingest.py                                    # em processo, históricos de 1k a 1M eventos
+    python bench_ingest.py --modo uvicorn --historicos 1000 100000
+    python bench_ingest.py --comparar bench_ingest_antigo.json
+
+Para cada tamanho de histórico, o banco é completado com eventos sintéticos até
+aquele tamanho e cada endpoint recebe uma rodada de requisições concorrentes de
+vários pacientes: /register_patient, /analyze (com o RAG/FAISS de verdade e um
+provedor de SMS falso no lugar do Twilio), /waveform (replay do
+dados_ecg_simulados.txt do relógio), /latest_status/{paciente} e /latest_status.
+
+Mede p50/p95/p99, vazão, CPU e RSS do processo da API por endpoint e grava tudo
+em JSON. Com --comparar, mostra a diferença de p95 e vazão para um resultado
+anterior (para pegar regressões).
+
+A API roda numa pasta de trabalho temporária (banco e ondas novos a cada
+execução) com um link para o faiss_index_tcc desta pasta.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from urllib.parse import quote
+import numpy as np
+import httpx
+
+# Tenta importar o psutil; sem ele, CPU e RSS são lidos do /proc (Linux)
+try:
+    import psutil
+    PSUTIL_INSTALLED = True
+except ImportError:
+    PSUTIL_INSTALLED = False
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+ECG_REPLAY = os.path.join(BACKEND_DIR, "..", "Mobile_app", "HeartGuard", "app", "src", "main", "assets",
+                          "dados_ecg_simulados.txt")
+INDEX_DIR = "faiss_index_tcc"
+HISTORICOS = [1_000, 10_000, 100_000, 1_000_000]
+LOTE_PREENCHIMENTO = 20_000
+ECG_FS = 360
+ECG_ESCALA = 0.001  # mV por unidade (igual ao relógio)
+ECG_SEGUNDOS = 10  # 5 s antes e 5 s depois do evento
+TIMEOUT_PRONTO = 300  # Segundos para o modelo do RAG carregar
+TIMEOUT_FILA = 300  # Segundos para a fila do RAG esvaziar depois do /analyze
+
+
+def log(mensagem):
+    # O stdout fica com os prints da API; o progresso do benchmark vai para o stderr
+    print(mensagem, file=sys.stderr, flush=True)
+
+
+# --- CPU / MEMÓRIA DO PROCESSO DA API ---
+def uso_processo(pid):
+    """(segundos de CPU, RSS em bytes) do processo."""
+    if PSUTIL_INSTALLED:
+        processo = psutil.Process(pid)
+        cpu = processo.cpu_times()
+        return cpu.user + cpu.system, processo.memory_info().rss
+    with open(f"/proc/{pid}/stat") as f:
+        campos = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(campos[11]) + int(campos[12])) / os.sysconf("SC_CLK_TCK")
+    with open(f"/proc/{pid}/status") as f:
+        rss = next(int(linha.split()[1]) * 1024 for linha in f if linha.startswith("VmRSS"))
+    return cpu, rss
+
+
+# --- TRÁFEGO SINTÉTICO ---
+class GeradorTrafego:
+    """Sinais vitais, cadastros e ondas de vários pacientes (reprodutível pela seed)."""
+
+    def __init__(self, pacientes, seed=42, ecg_replay=ECG_REPLAY):
+        self.rng = np.random.default_rng(seed)
+        self.pacientes = [f"Paciente Bench {i:04d}" for i in range(pacientes)]
+        self.ecg = self._carregar_ecg(ecg_replay) if ecg_replay is not None else None  # None: sem ondas
+        self._seq = 0
+
+    def _carregar_ecg(self, caminho):
+        if caminho and os.path.exists(caminho):
+            sinal = np.loadtxt(caminho, dtype=np.float64)
+            log(f"🫀 Replay do ECG: {len(sinal)} amostras de {os.path.basename(caminho)}")
+        else:
+            log("⚠️ dados_ecg_simulados.txt não encontrado. Usando um ECG sintético.")
+            t = np.arange(ECG_FS * 60) / ECG_FS
+            sinal = 0.4 + 0.5 * np.exp(-((t % 0.8) - 0.4) ** 2 / 0.0002)
+        # Uma janela de ECG_SEGUNDOS por vez, dando a volta no arquivo
+        repeticoes = int(np.ceil(ECG_FS * ECG_SEGUNDOS / len(sinal))) + 1
+        return np.tile(sinal, repeticoes)
+
+    def vitais(self):
+        """Payload do /analyze no formato que o relógio envia (~10% de eventos de perigo)."""
+        self._seq += 1
+        perigo = self.rng.random() < 0.1
+        if perigo:
+            pa = f"{self.rng.integers(70, 90)}/{self.rng.integers(40, 60)}"
+            spo2 = f"{self.rng.integers(82, 89)}%"
+        else:
+            pa = f"{self.rng.integers(110, 140)}/{self.rng.integers(70, 90)}"
+            spo2 = f"{self.rng.integers(94, 100)}%"
+        return {
+            "patient_name": self.pacientes[self.rng.integers(len(self.pacientes))],
+            "ecg_status": "PERIGO VENTRICULAR" if perigo else "Normal (BR)",
+            "bp_value": pa,
+            "spo2_value": spo2,
+            "location_type": "RURAL_REMOTA" if self.rng.random() < 0.3 else "URBANA",
+            "timestamp": f"bench-{self._seq}",
+        }
+
+    def cadastro(self, i):
+        return {
+            "name": self.pacientes[i % len(self.pacientes)],
+            "phone": f"+55119{i % 100000000:08d}",
+            "target_sys": 130,
+            "target_dia": 85,
+            "target_spo2": 95,
+            "medication": "Amiodarona",
+        }
+
+    def onda(self, i):
+        """Janela do replay codificada como o relógio envia (delta int16 + gzip)."""
+        from waveform_store import codificar_amostras
+
+        n = ECG_FS * ECG_SEGUNDOS
+        inicio = (i * n) % (len(self.ecg) - n)
+        amostras = np.round(self.ecg[inicio:inicio + n] / ECG_ESCALA).astype(np.int16)
+        return gzip.compress(codificar_amostras(amostras, "delta"))
+
+    def eventos_historico(self, n, fim):
+        """n eventos já gravados (a cada 30 s, terminando em `fim`) para encher o banco."""
+        sys_ = self.rng.integers(90, 150, n)
+        dia = self.rng.integers(55, 95, n)
+        spo2 = self.rng.integers(85, 100, n)
+        pacientes = self.rng.integers(len(self.pacientes), size=n)
+        return [
+            {
+                "Data": (fim - timedelta(seconds=30 * (n - i))).strftime("%Y-%m-%d %H:%M:%S"),
+                "Paciente": self.pacientes[pacientes[i]],
+                "ECG": "Normal (BR)",
+                "PA": f"{sys_[i]}/{dia[i]}",
+                "SpO2": f"{spo2[i]}%",
+                "Local": "URBANA",
+                "Analise_IA": "Histórico sintético do benchmark.",
+            }
+            for i in range(n)
+        ]
+
+
+def completar_historico(db_file, alvo, gerador):
+    """Grava eventos sintéticos até o histórico ter `alvo` eventos. Devolve os segundos gastos."""
+    from history_store import HistoryStore
+
+    store = HistoryStore(db_file=db_file, legacy_csv=None)
+    ultimo = store.latest()
+    atual = int(ultimo["id"]) if ultimo is not None else 0
+    inicio = time.perf_counter()
+    fim = datetime.now() - timedelta(days=1)
+    while atual < alvo:
+        n = min(LOTE_PREENCHIMENTO, alvo - atual)
+        store.append_many(gerador.eventos_historico(n, fim))
+        atual += n
+    return time.perf_counter() - inicio
+
+
+# --- RODADAS DE CARGA ---
+async def rodada(cliente, requisicoes, concorrencia, ao_responder=None):
+    """Dispara as requisições (metodo, url, kwargs) com `concorrencia` clientes simultâneos."""
+    pendentes = iter(requisicoes)
+    latencias = []
+    status = Counter()
+
+    async def cliente_simulado():
+        for metodo, url, kwargs in pendentes:
+            inicio = time.perf_counter()
+            try:
+                resposta = await cliente.request(metodo, url, **kwargs)
+            except httpx.HTTPError:
+                status["erro"] += 1
+                continue
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            status[str(resposta.status_code)] += 1
+            if ao_responder is not None and resposta.status_code == 200:
+                ao_responder(resposta)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente_simulado() for _ in range(concorrencia)))
+    return np.array(latencias), status, time.perf_counter() - inicio
+
+
+def resumo(latencias, status, duracao, cpu, rss):
+    ok = sum(n for codigo, n in status.items() if codigo.startswith("2"))
+    return {
+        "requests": int(sum(status.values())),
+        "ok": ok,
+        "status": dict(status),
+        "throughput_rps": round(ok / duracao, 1) if duracao else None,
+        "latency_ms": {
+            p: round(float(np.percentile(latencias, q)), 2) if len(latencias) else None
+            for p, q in (("p50", 50), ("p95", 95), ("p99", 99))
+        } | {"max": round(float(latencias.max()), 2) if len(latencias) else None},
+        "cpu_s": round(cpu, 2),
+        "cpu_pct": round(100 * cpu / duracao, 1) if duracao else None,
+        "rss_mb": round(rss / 2**20, 1),
+    }
+
+
+async def esperar_pronto(cliente):
+    limite = time.monotonic() + TIMEOUT_PRONTO
+    while time.monotonic() < limite:
+        try:
+            resposta = await cliente.get("/ready")
+            if resposta.status_code == 200:
+                return resposta.json()
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError("A API não ficou pronta a tempo.")
+
+
+async def esperar_relatorio(cliente, evento_id):
+    """Espera o RAG terminar o último evento enviado (a fila processa em ordem)."""
+    limite = time.monotonic() + TIMEOUT_FILA
+    while time.monotonic() < limite:
+        resposta = await cliente.get(f"/report/{evento_id}")
+        if resposta.status_code == 200 and resposta.json()["status"] == "done":
+            return
+        await asyncio.sleep(0.2)
+    log(f"⚠️ A fila do RAG não esvaziou em {TIMEOUT_FILA}s.")
+
+
+async def executar_rodadas(cliente, pid, args, gerador, db_file):
+    resultados = []
+    for alvo in args.historicos:
+        log(f"\n📚 Histórico com {alvo} eventos...")
+        preenchimento = completar_historico(db_file, alvo, gerador)
+        n = args.requisicoes
+        endpoints = {}
+        eventos_ids = []
+
+        fases = [
+            ("/register_patient", [("POST", "/register_patient", {"json": gerador.cadastro(i)}) for i in range(n)], None),
+            ("/analyze", [("POST", "/analyze", {"json": gerador.vitais()}) for _ in range(n)],
+             lambda r: eventos_ids.append(r.json()["event_id"])),
+            ("/waveform", None, None),
+            ("/latest_status/{patient_id}",
+             [("GET", f"/latest_status/{quote(gerador.pacientes[i % len(gerador.pacientes)])}", {}) for i in range(n)],
+             None),
+            ("/latest_status", [("GET", "/latest_status", {})] * n, None),
+        ]
+        for nome, requisicoes, ao_responder in fases:
+            if nome == "/waveform":
+                if not eventos_ids:
+                    continue
+                requisicoes = [
+                    ("POST", f"/waveform/{eventos_ids[i % len(eventos_ids)]}",
+                     {"content": gerador.onda(i),
+                      "params": {"fs": ECG_FS, "pre_event": ECG_FS * ECG_SEGUNDOS // 2,
+                                 "encoding": "delta", "scale": ECG_ESCALA},
+                      "headers": {"Content-Encoding": "gzip", "Content-Type": "application/octet-stream"}})
+                    for i in range(n)
+                ]
+            cpu_antes, _ = uso_processo(pid)
+            latencias, status, duracao = await rodada(cliente, requisicoes, args.concorrencia, ao_responder)
+            extra = {}
+            if nome == "/analyze" and eventos_ids:
+                inicio = time.perf_counter()
+                await esperar_relatorio(cliente, max(eventos_ids))
+                extra["rag_drain_s"] = round(time.perf_counter() - inicio, 2)
+            cpu_depois, rss = uso_processo(pid)
+            endpoints[nome] = resumo(latencias, status, duracao, cpu_depois - cpu_antes, rss) | extra
+            r = endpoints[nome]
+            log(f"   {nome:<28} {r['throughput_rps'] or 0:>8.1f} req/s  p50 {r['latency_ms']['p50']} "
+                f"p95 {r['latency_ms']['p95']} p99 {r['latency_ms']['p99']} ms  "
+                f"CPU {r['cpu_pct']}%  RSS {r['rss_mb']} MB  {r['status']}")
+        resultados.append({"history_events": alvo, "prefill_s": round(preenchimento, 2), "endpoints": endpoints})
+    return resultados
+
+
+# --- MODOS DE EXECUÇÃO ---
+def preparar_pasta(pasta):
+    os.makedirs(pasta, exist_ok=True)
+    indice = os.path.join(BACKEND_DIR, INDEX_DIR)
+    destino = os.path.join(pasta, INDEX_DIR)
+    if os.path.isdir(indice) and not os.path.exists(destino):
+        os.symlink(indice, destino)
+    elif not os.path.isdir(indice):
+        log("⚠️ faiss_index_tcc não encontrado: o RAG vai responder sem contexto dos PDFs (rode o llm_core.py).")
+    return os.path.join(pasta, "heartguard.db")
+
+
+async def em_processo(args, gerador, pasta):
+    os.environ["HEARTGUARD_SMS_PROVIDER"] = "fake"
+    db_file = preparar_pasta(pasta)
+    os.chdir(pasta)
+    sys.path.insert(0, BACKEND_DIR)
+    stdout = sys.stdout
+    with open(os.devnull, "w") as silencio:
+        sys.stdout = silencio  # Os prints por requisição da API distorceriam as medidas
+        try:
+            import api
+
+            transporte = httpx.ASGITransport(app=api.app)
+            async with api.app.router.lifespan_context(api.app):
+                async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=60) as cliente:
+                    pronto = await esperar_pronto(cliente)
+                    return pronto, await executar_rodadas(cliente, os.getpid(), args, gerador, db_file)
+        finally:
+            sys.stdout = stdout
+
+
+async def com_uvicorn(args, gerador, pasta):
+    db_file = preparar_pasta(pasta)
+    env = dict(os.environ, HEARTGUARD_SMS_PROVIDER="fake",
+               PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])))
+    servidor = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(args.porta),
+         "--log-level", "warning"],
+        cwd=pasta, env=env, stdout=subprocess.DEVNULL,
+    )
+    try:
+        limites = httpx.Limits(max_connections=args.concorrencia, max_keepalive_connections=args.concorrencia)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.porta}", timeout=60, limits=limites) as cliente:
+            pronto = await esperar_pronto(cliente)
+            return pronto, await executar_rodadas(cliente, servidor.pid, args, gerador, db_file)
+    finally:
+        servidor.terminate()
+        servidor.wait(timeout=30)
+
+
+# --- COMPARAÇÃO COM UM RESULTADO ANTERIOR ---
+def comparar(atual, anterior):
+    base = {(r["history_events"], ep): m for r in anterior["results"] for ep, m in r["endpoints"].items()}
+    print(f"\n📈 Comparação com {anterior['meta'].get('date')} ({anterior['meta'].get('commit')}):")
+    comuns = [r for r in atual["results"] if any(h == r["history_events"] for h, _ in base)]
+    if not comuns:
+        print("   Nenhum tamanho de histórico em comum com a execução anterior.")
+        return
+    print(f"   {'histórico':>10} {'endpoint':<28} {'p95 ms':>18} {'req/s':>18}")
+    for r in comuns:
+        for ep, m in r["endpoints"].items():
+            antes = base.get((r["history_events"], ep))
+            if antes is None:
+                continue
+
+            def delta(novo, velho):
+                if novo is None or not velho:
+                    return "-"
+                return f"{novo:.1f} ({100 * (novo - velho) / velho:+.0f}%)"
+
+            print(f"   {r['history_events']:>10} {ep:<28} "
+                  f"{delta(m['latency_ms']['p95'], antes['latency_ms']['p95']):>18} "
+                  f"{delta(m['throughput_rps'], antes['throughput_rps']):>18}")
+
+
+def commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga da ingestão da API HeartGuard.")
+    parser.add_argument("--modo", choices=["processo", "uvicorn"], default="processo",
+                        help="API no mesmo processo (ASGI) ou num uvicorn local")
+    parser.add_argument("--historicos", type=int, nargs="+", default=HISTORICOS,
+                        help="Tamanhos do histórico (eventos) a medir, em ordem crescente")
+    parser.add_argument("--requisicoes", type=int, default=500, help="Requisições por endpoint em cada tamanho")
+    parser.add_argument("--concorrencia", type=int, default=16, help="Clientes simultâneos")
+    parser.add_argument("--pacientes", type=int, default=200, help="Pacientes distintos no tráfego")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--porta", type=int, default=8765, help="Porta do uvicorn (modo uvicorn)")
+    parser.add_argument("--pasta", default=None, help="Pasta de trabalho da API (padrão: temporária)")
+    parser.add_argument("--saida", default=None, help="Arquivo JSON do resultado")
+    parser.add_argument("--comparar", default=None, help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args()
+    args.historicos = sorted(args.historicos)
+
+    saida = os.path.abspath(args.saida or f"bench_ingest_{datetime.now():%Y%m%d_%H%M%S}.json")
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)
+    pasta = os.path.abspath(args.pasta or tempfile.mkdtemp(prefix="heartguard-bench-"))
+    log(f"🏁 Benchmark ({args.modo}) em {pasta}")
+
+    gerador = GeradorTrafego(args.pacientes, args.seed)
+    executar = em_processo if args.modo == "processo" else com_uvicorn
+    pronto, resultados = asyncio.run(executar(args, gerador, pasta))
+
+    resultado = {
+        "meta": {
+            "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "commit": commit_atual(),
+            "mode": args.modo,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "requests_per_endpoint": args.requisicoes,
+            "concurrency": args.concorrencia,
+            "patients": args.pacientes,
+            "seed": args.seed,
+            "faiss": pronto.get("faiss"),
+        },
+        "results": resultados,
+    }
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    log(f"\n💾 Resultado salvo em {saida}")
+    if anterior is not None:
+        comparar(resultado, anterior)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Compara os três modelos TFLite do relógio em CPU (mesmo runtime do beat_classifier).
+
+Uso:
+    python bench_models.py                                     # replay do dados_ecg_simulados.txt
+    python bench_models.py --mitbih mit-bih-data               # teste (20%) do notebook, fora do treino
+    python bench_models.py --dataset mitbih_dataset            # idem, com o dataset já gerado
+    python bench_models.py --janelas X.npy --rotulos y.npy --lotes 1 32 256 --threads 1 4
+
+Para cada modelo mede o tempo de carga, a latência por batimento em vários
+tamanhos de lote e nº de threads, o pico de memória (RSS) e, se o conjunto tiver
+rótulos AAMI, a acurácia e o F1 por classe (no modelo binário, N = Normal e o
+resto = Anormal). Sem rótulos, mostra a concordância com o modelo padrão.
+
+Cada modelo roda num processo separado, então o pico de memória é só dele.
+
+No MIT-BIH a qualidade é medida só nos batimentos de teste do notebook (o mesmo
+train_test_split estratificado, random_state=42, via dataset_mitbih.dividir): os
+modelos foram treinados com os outros 80% dos batimentos dos 48 registros, então
+qualquer registro inteiro teria batimentos vistos no treino. O --mitbih gera (ou
+reaproveita) o dataset com o dataset_mitbih.py e precisa do wfdb e do scikit-learn.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import dataset_mitbih
+import ecg_segmentation
+from beat_classifier import MODELS_DIR, MODELOS, MODELO_PADRAO, CLASSES_AAMI, TFLiteBeatModel
+
+ECG_REPLAY = os.path.join(MODELS_DIR, "dados_ecg_simulados.txt")
+LOTES = [1, 8, 32, 128]
+THREADS = [1, 2, 4]
+REPETICOES_CARGA = 3
+
+
+# --- CONJUNTOS DE BATIMENTOS ---
+def janelas_replay(caminho, n):
+    """Janelas do ECG simulado do relógio (sem rótulos), repetidas até ter n batimentos."""
+    janelas, _ = ecg_segmentation.segmentar_registro(np.loadtxt(caminho))
+    if not len(janelas):
+        raise RuntimeError(f"Nenhum batimento detectado em {caminho}")
+    return np.resize(janelas, (max(n, len(janelas)), janelas.shape[1])).astype(np.float32), None
+
+
+def janelas_teste_notebook(saida):
+    """Batimentos de teste (20%) do train_test_split do notebook, do dataset gerado pelo dataset_mitbih.py."""
+    ds = dataset_mitbih.carregar_dataset(saida)
+    _, teste = dataset_mitbih.dividir(ds.y)
+    teste = np.sort(teste)  # Leitura sequencial do memmap
+    print(f"📂 Dataset {ds.manifesto['version']}: {len(teste)} de {len(ds.y)} batimentos são do teste do notebook")
+    return ds.X[teste], ds.y[teste]
+
+
+# --- MÉTRICAS ---
+def metricas_classificacao(rotulos, previstos, classes):
+    """Acurácia, F1 macro e precisão/recall/F1 por classe (sem scikit-learn)."""
+    n = len(classes)
+    confusao = np.bincount(rotulos * n + previstos, minlength=n * n).reshape(n, n)
+    acertos = np.diag(confusao).astype(np.float64)
+    reais = confusao.sum(axis=1)
+    preditos = confusao.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precisao = np.where(preditos > 0, acertos / preditos, 0.0)
+        recall = np.where(reais > 0, acertos / reais, 0.0)
+        f1 = np.where(precisao + recall > 0, 2 * precisao * recall / (precisao + recall), 0.0)
+    presentes = reais > 0
+    return {
+        "accuracy": round(float(acertos.sum() / max(len(rotulos), 1)), 4),
+        "macro_f1": round(float(f1[presentes].mean()), 4) if presentes.any() else None,
+        "per_class": {
+            c: {"support": int(reais[i]), "precision": round(float(precisao[i]), 4),
+                "recall": round(float(recall[i]), 4), "f1": round(float(f1[i]), 4)}
+            for i, c in enumerate(classes)
+        },
+        "confusion": confusao.tolist(),
+    }
+
+
+def rss_pico_mb():
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def medir_modelo(nome, janelas, rotulos, lotes, threads, repeticoes):
+    """Roda num processo próprio: carga, latência por lote/threads, memória e qualidade."""
+    caminho = os.path.join(MODELS_DIR, MODELOS[nome])
+    rss_base = rss_pico_mb()
+    cargas = [TFLiteBeatModel(caminho, threads=1).tempo_carga for _ in range(REPETICOES_CARGA)]
+
+    latencias = []
+    previsoes = None
+    for n_threads in threads:
+        for lote in lotes:
+            modelo = TFLiteBeatModel(caminho, threads=n_threads, max_batch=lote)
+            modelo.predict(janelas[:lote])  # Aquecimento (aloca os tensores desse tamanho)
+            tempos = []
+            for _ in range(repeticoes):
+                for i in range(0, len(janelas) - lote + 1, lote):
+                    inicio = time.perf_counter()
+                    modelo.predict(janelas[i:i + lote])
+                    tempos.append(time.perf_counter() - inicio)
+            tempos = np.array(tempos) * 1000
+            latencias.append({
+                "threads": n_threads,
+                "batch": lote,
+                "us_per_beat": round(float(tempos.mean() / lote * 1000), 2),
+                "batch_ms_p50": round(float(np.percentile(tempos, 50)), 3),
+                "batch_ms_p95": round(float(np.percentile(tempos, 95)), 3),
+                "beats_per_s": round(float(lote * 1000 / tempos.mean()), 1),
+            })
+            if previsoes is None:
+                previsoes = modelo.predict(janelas).argmax(axis=1)
+    classes = modelo.classes
+
+    resultado = {
+        "model": nome,
+        "file": MODELOS[nome],
+        "size_kb": round(os.path.getsize(caminho) / 1024, 1),
+        "classes": classes,
+        "load_ms": round(float(np.median(cargas)) * 1000, 2),
+        "peak_rss_mb": round(rss_pico_mb(), 1),
+        "model_rss_mb": round(rss_pico_mb() - rss_base, 1),
+        "latency": latencias,
+        "predictions": previsoes.tolist(),
+    }
+    if rotulos is not None:
+        if classes == CLASSES_AAMI:
+            resultado["quality"] = metricas_classificacao(rotulos, previsoes, classes)
+        else:  # Binário: N -> Normal, S/V/F/Q -> Anormal
+            resultado["quality"] = metricas_classificacao((rotulos != 0).astype(np.int64), previsoes, classes)
+    return resultado
+
+
+def concordancia(referencia, outro):
+    """Fração de batimentos com o mesmo veredito normal/anormal do modelo de referência."""
+    ref_normal = np.array(referencia["predictions"]) == 0
+    normal = np.array(outro["predictions"]) == 0
+    return round(float((ref_normal == normal).mean()), 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos modelos TFLite de classificação de batimentos.")
+    parser.add_argument("--modelos", nargs="+", choices=list(MODELOS), default=list(MODELOS))
+    parser.add_argument("--mitbih", default=None, help="Pasta com os registros do MIT-BIH (gera o dataset se preciso)")
+    parser.add_argument("--dataset", default=None, help="Pasta do dataset_mitbih.py (padrão: mitbih_dataset)")
+    parser.add_argument("--janelas", default=None, help="Janelas (N, 360) já segmentadas, em .npy")
+    parser.add_argument("--rotulos", default=None, help="Rótulos AAMI (N,) em .npy, na ordem das janelas")
+    parser.add_argument("--replay", default=ECG_REPLAY, help="ECG sem rótulos usado quando não há outro conjunto")
+    parser.add_argument("--max-batimentos", type=int, default=4096, help="Limite de batimentos medidos")
+    parser.add_argument("--lotes", nargs="+", type=int, default=LOTES)
+    parser.add_argument("--threads", nargs="+", type=int, default=THREADS)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--saida", default=None, help="Arquivo JSON do resultado")
+    args = parser.parse_args()
+
+    if args.janelas:
+        janelas = np.load(args.janelas, mmap_mode="r")
+        rotulos = np.load(args.rotulos) if args.rotulos else None
+        origem = args.janelas
+    elif args.mitbih or args.dataset:
+        saida = args.dataset or dataset_mitbih.SAIDA_DIR
+        if args.mitbih:
+            dataset_mitbih.construir(args.mitbih, saida)  # Pulado se as entradas não mudaram
+        janelas, rotulos = janelas_teste_notebook(saida)
+        origem = "MIT-BIH, teste do notebook (20% fora do treino)"
+    else:
+        janelas, rotulos = janelas_replay(args.replay, args.max_batimentos)
+        origem = f"{os.path.basename(args.replay)} (sem rótulos)"
+
+    if len(janelas) > args.max_batimentos:
+        # Amostra fixa (seed 0) para o conjunto continuar representativo das classes
+        escolha = np.sort(np.random.default_rng(0).choice(len(janelas), args.max_batimentos, replace=False))
+        janelas = janelas[escolha]
+        rotulos = rotulos[escolha] if rotulos is not None else None
+    janelas = np.ascontiguousarray(janelas, dtype=np.float32)
+    rotulos = None if rotulos is None else np.asarray(rotulos, dtype=np.int64)
+    print(f"🫀 {len(janelas)} batimentos de {origem}")
+
+    resultados = []
+    contexto = multiprocessing.get_context("spawn")  # Processo limpo por modelo (memória isolada)
+    for nome in args.modelos:
+        print(f"⏱️ Medindo {nome}...")
+        with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as processo:
+            resultados.append(processo.submit(medir_modelo, nome, janelas, rotulos, args.lotes,
+                                              args.threads, args.repeticoes).result())
+
+    referencia = next((r for r in resultados if r["model"] == MODELO_PADRAO), resultados[0])
+    print(f"\n📊 {len(janelas)} batimentos de {origem}")
+    print(f"   {'modelo':<11} {'tamanho':>9} {'carga':>9} {'RSS pico':>9} {'acurácia':>9} {'F1 macro':>9} {'concord.':>9}")
+    for r in resultados:
+        qualidade = r.get("quality", {})
+        print(f"   {r['model']:<11} {r['size_kb']:>6.0f} KB {r['load_ms']:>6.1f} ms {r['peak_rss_mb']:>6.0f} MB "
+              f"{qualidade.get('accuracy', '-'):>9} {qualidade.get('macro_f1', '-'):>9} "
+              f"{concordancia(referencia, r):>9}")
+    print(f"\n   {'modelo':<11} {'threads':>7} {'lote':>5} {'µs/bat.':>9} {'lote p50':>10} {'lote p95':>10} {'bat./s':>10}")
+    for r in resultados:
+        for lat in r["latency"]:
+            print(f"   {r['model']:<11} {lat['threads']:>7} {lat['batch']:>5} {lat['us_per_beat']:>9.1f} "
+                  f"{lat['batch_ms_p50']:>7.3f} ms {lat['batch_ms_p95']:>7.3f} ms {lat['beats_per_s']:>10.0f}")
+    for r in resultados:
+        if "quality" in r:
+            print(f"\n   {r['model']} por classe: " + "  ".join(
+                f"{c}: F1 {m['f1']:.3f} (n={m['support']})" for c, m in r["quality"]["per_class"].items()))
+
+    if args.saida:
+        concordancias = [concordancia(referencia, r) for r in resultados]
+        for r, valor in zip(resultados, concordancias):
+            r["agreement_with_default"] = valor
+            r.pop("predictions")
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({"beats": len(janelas), "source": origem, "labelled": rotulos is not None,
+                       "results": resultados}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Resultado salvo em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
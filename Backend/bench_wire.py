@@ -0,0 +1,126 @@
+"""
+Compara os formatos de envio dos sinais vitais (wire_format.py): bytes por evento
+e tempo de leitura no servidor (descompressão + decodificação + VitalSigns).
+
+Uso:
+    python bench_wire.py                     # 2000 eventos, avulsos e em lotes de 100
+    python bench_wire.py --eventos 10000 --lote 500 --saida bench_wire.json
+
+Formatos: JSON como o relógio envia hoje (textos "120/80", "97%"), JSON só com os
+campos tipados, msgpack (se instalado) e o binário application/x-heartguard-vitals;
+cada um sem compressão, com gzip e com zstd (se instalado). "Avulso" é um evento
+por requisição (/analyze); "lote" é o corpo do /analyze_batch.
+"""
+import argparse
+import gzip
+import json
+import time
+from vitals import VitalSigns
+from waveform_store import descomprimir, zstandard
+import wire_format
+from bench_ingest import GeradorTrafego
+
+
+def corpos_json_relogio(eventos):
+    return [json.dumps(ev, ensure_ascii=False).encode("utf-8") for ev in eventos]
+
+
+def corpos_json_tipado(eventos):
+    return [modelo.model_dump_json(include={"patient_name", "location_type", "timestamp", "systolic",
+                                            "diastolic", "spo2", "rhythm"}).encode("utf-8")
+            for modelo in eventos]
+
+
+FORMATOS = {
+    # nome: (Content-Type, evento avulso -> bytes, lote -> bytes, usa os dicts do relógio?)
+    "json_relogio": (wire_format.JSON, lambda ev: corpos_json_relogio([ev])[0],
+                     lambda evs: json.dumps(evs, ensure_ascii=False).encode("utf-8"), True),
+    "json_tipado": (wire_format.JSON, lambda m: corpos_json_tipado([m])[0],
+                    lambda ms: b"[" + b",".join(corpos_json_tipado(ms)) + b"]", False),
+    "msgpack": (wire_format.MSGPACK, wire_format.codificar_msgpack, wire_format.codificar_msgpack, False),
+    "binario": (wire_format.BINARIO, lambda m: wire_format.codificar_binario([m]), wire_format.codificar_binario, False),
+}
+
+
+def compressores():
+    lista = {"identity": lambda b: b, "gzip": lambda b: gzip.compress(b, compresslevel=6)}
+    if zstandard is not None:
+        zstd = zstandard.ZstdCompressor(level=3)
+        lista["zstd"] = zstd.compress
+    return lista
+
+
+def ler_avulso(corpos, content_type, encoding):
+    for corpo in corpos:
+        wire_format.ler_evento(descomprimir(corpo, encoding), content_type)
+
+
+def ler_lotes(corpos, content_type, encoding):
+    for corpo in corpos:
+        for item in wire_format.ler_lote(descomprimir(corpo, encoding), content_type):
+            VitalSigns.model_validate(item)
+
+
+def cronometrar(funcao, repeticoes):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes por evento e tempo de leitura de cada formato de envio.")
+    parser.add_argument("--eventos", type=int, default=2000)
+    parser.add_argument("--lote", type=int, default=100, help="Eventos por corpo no modo lote")
+    parser.add_argument("--repeticoes", type=int, default=5, help="Rodadas por medida (vale a melhor)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--saida", default=None, help="Arquivo JSON do resultado")
+    args = parser.parse_args()
+
+    gerador = GeradorTrafego(pacientes=200, seed=args.seed, ecg_replay=None)
+    relogio = [gerador.vitais() for _ in range(args.eventos)]
+    modelos = [VitalSigns.model_validate(ev) for ev in relogio]
+    lotes = [slice(i, i + args.lote) for i in range(0, args.eventos, args.lote)]
+
+    resultados = []
+    for nome, (content_type, avulso, lote, usa_relogio) in FORMATOS.items():
+        if content_type == wire_format.MSGPACK and not wire_format.MSGPACK_INSTALLED:
+            print("⚠️ msgpack não instalado: formato pulado (pip install msgpack).")
+            continue
+        eventos = relogio if usa_relogio else modelos
+        crus = {
+            "avulso": [avulso(ev) for ev in eventos],
+            "lote": [lote(eventos[s]) for s in lotes],
+        }
+        for encoding, comprimir in compressores().items():
+            for modo, corpos in crus.items():
+                corpos = [comprimir(c) for c in corpos]
+                leitor = ler_avulso if modo == "avulso" else ler_lotes
+                segundos = cronometrar(lambda: leitor(corpos, content_type, encoding), args.repeticoes)
+                resultados.append({
+                    "format": nome,
+                    "encoding": encoding,
+                    "mode": modo,
+                    "bytes_per_event": round(sum(len(c) for c in corpos) / args.eventos, 1),
+                    "parse_us_per_event": round(segundos / args.eventos * 1e6, 2),
+                })
+
+    base = {r["mode"]: r for r in resultados if r["format"] == "json_relogio" and r["encoding"] == "identity"}
+    print(f"\n📦 {args.eventos} eventos (lote = {args.lote}), comparado ao JSON atual do relógio sem compressão:")
+    print(f"   {'formato':<13} {'encoding':<9} {'modo':<7} {'bytes/evento':>14} {'µs/evento':>16}")
+    for r in resultados:
+        b = base[r["mode"]]
+        print(f"   {r['format']:<13} {r['encoding']:<9} {r['mode']:<7} "
+              f"{r['bytes_per_event']:>7.1f} ({100 * r['bytes_per_event'] / b['bytes_per_event']:>3.0f}%) "
+              f"{r['parse_us_per_event']:>8.2f} ({100 * r['parse_us_per_event'] / b['parse_us_per_event']:>3.0f}%)")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({"events": args.eventos, "batch": args.lote, "results": resultados}, f, indent=2)
+        print(f"💾 Resultado salvo em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,17 +4,57 @@ import matplotlib.pyplot as plt
 import numpy as np
 import bcrypt
 import os
-import time
 import plotly.graph_objects as go # Importante para o gráfico bonito
+from history_store import HistoryStore
+from history_feed import HistoryFeed, ouvir_api
+from waveform_store import WaveformStore
+from patient_registry import PatientRegistry, COLUNAS as COLUNAS_PACIENTE
+from vitals import RhythmClass, classificar_ritmo
 
 # --- CONFIGURAÇÃO INICIAL DA PÁGINA ---
 st.set_page_config(page_title="HeartGuard | Sistema de Gestão", layout="wide", page_icon="❤️")
 
 # Arquivos de banco de dados (CSV)
 FILES = {
-    "history": "historico_pacientes.csv",
-    "users": "usuarios_sistema.csv",
-    "patients": "cadastro_pacientes.csv"
+    "users": "usuarios_sistema.csv"
+}
+
+# Histórico de eventos (SQLite compartilhado com a API)
+@st.cache_resource
+def get_history_store():
+    return HistoryStore()
+
+# Push de eventos da API (SSE): o dashboard redesenha assim que chega evento novo
+API_URL = os.environ.get("HEARTGUARD_API_URL", "http://localhost:8000")
+
+# Feed incremental compartilhado por todas as sessões do processo
+@st.cache_resource
+def get_history_feed():
+    feed = HistoryFeed(get_history_store())
+    ouvir_api(feed, f"{API_URL}/events")
+    return feed
+
+# Cadastro de pacientes (SQLite compartilhado com a API, mesmo esquema)
+@st.cache_resource
+def get_patient_registry():
+    return PatientRegistry()
+
+# ECG bruto dos eventos ("Caixa Preta" enviada pelo relógio)
+@st.cache_resource
+def get_waveform_store():
+    return WaveformStore()
+
+ECG_PONTOS_TELA = 1500  # A onda é decimada (min/max) para a largura do gráfico
+
+# Período das tendências -> (resolução do rollup, horas); None = últimos eventos crus
+JANELA_EVENTOS = 50
+PERIODOS_TENDENCIA = {
+    f"Últimos {JANELA_EVENTOS} eventos": (None, None),
+    "Última hora": ("1min", 1),
+    "Últimas 24 horas": ("1min", 24),
+    "Últimos 7 dias": ("1h", 24 * 7),
+    "Últimos 30 dias": ("1h", 24 * 30),
+    "Todo o histórico": ("1d", None),
 }
 
 # --- FUNÇÕES DE BANCO DE DADOS E SEGURANÇA ---
@@ -33,10 +73,8 @@ def save_user(username, password, role="medico"):
     return True
 
 def save_patient(name, phone):
-    df = load_csv("patients", ["Nome", "Telefone_Emergencia"])
-    df = df[df["Nome"] != name] 
-    new_pat = pd.DataFrame([[name, phone]], columns=["Nome", "Telefone_Emergencia"])
-    pd.concat([df, new_pat], ignore_index=True).to_csv(FILES["patients"], index=False)
+    # Só atualiza o telefone: metas e medicação cadastradas pela API são mantidas
+    get_patient_registry().upsert(name, telefone=phone)
 
 def verify_login(username, password):
     df = load_csv("users", ["Username", "Password_Hash", "Role"])
@@ -47,6 +85,59 @@ def verify_login(username, password):
             return user_row.iloc[0]["Role"]
     return None
 
+# --- ECG SINTÉTICO (um template por classe de ritmo) ---
+# O desenho só depende da classe do ECG, então é gerado uma vez (vetorizado)
+# e reaproveitado em todos os reruns.
+ECG_AMOSTRAS = 1000
+ECG_DURACAO = 4  # segundos
+
+def classe_ritmo(ritmo):
+    """Template do ECG sintético para a classe AAMI gravada pela API."""
+    if ritmo == RhythmClass.V:
+        return "ventricular"
+    if ritmo in (RhythmClass.S, RhythmClass.F):
+        return "arritmia"
+    return "normal"
+
+def gaussiana(t, centro, largura):
+    return np.exp(-(t - centro)**2 / (2 * largura**2))
+
+@st.cache_data
+def gerar_ecg_sintetico(classe):
+    """Devolve (t, sinal, descricoes, cor) do template da classe de ritmo."""
+    t = np.linspace(0, ECG_DURACAO, ECG_AMOSTRAS)
+
+    if classe == "ventricular":
+        ruido = np.random.default_rng(0).normal(0, 0.1, ECG_AMOSTRAS)
+        sinal = np.sin(2*np.pi*5*t) + np.sin(2*np.pi*12*t)*0.5 + ruido
+        descricoes = np.full(ECG_AMOSTRAS, "Fibrilação Ventricular", dtype=object)
+        return t, sinal, descricoes, "#FF0000"
+
+    if classe == "arritmia":
+        batimentos, cor = np.array([0.2, 1.2, 3.2]), "#FFA500"  # Batimento "faltando" em 2.2s
+    else:
+        batimentos, cor = np.array([0.2, 1.2, 2.2, 3.2]), "#00FF00"
+
+    # Tempo local de cada batimento: matriz (nº batimentos x amostras)
+    tl = t[np.newaxis, :] - batimentos[:, np.newaxis]
+    onda_p = (tl > 0.05) & (tl < 0.15)
+    qrs = (tl > 0.3) & (tl < 0.4)
+    onda_t = (tl > 0.5) & (tl < 0.7)
+
+    sinal = (
+        np.where(onda_p, 0.15 * gaussiana(tl, 0.1, 0.03), 0.0)
+        + np.where(qrs, -0.15 * gaussiana(tl, 0.33, 0.008)
+                        + 1.2 * gaussiana(tl, 0.35, 0.01)
+                        - 0.25 * gaussiana(tl, 0.37, 0.008), 0.0)
+        + np.where(onda_t, 0.3 * gaussiana(tl, 0.6, 0.05), 0.0)
+    ).sum(axis=0)
+
+    descricoes = np.full(ECG_AMOSTRAS, "Linha de Base", dtype=object)
+    descricoes[onda_p.any(axis=0)] = "Onda P"
+    descricoes[qrs.any(axis=0)] = "Complexo QRS"
+    descricoes[onda_t.any(axis=0)] = "Onda T"
+    return t, sinal, descricoes, cor
+
 # --- INICIALIZAÇÃO AUTOMÁTICA ---
 if load_csv("users", ["Username", "Password_Hash", "Role"]).empty:
     save_user("admin", "admin123", "admin")
@@ -91,15 +182,16 @@ if menu == "Monitoramento (Tempo Real)":
     placeholder = st.empty()
     
     with placeholder.container():
-        try:
-            df = pd.read_csv(FILES["history"])
-        except:
+        feed = get_history_feed()
+        avisos_vistos = feed.avisos
+        feed.atualizar()
+        pacientes_lista = feed.pacientes()
+        if not pacientes_lista:
             st.info("Aguardando dados do servidor...")
             st.stop()
             
-        if not df.empty:
+        if pacientes_lista:
             # Filtros
-            pacientes_lista = df["Paciente"].unique()
             if "paciente_selecionado" not in st.session_state:
                 st.session_state["paciente_selecionado"] = pacientes_lista[0]
             
@@ -109,37 +201,40 @@ if menu == "Monitoramento (Tempo Real)":
                 index=list(pacientes_lista).index(st.session_state["paciente_selecionado"]) if st.session_state["paciente_selecionado"] in pacientes_lista else 0
             )
             
-            # Dados
-            df_paciente = df[df["Paciente"] == st.session_state["paciente_selecionado"]].copy()
-            df_paciente['Data'] = pd.to_datetime(df_paciente['Data'])
-            df_paciente = df_paciente.sort_values(by='Data')
-
-            # Tratamento numérico
-            try:
-                df_paciente[['PA_Sys', 'PA_Dia']] = df_paciente['PA'].str.split('/', expand=True).astype(int)
-                df_paciente['SpO2_Num'] = df_paciente['SpO2'].str.replace('%', '').astype(int)
-            except:
-                pass 
+            # Dados (já ordenados por Data e com PA_Sys, PA_Dia e SpO2_Num numéricos)
+            df_paciente = feed.eventos(st.session_state["paciente_selecionado"])
 
             # --- GRÁFICOS DE TENDÊNCIA (ZOOM) ---
-            janela_zoom = 50  
+            # Períodos longos usam os rollups por minuto/hora/dia do banco (poucas centenas de pontos),
+            # em vez de carregar e desenhar todos os eventos.
+            periodo = st.sidebar.selectbox("🔎 Período das tendências:", list(PERIODOS_TENDENCIA))
+            resolucao, horas = PERIODOS_TENDENCIA[periodo]
+            if resolucao is None:
+                tendencia = df_paciente[['Data', 'PA_Sys', 'PA_Dia', 'SpO2_Num']].tail(JANELA_EVENTOS)
+                tendencia = tendencia.assign(SpO2_Min=tendencia['SpO2_Num'])
+            else:
+                # A janela termina no último evento (o relógio pode ter ficado offline)
+                fim = df_paciente['Data'].iloc[-1]
+                inicio = (fim - pd.Timedelta(hours=horas)).strftime("%Y-%m-%d %H:%M:%S") if horas else None
+                tendencia = get_history_store().rollup(
+                    st.session_state["paciente_selecionado"], resolucao, inicio=inicio)
 
             col1, col2 = st.columns(2)
             with col1:
                 st.markdown("##### 🩸 Pressão Arterial (mmHg)")
                 # Gráfico de Linha com Zoom
                 st.line_chart(
-                    df_paciente[['Data', 'PA_Sys', 'PA_Dia']].tail(janela_zoom).set_index('Data'), 
+                    tendencia[['Data', 'PA_Sys', 'PA_Dia']].set_index('Data'), 
                     height=200, 
                     color=["#FF5733", "#33FF57"]
                 )
             with col2:
                 st.markdown("##### 🫁 Saturação de O₂ (%)")
-                # Gráfico de Linha com Zoom
+                # Média e mínima do período (a queda de SpO2 não some na média)
                 st.line_chart(
-                    df_paciente[['Data', 'SpO2_Num']].tail(janela_zoom).set_index('Data'), 
+                    tendencia[['Data', 'SpO2_Num', 'SpO2_Min']].set_index('Data'),
                     height=200, 
-                    color="#33C1FF"
+                    color=["#33C1FF", "#1F4E79"]
                 )
 
             st.markdown("---")
@@ -149,6 +244,7 @@ if menu == "Monitoramento (Tempo Real)":
             
             ultimo = df_paciente.iloc[-1]
             status_ecg = ultimo['ECG']
+            ritmo = classificar_ritmo(ultimo['Ritmo'])
 
             col_info, col_img = st.columns([1, 2])
             
@@ -156,9 +252,9 @@ if menu == "Monitoramento (Tempo Real)":
                 st.info(f"🕒 **Data:** {ultimo['Data'].strftime('%d/%m/%Y %H:%M:%S')}")
                 
                 # ... (seus ifs de status continuam aqui) ...
-                if "PERIGO" in status_ecg or "VENTRICULAR" in status_ecg:
+                if ritmo.perigo:
                     st.error(f"🚨 **STATUS:** {status_ecg}")
-                elif "Arritmia" in status_ecg:
+                elif ritmo in (RhythmClass.S, RhythmClass.F):
                     st.warning(f"⚠️ **STATUS:** {status_ecg}")
                 else:
                     st.success(f"✅ **STATUS:** {status_ecg}")
@@ -169,70 +265,55 @@ if menu == "Monitoramento (Tempo Real)":
                 
                 # Usamos um 'expander' para o texto longo não poluir o layout
                 # expanded=True deixa ele aberto por padrão se for Perigo
-                abrir_automaticamente = ("PERIGO" in status_ecg)
+                abrir_automaticamente = ritmo.perigo
                 
                 with st.expander("Ler Parecer Clínico Completo", expanded=abrir_automaticamente):
                     # st.write interpreta as quebras de linha melhor que st.caption
-                    st.write(ultimo['Analise_IA'])
+                    if pd.notna(ultimo['Analise_IA']):
+                        st.write(ultimo['Analise_IA'])
+                    else:
+                        st.caption("⏳ Análise da IA em processamento...")
 
             with col_img:
                 # --- LÓGICA PLOTLY (INTERATIVA) ---
-                t = np.linspace(0, 4, 1000)
-                sinal = np.zeros_like(t)
-                descricoes = ["Linha de Base"] * 1000
-
-                def adicionar_batimento(t_local, inicio_idx):
-                    if t_local < 0 or t_local > 0.8: return 0.0
-                    y = 0.0
-                    if 0.05 < t_local < 0.15: 
-                        y += 0.15 * np.exp(-(t_local - 0.1)**2 / (2 * 0.03**2))
-                        if 0 <= inicio_idx + int(t_local*250) < 1000: descricoes[inicio_idx + int(t_local*250)] = "Onda P"
-                    elif 0.3 < t_local < 0.4:
-                        y -= 0.15 * np.exp(-(t_local - 0.33)**2 / (2 * 0.008**2))
-                        y += 1.2 * np.exp(-(t_local - 0.35)**2 / (2 * 0.01**2))
-                        y -= 0.25 * np.exp(-(t_local - 0.37)**2 / (2 * 0.008**2))
-                        if 0 <= inicio_idx + int(t_local*250) < 1000: descricoes[inicio_idx + int(t_local*250)] = "Complexo QRS"
-                    elif 0.5 < t_local < 0.7:
-                        y += 0.3 * np.exp(-(t_local - 0.6)**2 / (2 * 0.05**2))
-                        if 0 <= inicio_idx + int(t_local*250) < 1000: descricoes[inicio_idx + int(t_local*250)] = "Onda T"
-                    return y
-
-                cor_linha = "#00FF00"
-                
-                if "PERIGO" in status_ecg or "VENTRICULAR" in status_ecg:
-                    sinal = np.sin(2*np.pi*5*t) + np.sin(2*np.pi*12*t)*0.5 + np.random.normal(0, 0.1, 1000)
-                    descricoes = ["Fibrilação Ventricular"] * 1000
-                    cor_linha = "#FF0000"
-                elif "Arritmia" in status_ecg:
-                    batimentos = [0.2, 1.2, 3.2]
-                    for b in batimentos:
-                        for i, time_val in enumerate(t):
-                            sinal[i] += adicionar_batimento(time_val - b, i)
-                    cor_linha = "#FFA500"
-                else:
-                    batimentos = [0.2, 1.2, 2.2, 3.2]
-                    for b in batimentos:
-                        for i, time_val in enumerate(t):
-                            sinal[i] += adicionar_batimento(time_val - b, i)
+                # Se o relógio enviou a onda do evento, mostra o ECG real (decimado no servidor);
+                # senão, o template pronto (e cacheado) da classe de ritmo.
+                onda = get_waveform_store().janela(int(ultimo['id']), pontos=ECG_PONTOS_TELA)
+                cor_linha = gerar_ecg_sintetico(classe_ritmo(ritmo))[3]
 
                 fig = go.Figure()
-                fig.add_trace(go.Scatter(
-                    x=t, y=sinal, mode='lines', name='ECG',
-                    line=dict(color=cor_linha, width=2),
-                    text=descricoes,
-                    hovertemplate='%{text}<br>Voltagem: %{y:.2f}mV<extra></extra>'
-                ))
+                if onda is not None:
+                    fig.add_trace(go.Scatter(
+                        x=onda["t"], y=onda["mv"], mode='lines', name='ECG',
+                        line=dict(color=cor_linha, width=1.5),
+                        hovertemplate='t = %{x:.2f}s<br>Voltagem: %{y:.2f}mV<extra></extra>'
+                    ))
+                    fig.add_vline(x=0, line=dict(color="white", dash="dash"))  # Instante do evento
+                    titulo = f"ECG do Evento (Caixa Preta, {onda['total_amostras'] / onda['fs']:.0f}s)"
+                    eixo_x = dict(showgrid=True, gridcolor='green', title="s (0 = evento)")
+                    eixo_y = dict(showgrid=True, gridcolor='green')
+                else:
+                    t, sinal, descricoes, cor_linha = gerar_ecg_sintetico(classe_ritmo(ritmo))
+                    fig.add_trace(go.Scatter(
+                        x=t, y=sinal, mode='lines', name='ECG',
+                        line=dict(color=cor_linha, width=2),
+                        text=descricoes,
+                        hovertemplate='%{text}<br>Voltagem: %{y:.2f}mV<extra></extra>'
+                    ))
+                    titulo = "Monitoramento Eletrocardiográfico (Lead II)"
+                    eixo_x = dict(showgrid=True, gridcolor='green', range=[0, 4])
+                    eixo_y = dict(showgrid=True, gridcolor='green', range=[-1.5, 2.0])
                 fig.update_layout(
-                    title="Monitoramento Eletrocardiográfico (Lead II)",
+                    title=titulo,
                     plot_bgcolor="black", paper_bgcolor="#0e1117",
-                    xaxis=dict(showgrid=True, gridcolor='green', range=[0, 4]),
-                    yaxis=dict(showgrid=True, gridcolor='green', range=[-1.5, 2.0]),
+                    xaxis=eixo_x, yaxis=eixo_y,
                     margin=dict(l=40, r=20, t=40, b=40), height=350
                 )
                 st.plotly_chart(fig, use_container_width=True)
 
     if auto_refresh:
-        time.sleep(2)
+        # Espera até 2 s, mas redesenha na hora se a API avisar de um evento novo
+        feed.esperar(avisos_vistos, 2)
         st.rerun()
 
 # ==============================================================================
@@ -248,8 +329,7 @@ elif menu == "Cadastro de Pacientes":
             if nome_pac and tel_pac:
                 save_patient(nome_pac, tel_pac)
                 st.success("Salvo!")
-    if os.path.exists(FILES["patients"]):
-        st.dataframe(pd.read_csv(FILES["patients"]), use_container_width=True)
+    st.dataframe(get_patient_registry().all()[COLUNAS_PACIENTE], use_container_width=True)
 
 # ==============================================================================
 # ABA 3: GESTÃO
@@ -0,0 +1,252 @@
+"""
+Dataset de batimentos do MIT-BIH em disco (janelas de 360 amostras + rótulos AAMI),
+para o treino e a avaliação começarem em segundos em vez de re-segmentar tudo.
+
+Uso:
+    python dataset_mitbih.py --dados mit-bih-data                 # gera em mitbih_dataset/
+    python dataset_mitbih.py --dados mit-bih-data --workers 8 --forcar
+
+No notebook:
+    from dataset_mitbih import carregar_dataset, dividir, lotes
+    ds = carregar_dataset()                    # X: memmap (N, 360) float32, y: (N,) int8
+    treino, teste = dividir(ds.y)              # mesma divisão do train_test_split do notebook
+    for X, y in lotes(ds.X, ds.y, treino): ...
+
+Os registros são segmentados em paralelo (um processo por registro) com a MESMA
+regra do notebook (ecg_segmentation.segmentar_registro_anotado). Cada processo
+escreve direto na sua fatia do X.npy (np.lib.format.open_memmap). Antes disso,
+uma contagem rápida só com as anotações define as fatias.
+
+Cada versão fica em mitbih_dataset/<impressão>/ com X.npy, y.npy, registro.npy,
+pico.npy e manifest.json. A impressão digital vem do conteúdo dos arquivos dos
+registros, dos parâmetros e da VERSAO_DATASET. Se nada mudou, o build é pulado.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import ecg_segmentation
+from ecg_segmentation import AAMI_CLASSES, MEIA_JANELA, picos_validos
+
+# Tenta importar o wfdb (leitura dos registros); sem ele, só dá para carregar um dataset já gerado
+try:
+    import wfdb
+    WFDB_INSTALLED = True
+except ImportError:
+    WFDB_INSTALLED = False
+
+# scikit-learn só para o dividir() (reproduz o train_test_split do notebook)
+try:
+    from sklearn.model_selection import train_test_split
+    SKLEARN_INSTALLED = True
+except ImportError:
+    SKLEARN_INSTALLED = False
+
+DADOS_DIR = "mit-bih-data"  # Pasta do wfdb.dl_database('mitdb', ...) do notebook
+SAIDA_DIR = "mitbih_dataset"
+ATUAL_FILE = "ATUAL"  # Nome da versão mais recente gerada nessa pasta
+VERSAO_DATASET = 1  # Mude quando a segmentação mudar (força um build novo)
+CANAL = 0  # MLII, igual ao notebook
+CLASSES = ["N", "S", "V", "F", "Q"]
+
+# Mesma lista de pacientes do notebook de treino
+PACIENTES = [
+    "100", "101", "102", "103", "104", "105", "106", "107", "108", "109", "111", "112", "113",
+    "114", "115", "116", "117", "118", "119", "121", "122", "123", "124", "200", "201", "202",
+    "203", "205", "207", "208", "209", "210", "212", "213", "214", "215", "217", "219", "220",
+    "221", "222", "223", "228", "230", "231", "232", "233", "234",
+]
+
+Dataset = namedtuple("Dataset", "X y registro pico manifesto pasta")
+
+
+# --- IMPRESSÃO DIGITAL DAS ENTRADAS ---
+def _hash_arquivo(caminho, bloco=1 << 20):
+    h = hashlib.sha1()
+    with open(caminho, "rb") as f:
+        for parte in iter(lambda: f.read(bloco), b""):
+            h.update(parte)
+    return h.hexdigest()
+
+
+def impressao_digital(dados_dir, pacientes, meia_janela=MEIA_JANELA):
+    """Hash dos arquivos .dat/.hea/.atr de cada registro + parâmetros da segmentação."""
+    h = hashlib.sha1(json.dumps({
+        "versao": VERSAO_DATASET,
+        "meia_janela": meia_janela,
+        "canal": CANAL,
+        "aami": AAMI_CLASSES,
+        "pacientes": list(pacientes),
+    }, sort_keys=True).encode("utf-8"))
+    for paciente in pacientes:
+        for ext in ("hea", "dat", "atr"):
+            caminho = os.path.join(dados_dir, f"{paciente}.{ext}")
+            if not os.path.exists(caminho):
+                raise FileNotFoundError(f"Registro incompleto: {caminho} (baixe com wfdb.dl_database('mitdb', ...))")
+            h.update(_hash_arquivo(caminho).encode("ascii"))
+    return h.hexdigest()[:16]
+
+
+# --- SEGMENTAÇÃO (processos do pool) ---
+def _contar(args):
+    """Nº de janelas do registro, só com as anotações e o tamanho do sinal (sem ler o .dat)."""
+    dados_dir, paciente, meia_janela = args
+    caminho = os.path.join(dados_dir, paciente)
+    n_amostras = wfdb.rdheader(caminho).sig_len
+    anotacao = wfdb.rdann(caminho, "atr")
+    simbolos = np.asarray(anotacao.symbol)
+    usar = np.isin(simbolos, list(AAMI_CLASSES)) & picos_validos(np.asarray(anotacao.sample), n_amostras, meia_janela)
+    return int(usar.sum())
+
+
+def _segmentar(args):
+    """Segmenta um registro direto na fatia [inicio, inicio + n) dos arrays em disco."""
+    dados_dir, pasta, paciente, inicio, n, meia_janela = args
+    caminho = os.path.join(dados_dir, paciente)
+    sinal = wfdb.rdrecord(caminho, channels=[CANAL]).p_signal[:, 0]
+    anotacao = wfdb.rdann(caminho, "atr")
+
+    X = np.load(os.path.join(pasta, "X.npy"), mmap_mode="r+")
+    y = np.load(os.path.join(pasta, "y.npy"), mmap_mode="r+")
+    registro = np.load(os.path.join(pasta, "registro.npy"), mmap_mode="r+")
+    pico = np.load(os.path.join(pasta, "pico.npy"), mmap_mode="r+")
+
+    _, rotulos, usados = ecg_segmentation.segmentar_registro_anotado(
+        sinal, anotacao.sample, anotacao.symbol, meia_janela, out=X[inicio:inicio + n]
+    )
+    if len(rotulos) != n:
+        raise RuntimeError(f"Registro {paciente}: {len(rotulos)} janelas, esperadas {n}")
+    y[inicio:inicio + n] = rotulos
+    registro[inicio:inicio + n] = int(paciente)
+    pico[inicio:inicio + n] = usados
+    for arr in (X, y, registro, pico):
+        arr.flush()
+    return paciente, np.bincount(rotulos, minlength=len(CLASSES)).tolist()
+
+
+# --- BUILD ---
+def construir(dados_dir=DADOS_DIR, saida=SAIDA_DIR, pacientes=PACIENTES, workers=None,
+              meia_janela=MEIA_JANELA, forcar=False):
+    """Gera (ou reaproveita) a versão do dataset para essas entradas. Devolve a pasta da versão."""
+    if not WFDB_INSTALLED:
+        raise RuntimeError("wfdb não instalado (pip install wfdb).")
+    inicio_total = time.perf_counter()
+    versao = impressao_digital(dados_dir, pacientes, meia_janela)
+    pasta = os.path.join(saida, versao)
+    if os.path.exists(os.path.join(pasta, "manifest.json")) and not forcar:
+        print(f"✅ Dataset {versao} já existe (entradas iguais). Nada a fazer.")
+        _marcar_atual(saida, versao)
+        return pasta
+
+    tmp = pasta + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # 1. Contagem (só anotações): define a fatia de cada registro
+        contagens = list(pool.map(_contar, [(dados_dir, p, meia_janela) for p in pacientes]))
+        offsets = np.concatenate([[0], np.cumsum(contagens)]).astype(int)
+        total = int(offsets[-1])
+        print(f"🔢 {total} batimentos em {len(pacientes)} registros")
+
+        # 2. Arrays em disco com o tamanho final
+        janela = 2 * meia_janela
+        for nome, dtype, forma in (("X", np.float32, (total, janela)), ("y", np.int8, (total,)),
+                                   ("registro", np.int16, (total,)), ("pico", np.int64, (total,))):
+            np.lib.format.open_memmap(os.path.join(tmp, f"{nome}.npy"), mode="w+", dtype=dtype, shape=forma).flush()
+
+        # 3. Segmentação em paralelo, cada registro na sua fatia
+        tarefas = [(dados_dir, tmp, p, int(offsets[i]), contagens[i], meia_janela) for i, p in enumerate(pacientes)]
+        por_registro = {}
+        for paciente, classes in pool.map(_segmentar, tarefas):
+            por_registro[paciente] = classes
+            print(f"📂 Registro {paciente}: {sum(classes)} batimentos")
+
+    manifesto = {
+        "version": versao,
+        "dataset_version": VERSAO_DATASET,
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "beats": total,
+        "window": janela,
+        "channel": CANAL,
+        "classes": CLASSES,
+        "class_counts": np.sum(list(por_registro.values()), axis=0).astype(int).tolist(),
+        "records": {
+            p: {"offset": int(offsets[i]), "beats": contagens[i], "class_counts": por_registro[p]}
+            for i, p in enumerate(pacientes)
+        },
+    }
+    with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, indent=2)
+    shutil.rmtree(pasta, ignore_errors=True)
+    os.replace(tmp, pasta)  # A versão só aparece completa
+    _marcar_atual(saida, versao)
+    print(f"💾 Dataset {versao}: {total} batimentos em {pasta} ({time.perf_counter() - inicio_total:.1f}s)")
+    return pasta
+
+
+def _marcar_atual(saida, versao):
+    with open(os.path.join(saida, ATUAL_FILE), "w", encoding="utf-8") as f:
+        f.write(versao)
+
+
+# --- LEITURA (treino e avaliação) ---
+def carregar_dataset(saida=SAIDA_DIR, versao=None):
+    """Abre a versão (padrão: a última gerada) como memmaps somente leitura, sem carregar na RAM."""
+    if versao is None:
+        with open(os.path.join(saida, ATUAL_FILE), encoding="utf-8") as f:
+            versao = f.read().strip()
+    pasta = os.path.join(saida, versao)
+    with open(os.path.join(pasta, "manifest.json"), encoding="utf-8") as f:
+        manifesto = json.load(f)
+    abrir = lambda nome: np.load(os.path.join(pasta, f"{nome}.npy"), mmap_mode="r")
+    return Dataset(abrir("X"), abrir("y"), abrir("registro"), abrir("pico"), manifesto, pasta)
+
+
+def dividir(y, test_size=0.2, seed=42):
+    """
+    Índices (treino, teste) do train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+    do notebook: com os batimentos na mesma ordem (PACIENTES), é exatamente a mesma divisão,
+    então o "teste" são os batimentos que os modelos não viram no treino.
+    """
+    if not SKLEARN_INSTALLED:
+        raise RuntimeError("scikit-learn não instalado (pip install scikit-learn).")
+    y = np.asarray(y)
+    return train_test_split(np.arange(len(y)), test_size=test_size, random_state=seed, stratify=y)
+
+
+def lotes(X, y, indices=None, tamanho=256, embaralhar=True, seed=None):
+    """
+    Gera (X_lote, y_lote) lendo só as linhas do lote do memmap.
+    Os índices de cada lote são ordenados: leitura quase sequencial no disco.
+    """
+    indices = np.arange(len(y)) if indices is None else np.asarray(indices)
+    if embaralhar:
+        indices = np.random.default_rng(seed).permutation(indices)
+    for i in range(0, len(indices), tamanho):
+        lote = np.sort(indices[i:i + tamanho])
+        yield np.asarray(X[lote], dtype=np.float32)[..., np.newaxis], np.asarray(y[lote], dtype=np.int64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera o dataset de batimentos do MIT-BIH em .npy (memmap).")
+    parser.add_argument("--dados", default=DADOS_DIR, help="Pasta com os .dat/.hea/.atr do MIT-BIH")
+    parser.add_argument("--saida", default=SAIDA_DIR)
+    parser.add_argument("--pacientes", nargs="+", default=PACIENTES)
+    parser.add_argument("--workers", type=int, default=None, help="Processos (padrão: nº de CPUs)")
+    parser.add_argument("--forcar", action="store_true", help="Gera de novo mesmo com as entradas iguais")
+    args = parser.parse_args()
+
+    pasta = construir(args.dados, args.saida, args.pacientes, args.workers, forcar=args.forcar)
+    ds = carregar_dataset(args.saida, os.path.basename(pasta))
+    contagem = dict(zip(CLASSES, ds.manifesto["class_counts"]))
+    print(f"📊 X {ds.X.shape} {ds.X.dtype} | classes: {contagem}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+Segmentação de ECG em janelas de batimento (caminho único para treino e inferência).
+
+- normalizar_registro: MinMax do registro inteiro, igual ao MinMaxScaler do notebook.
+- DetectorPicosR: detector de picos R em streaming (blocos de qualquer tamanho, com estado).
+- extrair_janelas: recorte das janelas por stride (sem cópia) direto num array pré-alocado.
+- segmentar_registro_anotado: reproduz a segmentação do notebook (anotações do MIT-BIH + AAMI).
+
+Uso rápido (mede a velocidade em relação ao tempo real):
+    python ecg_segmentation.py ../Mobile_app/HeartGuard/app/src/main/assets/dados_ecg_simulados.txt
+"""
+import sys
+import time
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+FS = 360  # Frequência do MIT-BIH (e dos modelos TFLite)
+MEIA_JANELA = 180  # 180 amostras antes e 180 depois do pico R = 360 (entrada da CNN)
+
+# Mapa dos símbolos do MIT-BIH para as 5 classes AAMI (igual ao notebook)
+AAMI_CLASSES = {
+    'N': 0, 'L': 0, 'R': 0, 'e': 0, 'j': 0,  # Normal
+    'A': 1, 'a': 1, 'J': 1, 'S': 1,          # S (Supraventricular)
+    'V': 2, 'E': 2,                          # V (Ventricular)
+    'F': 3,                                  # F (Fusão)
+    '/': 4, 'f': 4, 'Q': 4                   # Q (Desconhecido/Paced)
+}
+
+
+def normalizar_registro(sinal):
+    """
+    Normalização MinMax do registro inteiro, igual ao MinMaxScaler do notebook
+    (quando o sinal é constante o sklearn usa escala 1, então o resultado é 0).
+    """
+    sinal = np.asarray(sinal, dtype=np.float64)
+    if sinal.size == 0:
+        return sinal
+    return normalizar_com_limites(sinal, sinal.min(), sinal.max())
+
+
+def normalizar_com_limites(x, minimo, maximo):
+    """
+    Aplica a MinMax com limites já conhecidos. Como a MinMax é afim, normalizar as
+    janelas com o min/max do registro dá exatamente o mesmo que normalizar o registro
+    antes de recortar (é o que o modo streaming usa no final).
+    """
+    amplitude = maximo - minimo
+    if amplitude == 0:
+        amplitude = 1.0
+    return (np.asarray(x, dtype=np.float64) - minimo) / amplitude
+
+
+def reamostrar(sinal, fs_origem, fs_destino=FS):
+    """Reamostragem linear simples (ex.: 250 Hz do relógio -> 360 Hz do modelo)."""
+    sinal = np.asarray(sinal, dtype=np.float64)
+    if fs_origem == fs_destino:
+        return sinal
+    n_destino = int(round(len(sinal) * fs_destino / fs_origem))
+    t_origem = np.arange(len(sinal)) / fs_origem
+    t_destino = np.arange(n_destino) / fs_destino
+    return np.interp(t_destino, t_origem, sinal)
+
+
+class DetectorPicosR:
+    """
+    Detector de picos R estilo Pan-Tompkins (derivada, quadrado, integração em
+    janela móvel e limiar adaptativo) que recebe o sinal em blocos.
+
+    Cada bloco é processado de forma vetorizada; entre blocos o detector guarda só
+    o estado necessário: as últimas amostras (contexto da integração), o nível do
+    sinal (SPKI) e o último pico ainda não confirmado pelo período refratário.
+    Os índices devolvidos são absolutos (desde o início do stream).
+    """
+
+    def __init__(self, fs=FS, aprendizado=2.0, passo=1.0):
+        self.fs = fs
+        self.janela_int = max(1, int(0.150 * fs))
+        self.refratario = int(0.2 * fs)
+        self.aprendizado = int(aprendizado * fs)
+        # As decisões são tomadas em passos fixos (1 s): o resultado é o mesmo
+        # qualquer que seja o tamanho dos blocos recebidos (inclusive um bloco só).
+        self.passo = max(1, int(passo * fs))
+        self._buffer = np.zeros(0, dtype=np.float64)
+        self._inicio = 0            # Índice absoluto do 1º elemento do buffer
+        self._processado = 0        # Índice absoluto até onde os passos já rodaram
+        self._consumido_ate = 0     # Regiões que começam antes disso já foram tratadas
+        self._spki = None           # Nível (energia integrada) dos QRS recentes
+        self._ultimo_qrs = 0        # Índice absoluto da última região detectada
+        self._candidato = None      # (índice absoluto, amplitude) ainda não emitido
+
+    def processar(self, bloco):
+        """Adiciona um bloco de amostras e devolve os picos confirmados até agora."""
+        bloco = np.asarray(bloco, dtype=np.float64)
+        self._buffer = np.concatenate([self._buffer, bloco]) if len(self._buffer) else bloco.copy()
+        emitidos = []
+        while self._inicio + len(self._buffer) - self._processado >= self.passo:
+            self._processado += self.passo
+            emitidos.extend(self._detectar(self._processado - self._inicio, final=False))
+        return np.asarray(emitidos, dtype=np.int64)
+
+    def finalizar(self):
+        """Fim do stream: processa o que sobrou e emite o último pico pendente."""
+        self._processado = self._inicio + len(self._buffer)
+        return np.asarray(self._detectar(len(self._buffer), final=True), dtype=np.int64)
+
+    def _detectar(self, n, final):
+        buf = self._buffer[:n]
+        emitidos = []
+        if len(buf) < 2 or (self._spki is None and len(buf) < self.aprendizado and not final):
+            return emitidos
+
+        derivada = np.diff(buf, prepend=buf[0])
+        integrada = np.convolve(derivada ** 2, np.ones(self.janela_int) / self.janela_int, mode="same")
+        if self._spki is None:  # Fase de aprendizado: nível inicial do sinal
+            self._spki = float(np.percentile(integrada, 99))
+
+        acima = integrada > 0.3 * self._spki
+        bordas = np.diff(acima.astype(np.int8), prepend=0, append=0)
+        inicios = np.flatnonzero(bordas == 1)
+        fins = np.flatnonzero(bordas == -1)
+
+        # Só regiões completas (longe da borda do buffer, onde a integração ainda vai mudar)
+        limite = len(buf) if final else len(buf) - self.janela_int
+        inicio_pendente = None
+        for i, f in zip(inicios, fins):
+            if self._inicio + i < self._consumido_ate:
+                continue
+            if f > limite:
+                inicio_pendente = i
+                break
+            p = i + int(np.argmax(buf[i:f]))
+            self._spki = 0.875 * self._spki + 0.125 * float(integrada[i:f].max())
+            self._aceitar(self._inicio + p, buf[p], emitidos)
+            self._consumido_ate = self._inicio + f
+            self._ultimo_qrs = self._inicio + p
+
+        fim_abs = self._inicio + limite
+        # Pico pendente confirmado quando o período refratário já passou
+        if self._candidato is not None and (final or self._candidato[0] + self.refratario <= fim_abs):
+            emitidos.append(self._candidato[0])
+            self._candidato = None
+        # Sinal sem QRS por muito tempo (troca de eletrodo/ganho): reduz o nível
+        if fim_abs - self._ultimo_qrs > 2 * self.fs:
+            self._spki *= 0.5
+            self._ultimo_qrs = fim_abs
+
+        # Descarta o que não é mais necessário (mantém contexto para a integração)
+        if inicio_pendente is None:
+            self._consumido_ate = max(self._consumido_ate, fim_abs)
+            corte = limite - 2 * self.janela_int
+        else:
+            corte = inicio_pendente - 2 * self.janela_int
+        if corte > 0 and not final:
+            self._buffer = self._buffer[corte:]
+            self._inicio += corte
+        return emitidos
+
+    def pico_mais_antigo_possivel(self):
+        """Nenhum pico emitido daqui em diante será anterior a este índice absoluto."""
+        if self._candidato is not None:
+            return min(self._candidato[0], self._inicio)
+        return self._inicio
+
+    def _aceitar(self, pico, amplitude, emitidos):
+        # Período refratário de 200 ms: entre picos próximos fica o maior
+        if self._candidato is not None:
+            if pico - self._candidato[0] < self.refratario:
+                if amplitude > self._candidato[1]:
+                    self._candidato = (pico, amplitude)
+                return
+            emitidos.append(self._candidato[0])
+        self._candidato = (pico, amplitude)
+
+
+def detectar_picos_r(sinal, fs=FS):
+    """Picos R de um registro inteiro (mesmo código do streaming, num único bloco)."""
+    sinal = np.asarray(sinal, dtype=np.float64)
+    if len(sinal) < fs // 2:
+        return np.zeros(0, dtype=np.int64)
+    detector = DetectorPicosR(fs)
+    return np.concatenate([detector.processar(sinal), detector.finalizar()])
+
+
+def picos_validos(picos, n_amostras, meia_janela=MEIA_JANELA):
+    """Mesma regra de borda do notebook: pico > meia_janela e pico < len - meia_janela."""
+    picos = np.asarray(picos, dtype=np.int64)
+    return (picos > meia_janela) & (picos < n_amostras - meia_janela)
+
+
+def extrair_janelas(sinal, picos, meia_janela=MEIA_JANELA, out=None):
+    """
+    Recorta as janelas [pico - meia_janela, pico + meia_janela) dos picos válidos.
+
+    Usa uma visão por stride do sinal (sliding_window_view, sem cópia) e copia só as
+    linhas dos picos direto para `out` (pré-alocado, ex.: um memmap) se for passado.
+    Devolve (janelas (N, 2*meia_janela), picos usados).
+    """
+    sinal = np.asarray(sinal)
+    picos = np.asarray(picos, dtype=np.int64)
+    validos = picos[picos_validos(picos, len(sinal), meia_janela)]
+    if out is None:
+        out = np.empty((len(validos), 2 * meia_janela), dtype=np.float32)
+    elif len(out) != len(validos):
+        raise ValueError(f"out tem {len(out)} linhas, mas há {len(validos)} picos válidos")
+    if len(validos):
+        visao = sliding_window_view(sinal, 2 * meia_janela)
+        np.take(visao, validos - meia_janela, axis=0, out=out, mode="clip") if out.dtype == visao.dtype \
+            else np.copyto(out, visao[validos - meia_janela], casting="unsafe")
+    return out, validos
+
+
+def segmentar_registro(sinal, fs=FS, meia_janela=MEIA_JANELA):
+    """Inferência: normaliza o registro, detecta os picos e recorta as janelas."""
+    sinal = reamostrar(sinal, fs)
+    picos = detectar_picos_r(sinal)
+    return extrair_janelas(normalizar_registro(sinal), picos, meia_janela)
+
+
+def segmentar_registro_anotado(sinal, picos, simbolos, meia_janela=MEIA_JANELA, out=None):
+    """
+    Treino: reproduz o notebook (MinMax do registro, picos das anotações do MIT-BIH,
+    só símbolos do mapa AAMI e a mesma regra de borda).
+    Devolve (janelas, rótulos AAMI, picos usados).
+    """
+    sinal = normalizar_registro(sinal)
+    picos = np.asarray(picos, dtype=np.int64)
+    simbolos = np.asarray(simbolos)
+    no_mapa = np.isin(simbolos, list(AAMI_CLASSES))
+    usar = no_mapa & picos_validos(picos, len(sinal), meia_janela)
+    rotulos = np.array([AAMI_CLASSES[s] for s in simbolos[usar]], dtype=np.int64)
+    janelas, usados = extrair_janelas(sinal, picos[usar], meia_janela, out=out)
+    return janelas, rotulos, usados
+
+
+class SegmentadorStreaming:
+    """
+    Segmentação em tempo real: recebe blocos do sinal bruto e devolve as janelas
+    (brutas) assim que o pico e as 180 amostras seguintes chegam.
+    Guarda o min/max do registro para a normalização final (normalizar_janelas),
+    que fica idêntica à do notebook.
+    """
+
+    def __init__(self, fs=FS, meia_janela=MEIA_JANELA):
+        self.meia_janela = meia_janela
+        self.detector = DetectorPicosR(fs)
+        self.minimo = np.inf
+        self.maximo = -np.inf
+        self._sinal = np.zeros(0, dtype=np.float64)
+        self._inicio = 0  # Índice absoluto do 1º elemento de _sinal
+        self._pendentes = np.zeros(0, dtype=np.int64)
+
+    def processar(self, bloco, final=False):
+        bloco = np.asarray(bloco, dtype=np.float64)
+        if len(bloco):
+            self.minimo = min(self.minimo, float(bloco.min()))
+            self.maximo = max(self.maximo, float(bloco.max()))
+            self._sinal = np.concatenate([self._sinal, bloco])
+        novos = self.detector.processar(bloco) if len(bloco) else np.zeros(0, dtype=np.int64)
+        if final:
+            novos = np.concatenate([novos, self.detector.finalizar()])
+        picos = np.concatenate([self._pendentes, novos])
+
+        fim_abs = self._inicio + len(self._sinal)
+        # Mesma borda de picos_validos: o pico precisa de MAIS de 180 amostras depois dele
+        prontos = picos[picos + self.meia_janela < fim_abs] if not final else picos
+        self._pendentes = picos[picos + self.meia_janela >= fim_abs] if not final else picos[:0]
+
+        # Picos no início do stream (sem 180 amostras antes) seguem a regra de borda do notebook
+        prontos = prontos[prontos > self.meia_janela]
+        prontos = prontos[prontos - self.meia_janela > self._inicio]
+        janelas, usados = extrair_janelas(self._sinal, prontos - self._inicio, self.meia_janela)
+        usados = usados + self._inicio
+
+        # Mantém só o necessário para os picos pendentes e os próximos
+        manter_desde = min(
+            [self.detector.pico_mais_antigo_possivel() - self.meia_janela - 1]
+            + [int(p) - self.meia_janela - 1 for p in self._pendentes]
+        )
+        corte = manter_desde - self._inicio
+        if corte > 0:
+            self._sinal = self._sinal[corte:]
+            self._inicio += corte
+        return janelas, usados
+
+    def finalizar(self):
+        return self.processar(np.zeros(0), final=True)
+
+    def normalizar_janelas(self, janelas):
+        return normalizar_com_limites(janelas, self.minimo, self.maximo).astype(np.float32)
+
+
+def main():
+    caminho = sys.argv[1]
+    bloco = int(sys.argv[2]) if len(sys.argv) > 2 else FS  # Tamanho do bloco (1 s)
+    sinal = np.loadtxt(caminho)
+    repeticoes = max(1, int(3600 * FS / len(sinal)))  # ~1 hora de sinal
+    sinal = np.tile(sinal, repeticoes)
+
+    inicio = time.perf_counter()
+    picos_lote = detectar_picos_r(sinal)
+    tempo_lote = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    seg = SegmentadorStreaming()
+    total = 0
+    for i in range(0, len(sinal), bloco):
+        total += len(seg.processar(sinal[i:i + bloco])[0])
+    total += len(seg.finalizar()[0])
+    tempo_stream = time.perf_counter() - inicio
+
+    duracao = len(sinal) / FS
+    print(f"Sinal: {duracao / 60:.1f} min ({len(sinal)} amostras)")
+    print(f"Lote:      {len(picos_lote)} picos em {tempo_lote:.2f}s ({duracao / tempo_lote:,.0f}x tempo real)")
+    print(f"Streaming: {total} janelas em {tempo_stream:.2f}s ({duracao / tempo_stream:,.0f}x tempo real, blocos de {bloco})")
+
+
+if __name__ == "__main__":
+    main()
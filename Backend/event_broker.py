@@ -0,0 +1,90 @@
+import asyncio
+import json
+import threading
+
+TODOS = "*"  # Canal com os eventos de todos os pacientes (dashboard/equipe médica)
+
+
+class Assinatura:
+    """Fila de um cliente (WebSocket ou SSE). Se o cliente ficar lento, descarta as mais antigas."""
+
+    def __init__(self, canais, max_fila):
+        self.canais = canais
+        self.fila = asyncio.Queue(maxsize=max_fila)
+        self.descartadas = 0
+
+    def _entregar(self, mensagem):
+        if self.fila.full():
+            self.fila.get_nowait()
+            self.descartadas += 1
+        self.fila.put_nowait(mensagem)
+
+    async def proxima(self, timeout):
+        """(tipo, json, alerta) da próxima mensagem, ou None se nada chegou em `timeout` segundos."""
+        try:
+            return await asyncio.wait_for(self.fila.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBroker:
+    """
+    Pub/sub dentro do processo da API, com um canal por paciente.
+
+    - publicar() pode ser chamado do event loop (rotas) ou das threads da fila de
+      trabalho (análise da IA pronta); nesse caso a entrega é agendada no loop.
+    - A mensagem é serializada UMA vez e o mesmo texto vai para todos os assinantes.
+    - Assinante parado custa só uma asyncio.Queue: milhares cabem num processo.
+    """
+
+    def __init__(self, max_fila=100):
+        self.max_fila = max_fila
+        self._canais = {}  # canal -> set de Assinatura
+        self._loop = None
+        self._thread_loop = None
+        self.publicadas = 0
+
+    def iniciar(self, loop):
+        self._loop = loop
+        self._thread_loop = threading.get_ident()
+
+    def assinar(self, canais):
+        """Cria a assinatura (chamar de dentro do event loop)."""
+        assinatura = Assinatura(tuple(canais), self.max_fila)
+        for canal in assinatura.canais:
+            self._canais.setdefault(canal, set()).add(assinatura)
+        return assinatura
+
+    def cancelar(self, assinatura):
+        for canal in assinatura.canais:
+            assinantes = self._canais.get(canal)
+            if assinantes is not None:
+                assinantes.discard(assinatura)
+                if not assinantes:
+                    del self._canais[canal]
+
+    def publicar(self, canal, tipo, dados):
+        if self._loop is None:
+            return
+        mensagem = (tipo, json.dumps(dados, ensure_ascii=False, default=str), bool(dados.get("alert")))
+        if threading.get_ident() == self._thread_loop:
+            self._distribuir(canal, mensagem)
+        else:
+            try:
+                self._loop.call_soon_threadsafe(self._distribuir, canal, mensagem)
+            except RuntimeError:
+                pass  # Loop já encerrado (shutdown)
+
+    def _distribuir(self, canal, mensagem):
+        self.publicadas += 1
+        for assinatura in self._canais.get(canal, set()) | self._canais.get(TODOS, set()):
+            assinatura._entregar(mensagem)
+
+    def stats(self):
+        assinaturas = set().union(*self._canais.values()) if self._canais else set()
+        return {
+            "channels": len(self._canais),
+            "subscribers": len(assinaturas),
+            "published": self.publicadas,
+            "dropped": sum(a.descartadas for a in assinaturas),
+        }
@@ -0,0 +1,113 @@
+import threading
+import time
+import urllib.request
+import pandas as pd
+
+
+class HistoryFeed:
+    """
+    Cópia em memória do histórico para o dashboard, atualizada de forma incremental.
+
+    - Lê só os eventos novos (id > último id visto) e as análises da IA que ficaram prontas.
+    - Uma instância por processo (st.cache_resource): N sessões abertas custam UMA leitura
+      a cada `intervalo` segundos, não uma leitura completa por sessão.
+    - PA e SpO2 já vêm do banco em colunas numéricas (PA_Sys, PA_Dia, SpO2_Num) e o ritmo em Ritmo.
+    - Com ouvir_api(), a API avisa (push) quando chega evento e o dashboard
+      atualiza na hora, sem esperar o próximo ciclo.
+    """
+
+    def __init__(self, store, intervalo=1.0, max_eventos_por_paciente=5000):
+        self.store = store
+        self.intervalo = intervalo
+        self.max_eventos_por_paciente = max_eventos_por_paciente
+        self.versao = 0  # Token de mudança: incrementa sempre que algo novo chega
+        self._ultimo_id = 0
+        self._ultima_leitura = 0.0
+        self._por_paciente = {}  # nome -> DataFrame ordenado por Data
+        self._pendentes = {}  # id do evento sem análise -> paciente
+        self._lock = threading.Lock()
+        self.avisos = 0  # Avisos de evento novo recebidos da API
+        self._cond_aviso = threading.Condition()
+
+    @staticmethod
+    def _parse(df):
+        df = df.copy()
+        df["Data"] = pd.to_datetime(df["Data"], errors="coerce")
+        return df
+
+    def atualizar(self):
+        """Busca o que mudou desde a última leitura (no máximo uma vez por intervalo)."""
+        with self._lock:
+            agora = time.time()
+            if agora - self._ultima_leitura < self.intervalo:
+                return self.versao
+            self._ultima_leitura = agora
+
+            mudou = False
+
+            # 1. Eventos novos
+            novos = self.store.since(self._ultimo_id)
+            if not novos.empty:
+                self._ultimo_id = int(novos["id"].max())
+                novos = self._parse(novos)
+                for paciente, df_novo in novos.groupby("Paciente", sort=False):
+                    atual = self._por_paciente.get(paciente)
+                    df = df_novo if atual is None else pd.concat([atual, df_novo], ignore_index=True)
+                    df = df.sort_values(by="Data", kind="stable").tail(self.max_eventos_por_paciente)
+                    self._por_paciente[paciente] = df.reset_index(drop=True)
+                for evento_id, paciente, analise in novos[["id", "Paciente", "Analise_IA"]].itertuples(index=False):
+                    if analise is None or pd.isna(analise):
+                        self._pendentes[int(evento_id)] = paciente
+                mudou = True
+
+            # 2. Análises da IA que ficaram prontas (preenchidas depois pela fila da API)
+            if self._pendentes:
+                prontas = self.store.analyses(list(self._pendentes))
+                for evento_id, analise in prontas.items():
+                    paciente = self._pendentes.pop(evento_id)
+                    df = self._por_paciente.get(paciente)
+                    if df is not None:
+                        df = df.copy()
+                        df.loc[df["id"] == evento_id, "Analise_IA"] = analise
+                        self._por_paciente[paciente] = df
+                    mudou = True
+
+            if mudou:
+                self.versao += 1
+            return self.versao
+
+    def avisar(self):
+        """Chegou evento novo na API: a próxima atualizar() lê o banco na hora."""
+        with self._cond_aviso:
+            self._ultima_leitura = 0.0
+            self.avisos += 1
+            self._cond_aviso.notify_all()
+
+    def esperar(self, avisos_vistos, timeout):
+        """Bloqueia até chegar um aviso depois de `avisos_vistos` (ou até o timeout)."""
+        with self._cond_aviso:
+            self._cond_aviso.wait_for(lambda: self.avisos != avisos_vistos, timeout)
+            return self.avisos
+
+    def pacientes(self):
+        return sorted(self._por_paciente)
+
+    def eventos(self, paciente):
+        """DataFrame (somente leitura) com os eventos do paciente, ordenados por Data."""
+        return self._por_paciente.get(paciente, pd.DataFrame())
+
+
+def ouvir_api(feed, url, reconectar=5.0):
+    """Thread que assina o SSE /events da API e avisa o feed a cada evento ou análise nova."""
+    def ouvir():
+        while True:
+            try:
+                with urllib.request.urlopen(url, timeout=60) as resposta:
+                    for linha in resposta:
+                        if linha.startswith(b"event:"):
+                            feed.avisar()
+            except Exception:
+                pass  # API fora do ar: o dashboard segue atualizando pelo intervalo
+            time.sleep(reconectar)
+
+    threading.Thread(target=ouvir, name="heartguard-push", daemon=True).start()
@@ -0,0 +1,458 @@
+import os
+import sqlite3
+import threading
+import pandas as pd
+from vitals import classificar_ritmo, parse_pressao, parse_spo2
+from metrics import span
+
+# Banco local do histórico (substitui o historico_pacientes.csv)
+DB_FILE = "heartguard.db"
+LEGACY_HISTORY_CSV = "historico_pacientes.csv"
+
+# Colunas "públicas" (mesmos nomes do CSV antigo, usados pelo dashboard e pela API)
+COLUNAS = ["Data", "Paciente", "ECG", "PA", "SpO2", "Local", "Analise_IA"]
+
+# Nome da coluna no banco -> nome público
+_MAPA_COLUNAS = {
+    "data": "Data",
+    "paciente": "Paciente",
+    "ecg": "ECG",
+    "pa": "PA",
+    "spo2": "SpO2",
+    "local": "Local",
+    "analise_ia": "Analise_IA",
+    "sistolica": "PA_Sys",
+    "diastolica": "PA_Dia",
+    "spo2_num": "SpO2_Num",
+    "ritmo": "Ritmo",
+}
+
+# Sinais vitais já convertidos na API (colunas acrescentadas por ALTER TABLE nos bancos antigos)
+_COLUNAS_VITAIS = {
+    "sistolica": "INTEGER",
+    "diastolica": "INTEGER",
+    "spo2_num": "INTEGER",
+    "ritmo": "TEXT",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS eventos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    data TEXT NOT NULL,
+    paciente TEXT NOT NULL,
+    ecg TEXT,
+    pa TEXT,
+    spo2 TEXT,
+    local TEXT,
+    analise_ia TEXT,
+    timestamp_dispositivo TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_eventos_paciente_data ON eventos (paciente, data);
+CREATE INDEX IF NOT EXISTS idx_eventos_data ON eventos (data);
+CREATE INDEX IF NOT EXISTS idx_eventos_paciente_ts ON eventos (paciente, timestamp_dispositivo);
+CREATE INDEX IF NOT EXISTS idx_eventos_paciente_id ON eventos (paciente, id);
+
+-- Agregados de PA/SpO2 por minuto, hora e dia (mantidos na ingestão)
+CREATE TABLE IF NOT EXISTS rollups (
+    paciente TEXT NOT NULL,
+    resolucao TEXT NOT NULL,
+    inicio TEXT NOT NULL,
+    n_pa INTEGER NOT NULL DEFAULT 0,
+    sys_min REAL, sys_soma REAL NOT NULL DEFAULT 0, sys_max REAL,
+    dia_min REAL, dia_soma REAL NOT NULL DEFAULT 0, dia_max REAL,
+    n_spo2 INTEGER NOT NULL DEFAULT 0,
+    spo2_min REAL, spo2_soma REAL NOT NULL DEFAULT 0, spo2_max REAL,
+    PRIMARY KEY (paciente, resolucao, inicio)
+) WITHOUT ROWID;
+-- Último id de evento já agregado (o backfill continua daqui)
+CREATE TABLE IF NOT EXISTS rollups_estado (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    ate_id INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO rollups_estado (id, ate_id) VALUES (1, 0);
+"""
+
+# Resolução -> nº de caracteres de "YYYY-MM-DD HH:MM:SS" que identificam o balde
+RESOLUCOES = {"1min": 16, "1h": 13, "1d": 10}
+_COMPLETAR = {"1min": ":00", "1h": ":00:00", "1d": " 00:00:00"}
+
+
+def vitais_numericos(evento):
+    """(sistólica, diastólica, spo2, ritmo) do evento: usa os campos tipados se vierem, senão lê os textos."""
+    pa = (evento.get("PA_Sys"), evento.get("PA_Dia"))
+    if None in pa:
+        pa = parse_pressao(evento.get("PA")) or (None, None)
+    spo2 = evento.get("SpO2_Num")
+    if spo2 is None:
+        spo2 = parse_spo2(evento.get("SpO2"))
+    ritmo = classificar_ritmo(evento.get("Ritmo") or evento.get("ECG"))
+    return pa[0], pa[1], spo2, ritmo.value
+
+
+class HistoryStore:
+    """
+    Histórico de eventos em SQLite (modo WAL).
+    Escritas são appends O(1) e leituras são consultas por paciente/intervalo,
+    seguras com vários workers do uvicorn escrevendo ao mesmo tempo.
+    """
+
+    def __init__(self, db_file=DB_FILE, legacy_csv=LEGACY_HISTORY_CSV):
+        self.db_file = db_file
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+        self._migrar_colunas_vitais()
+        self._migrar_csv(legacy_csv)
+        self._backfill_vitais()
+        self._backfill_rollups()
+
+    # --- CONEXÃO (uma por thread) ---
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # --- COLUNAS NUMÉRICAS (bancos criados antes delas) ---
+    def _migrar_colunas_vitais(self):
+        conn = self._conn()
+        existentes = {r[1] for r in conn.execute("PRAGMA table_info(eventos)")}
+        for coluna, tipo in _COLUNAS_VITAIS.items():
+            if coluna in existentes:
+                continue
+            try:
+                with conn:
+                    conn.execute(f"ALTER TABLE eventos ADD COLUMN {coluna} {tipo}")
+            except sqlite3.OperationalError as e:
+                # Outro worker acrescentou a coluna ao mesmo tempo
+                if "duplicate column" not in str(e):
+                    raise
+        with conn:
+            # Índice parcial: depois do backfill fica vazio e a checagem no start é instantânea
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_eventos_sem_ritmo ON eventos (id) WHERE ritmo IS NULL")
+
+    def _backfill_vitais(self, lote=50000):
+        """Converte PA/SpO2/ECG em texto dos eventos antigos para as colunas numéricas (uma vez só)."""
+        conn = self._conn()
+        total = 0
+        while True:
+            rows = conn.execute(
+                "SELECT id, ecg, pa, spo2 FROM eventos WHERE ritmo IS NULL LIMIT ?", (lote,)
+            ).fetchall()
+            if not rows:
+                break
+            with conn:
+                conn.executemany(
+                    "UPDATE eventos SET sistolica = ?, diastolica = ?, spo2_num = ?, ritmo = ? WHERE id = ?",
+                    [(*vitais_numericos({"ECG": ecg, "PA": pa, "SpO2": spo2}), evento_id)
+                     for evento_id, ecg, pa, spo2 in rows],
+                )
+            total += len(rows)
+        if total:
+            print(f"🔢 Sinais vitais convertidos para colunas numéricas em {total} eventos.")
+
+    # --- MIGRAÇÃO ÚNICA DO CSV ANTIGO ---
+    def _migrar_csv(self, legacy_csv):
+        if not legacy_csv or not os.path.exists(legacy_csv):
+            return
+        # Com vários workers do uvicorn, só quem conseguir renomear o arquivo importa (rename é atômico)
+        migrando = legacy_csv + ".migrando"
+        try:
+            os.rename(legacy_csv, migrando)
+        except FileNotFoundError:
+            # Outro worker já pegou o arquivo
+            return
+        try:
+            df = pd.read_csv(migrando)
+            for col in COLUNAS:
+                if col not in df.columns:
+                    df[col] = None
+            df = df[COLUNAS].astype(object).where(pd.notna(df[COLUNAS]), None)
+            linhas = [tuple(r) for r in df.itertuples(index=False)]
+            with self._conn() as conn:
+                conn.executemany(
+                    "INSERT INTO eventos (data, paciente, ecg, pa, spo2, local, analise_ia) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    linhas,
+                )
+        except Exception as e:
+            # Nada foi gravado (a transação voltou): devolve o nome para tentar no próximo start
+            os.replace(migrando, legacy_csv)
+            print(f"❌ Erro ao migrar {legacy_csv}: {e}")
+            return
+        # Renomeia para não migrar de novo no próximo start
+        os.replace(migrando, legacy_csv + ".migrado")
+        print(f"📦 Histórico migrado do CSV: {len(linhas)} eventos.")
+
+    # --- ESCRITA ---
+    _INSERT = (
+        "INSERT INTO eventos (data, paciente, ecg, pa, spo2, local, analise_ia, timestamp_dispositivo, "
+        "sistolica, diastolica, spo2_num, ritmo) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    )
+
+    @staticmethod
+    def _valores(evento):
+        return (
+            evento.get("Data"),
+            evento.get("Paciente"),
+            evento.get("ECG"),
+            evento.get("PA"),
+            evento.get("SpO2"),
+            evento.get("Local"),
+            evento.get("Analise_IA"),
+            evento.get("Timestamp_Dispositivo"),
+            *vitais_numericos(evento),
+        )
+
+    def append(self, evento):
+        """Grava um evento (dict com as colunas públicas) e devolve o id."""
+        valores = self._valores(evento)
+        with span("history_append"), self._conn() as conn:
+            cur = conn.execute(self._INSERT, valores)
+            self._agregar(conn, [(cur.lastrowid, *valores[:2], *valores[8:11])])
+            return cur.lastrowid
+
+    def append_many(self, eventos):
+        """
+        Grava vários eventos numa única transação, ignorando os que já existem
+        (mesmo paciente + mesmo Timestamp_Dispositivo).
+        Devolve a lista de ids na mesma ordem (None para duplicados).
+        """
+        with span("history_append_many"):
+            return self._append_many(eventos)
+
+    def _append_many(self, eventos):
+        conn = self._conn()
+        ids = []
+        agregar = []  # (id, data, paciente, sistólica, diastólica, spo2) dos eventos gravados
+        # BEGIN IMMEDIATE: a checagem de duplicados e o insert ficam atômicos entre workers
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existentes = set()
+            por_paciente = {}
+            for ev in eventos:
+                if ev.get("Timestamp_Dispositivo"):
+                    por_paciente.setdefault(ev["Paciente"], []).append(ev["Timestamp_Dispositivo"])
+            for paciente, timestamps in por_paciente.items():
+                for i in range(0, len(timestamps), 500):
+                    lote = timestamps[i:i + 500]
+                    rows = conn.execute(
+                        "SELECT timestamp_dispositivo FROM eventos WHERE paciente = ? "
+                        f"AND timestamp_dispositivo IN ({','.join('?' * len(lote))})",
+                        (paciente, *lote),
+                    ).fetchall()
+                    existentes.update((paciente, r[0]) for r in rows)
+
+            for ev in eventos:
+                chave = (ev["Paciente"], ev.get("Timestamp_Dispositivo"))
+                if chave[1] and chave in existentes:
+                    ids.append(None)
+                    continue
+                valores = self._valores(ev)
+                ids.append(conn.execute(self._INSERT, valores).lastrowid)
+                agregar.append((ids[-1], *valores[:2], *valores[8:11]))
+                if chave[1]:
+                    existentes.add(chave)
+            self._agregar(conn, agregar)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return ids
+
+    def update_analysis(self, evento_id, analise):
+        """Preenche a análise da IA de um evento (feita em segundo plano)."""
+        with span("history_update_analysis"), self._conn() as conn:
+            conn.execute("UPDATE eventos SET analise_ia = ? WHERE id = ?", (analise, int(evento_id)))
+
+    # --- ROLLUPS (PA/SpO2 por minuto, hora e dia) ---
+    _UPSERT_ROLLUP = (
+        "INSERT INTO rollups (paciente, resolucao, inicio, n_pa, sys_min, sys_soma, sys_max, "
+        "dia_min, dia_soma, dia_max, n_spo2, spo2_min, spo2_soma, spo2_max) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (paciente, resolucao, inicio) DO UPDATE SET "
+        "n_pa = n_pa + excluded.n_pa, n_spo2 = n_spo2 + excluded.n_spo2, "
+        + ", ".join(
+            f"{c}_min = min(coalesce({c}_min, excluded.{c}_min), coalesce(excluded.{c}_min, {c}_min)), "
+            f"{c}_max = max(coalesce({c}_max, excluded.{c}_max), coalesce(excluded.{c}_max, {c}_max)), "
+            f"{c}_soma = {c}_soma + excluded.{c}_soma"
+            for c in ("sys", "dia", "spo2")
+        )
+    )
+
+    def _agregar(self, conn, eventos):
+        """
+        Soma os eventos (id, data, paciente, sistólica, diastólica, spo2) nos baldes de cada resolução.
+        Roda dentro da transação da escrita, então evento e rollup ficam sempre juntos.
+        """
+        baldes = {}
+        ultimo_id = 0
+        for evento_id, data, paciente, sys_, dia, sat in eventos:
+            ultimo_id = max(ultimo_id, evento_id)
+            if data is None or (sys_ is None and sat is None):
+                continue
+            for resolucao, tamanho in RESOLUCOES.items():
+                chave = (paciente, resolucao, str(data)[:tamanho] + _COMPLETAR[resolucao])
+                b = baldes.get(chave)
+                if b is None:
+                    b = baldes[chave] = [0, None, 0.0, None, None, 0.0, None, 0, None, 0.0, None]
+                if sys_ is not None:
+                    b[0] += 1
+                    for i, v in ((1, sys_), (4, dia)):
+                        b[i] = v if b[i] is None else min(b[i], v)
+                        b[i + 1] += v
+                        b[i + 2] = v if b[i + 2] is None else max(b[i + 2], v)
+                if sat is not None:
+                    b[7] += 1
+                    b[8] = sat if b[8] is None else min(b[8], sat)
+                    b[9] += sat
+                    b[10] = sat if b[10] is None else max(b[10], sat)
+        if baldes:
+            conn.executemany(self._UPSERT_ROLLUP, [(*chave, *b) for chave, b in baldes.items()])
+        if ultimo_id:
+            conn.execute("UPDATE rollups_estado SET ate_id = max(ate_id, ?) WHERE id = 1", (ultimo_id,))
+
+    def _backfill_rollups(self, lote=50000):
+        """Agrega os eventos que ainda não estão nos rollups (histórico antigo / CSV migrado)."""
+        conn = self._conn()
+        total = 0
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                ate_id = conn.execute("SELECT ate_id FROM rollups_estado WHERE id = 1").fetchone()[0]
+                rows = conn.execute(
+                    "SELECT id, data, paciente, sistolica, diastolica, spo2_num FROM eventos "
+                    "WHERE id > ? ORDER BY id LIMIT ?",
+                    (ate_id, lote),
+                ).fetchall()
+                self._agregar(conn, rows)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            total += len(rows)
+            if len(rows) < lote:
+                break
+        if total:
+            print(f"📈 Rollups de PA/SpO2 calculados para {total} eventos.")
+
+    def rollup(self, paciente, resolucao="1h", inicio=None, fim=None):
+        """
+        Tendência de PA/SpO2 do paciente na resolução pedida ('1min', '1h' ou '1d').
+        Colunas: Data, PA_Sys, PA_Dia, SpO2_Num (médias), *_Min, *_Max e N.
+        """
+        if resolucao not in RESOLUCOES:
+            raise ValueError(f"Resolução inválida: {resolucao}. Use {list(RESOLUCOES)}.")
+        where, params = ["paciente = ?", "resolucao = ?"], [paciente, resolucao]
+        if inicio:
+            where.append("inicio >= ?")
+            params.append(inicio)
+        if fim:
+            where.append("inicio <= ?")
+            params.append(fim)
+        df = pd.read_sql_query(
+            "SELECT inicio AS Data, "
+            "sys_soma / NULLIF(n_pa, 0) AS PA_Sys, sys_min AS PA_Sys_Min, sys_max AS PA_Sys_Max, "
+            "dia_soma / NULLIF(n_pa, 0) AS PA_Dia, dia_min AS PA_Dia_Min, dia_max AS PA_Dia_Max, "
+            "spo2_soma / NULLIF(n_spo2, 0) AS SpO2_Num, spo2_min AS SpO2_Min, spo2_max AS SpO2_Max, "
+            "max(n_pa, n_spo2) AS N "
+            f"FROM rollups WHERE {' AND '.join(where)} ORDER BY inicio",
+            self._conn(), params=params,
+        )
+        df["Data"] = pd.to_datetime(df["Data"])
+        return df
+
+    # --- LEITURA ---
+    def _select(self, where="", params=(), order="id", limit=None):
+        sql = "SELECT id, " + ", ".join(_MAPA_COLUNAS) + " FROM eventos"
+        if where:
+            sql += " WHERE " + where
+        sql += f" ORDER BY {order}"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        df = pd.read_sql_query(sql, self._conn(), params=params)
+        df = df.rename(columns=_MAPA_COLUNAS)
+        return df.astype({"PA_Sys": "Int64", "PA_Dia": "Int64", "SpO2_Num": "Int64"})
+
+    def get(self, evento_id):
+        """Evento pelo id como dict, ou None."""
+        df = self._select("id = ?", (int(evento_id),))
+        if df.empty:
+            return None
+        return df.iloc[0].to_dict()
+
+    def latest(self, paciente=None):
+        """Último evento (de um paciente ou de qualquer um) como dict, ou None."""
+        if paciente is None:
+            df = self._select(order="id DESC", limit=1)
+        else:
+            df = self._select("paciente = ?", (paciente,), order="id DESC", limit=1)
+        if df.empty:
+            return None
+        return df.iloc[0].to_dict()
+
+    def latest_version(self, paciente):
+        """(id, tem_analise) do último evento do paciente, ou None. Consulta só no índice."""
+        row = self._conn().execute(
+            "SELECT id, analise_ia IS NOT NULL FROM eventos WHERE paciente = ? ORDER BY id DESC LIMIT 1",
+            (paciente,),
+        ).fetchone()
+        return None if row is None else (row[0], bool(row[1]))
+
+    def range(self, paciente, inicio=None, fim=None):
+        """Eventos de um paciente no intervalo [inicio, fim] (strings 'YYYY-MM-DD HH:MM:SS')."""
+        where, params = ["paciente = ?"], [paciente]
+        if inicio:
+            where.append("data >= ?")
+            params.append(inicio)
+        if fim:
+            where.append("data <= ?")
+            params.append(fim)
+        return self._select(" AND ".join(where), tuple(params), order="data, id")
+
+    def since(self, last_id=0, limit=None):
+        """Eventos com id maior que last_id (para leitura incremental)."""
+        return self._select("id > ?", (int(last_id),), limit=limit)
+
+    def analyses(self, evento_ids):
+        """Análises já prontas (id -> texto) entre os ids pedidos."""
+        ids = [int(i) for i in evento_ids]
+        prontas = {}
+        for i in range(0, len(ids), 500):
+            lote = ids[i:i + 500]
+            rows = self._conn().execute(
+                f"SELECT id, analise_ia FROM eventos WHERE id IN ({','.join('?' * len(lote))}) "
+                "AND analise_ia IS NOT NULL",
+                lote,
+            ).fetchall()
+            prontas.update(rows)
+        return prontas
+
+    def patients(self):
+        rows = self._conn().execute("SELECT DISTINCT paciente FROM eventos ORDER BY paciente").fetchall()
+        return [r[0] for r in rows]
+
+    # --- COMPACTAÇÃO (o archive.py move os eventos antigos para Parquet) ---
+    def antigos(self, antes_de, depois_id=0, limit=None):
+        """
+        Eventos com Data < antes_de e análise pronta, em ordem de id (a partir de depois_id).
+        O último evento de cada paciente nunca sai do banco: é o /latest_status dele.
+        """
+        return self._select(
+            "id > ? AND data < ? AND analise_ia IS NOT NULL "
+            "AND id NOT IN (SELECT MAX(id) FROM eventos GROUP BY paciente)",
+            (int(depois_id), antes_de), limit=limit,
+        )
+
+    def remover(self, evento_ids):
+        """Apaga eventos já arquivados (os rollups continuam com os agregados deles)."""
+        ids = [int(i) for i in evento_ids]
+        with self._conn() as conn:
+            for i in range(0, len(ids), 500):
+                lote = ids[i:i + 500]
+                conn.execute(f"DELETE FROM eventos WHERE id IN ({','.join('?' * len(lote))})", lote)
+        return len(ids)
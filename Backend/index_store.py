@@ -0,0 +1,54 @@
+"""
+Layout do faiss_index_tcc em disco, compartilhado pelo llm_core.py (que grava) e pelo
+rag_engine.py/rag_eval.py (que leem).
+
+Cada build grava uma pasta de versão completa (faiss_index_tcc/v<timestamp>/) e só
+então troca o ponteiro ATUAL com os.replace (atômico). A pasta faiss_index_tcc nunca
+some: quem lê no meio de um build continua vendo a versão anterior inteira.
+
+Índices do layout antigo (arquivos direto na raiz, sem ATUAL) continuam sendo lidos.
+"""
+import os
+import shutil
+import time
+
+ATUAL_FILE = "ATUAL"
+VERSOES_MANTIDAS = 2  # A atual + a anterior (pode estar sendo carregada pela API nesse momento)
+ARQUIVOS_LAYOUT_ANTIGO = ("index.faiss", "index.pkl", "bm25.pkl", "index_ann.faiss", "manifest.json", "eval.json")
+
+
+def pasta_atual(index_dir):
+    """Pasta com os arquivos da versão publicada (a própria raiz no layout antigo)."""
+    try:
+        with open(os.path.join(index_dir, ATUAL_FILE), encoding="utf-8") as f:
+            versao = f.read().strip()
+    except FileNotFoundError:
+        return index_dir
+    return os.path.join(index_dir, versao)
+
+
+def nova_pasta(index_dir):
+    """Cria uma pasta de versão vazia (ainda invisível para quem lê pelo ATUAL)."""
+    pasta = os.path.join(index_dir, f"v{time.time_ns()}")
+    os.makedirs(pasta)
+    return pasta
+
+
+def publicar(index_dir, pasta):
+    """Aponta o ATUAL para a pasta (já completa) e apaga as versões antigas."""
+    tmp = os.path.join(index_dir, ATUAL_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(pasta))
+    os.replace(tmp, os.path.join(index_dir, ATUAL_FILE))
+
+    versoes = sorted(
+        nome for nome in os.listdir(index_dir)
+        if nome.startswith("v") and os.path.isdir(os.path.join(index_dir, nome))
+    )
+    for nome in versoes[:-VERSOES_MANTIDAS]:
+        if nome != os.path.basename(pasta):
+            shutil.rmtree(os.path.join(index_dir, nome), ignore_errors=True)
+    for nome in ARQUIVOS_LAYOUT_ANTIGO:
+        caminho = os.path.join(index_dir, nome)
+        if os.path.exists(caminho):
+            os.remove(caminho)
@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import pandas as pd
+
+
+class LastEventCache:
+    """
+    Último evento de cada paciente em memória, para o /latest_status/{patient_id}.
+
+    - A API atualiza o cache na ingestão (publicar) e quando a análise da IA fica
+      pronta (analise_pronta, chamada pelas threads da fila de trabalho).
+    - Cada entrada tem uma ETag (hash do conteúdo), então o celular que já tem a
+      versão atual recebe 304 sem corpo.
+    - Com vários workers do uvicorn, um evento pode chegar em outro processo: a
+      entrada é revalidada no banco (consulta só no índice) no máximo a cada
+      `revalidar` segundos.
+    - Long-poll/SSE: quem espera uma mudança fica parado num Future, acordado pela
+      ingestão, sem consultar nada enquanto o paciente não tem evento novo.
+    """
+
+    def __init__(self, store, revalidar=1.0):
+        self.store = store
+        self.revalidar = revalidar
+        self._entradas = {}  # paciente -> {"id", "tem_analise", "evento", "etag", "verificado_em"}
+        self._esperando = {}  # paciente -> set de asyncio.Future
+        self._lock = threading.Lock()
+        self._loop = None
+
+    def iniciar(self, loop):
+        """Guarda o event loop da API (para as threads da fila acordarem quem espera)."""
+        self._loop = loop
+
+    @staticmethod
+    def _etag(evento):
+        conteudo = json.dumps(evento, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha1(conteudo).hexdigest()[:16]
+
+    @staticmethod
+    def _limpar(evento):
+        evento = dict(evento)
+        evento.pop("id", None)
+        evento.pop("Timestamp_Dispositivo", None)
+        # Colunas numéricas do banco vêm como escalares do numpy/pandas: viram int/float do Python
+        return {k: ("" if v is None or pd.isna(v) else v.item() if hasattr(v, "item") else v)
+                for k, v in evento.items()}
+
+    def _guardar(self, paciente, evento_id, evento):
+        """Troca a entrada (só avança: um evento mais antigo nunca substitui o mais novo)."""
+        limpo = self._limpar(evento)
+        with self._lock:
+            atual = self._entradas.get(paciente)
+            if atual is not None and atual["id"] is not None and evento_id < atual["id"]:
+                return False
+            self._entradas[paciente] = {
+                "id": evento_id,
+                "tem_analise": bool(limpo.get("Analise_IA")),
+                "evento": limpo,
+                "etag": self._etag(limpo),
+                "verificado_em": time.monotonic(),
+            }
+        self._notificar(paciente)
+        return True
+
+    # --- ATUALIZAÇÕES (ingestão e fila de trabalho) ---
+    def publicar(self, evento_id, evento):
+        """Evento recém-gravado (dict com as colunas públicas)."""
+        self._guardar(evento["Paciente"], evento_id, evento)
+
+    def analise_pronta(self, evento_id, paciente, analise):
+        """Preenche a análise se o evento ainda for o último do paciente. Thread-safe."""
+        with self._lock:
+            atual = self._entradas.get(paciente)
+            if atual is None or atual["id"] != evento_id:
+                return
+            evento = dict(atual["evento"], Analise_IA=analise)
+        self._guardar(paciente, evento_id, evento)
+
+    # --- LEITURA ---
+    def get(self, paciente):
+        """(etag, evento) do último evento do paciente, ou (None, None) se ele não tem eventos."""
+        entrada = self._entradas.get(paciente)
+        if entrada is None or time.monotonic() - entrada["verificado_em"] > self.revalidar:
+            entrada = self._revalidar(paciente, entrada)
+        if entrada is None or entrada["id"] is None:
+            return None, None
+        return entrada["etag"], entrada["evento"]
+
+    def _revalidar(self, paciente, entrada):
+        versao = self.store.latest_version(paciente)
+        if entrada is not None and versao is not None and versao == (entrada["id"], entrada["tem_analise"]):
+            entrada["verificado_em"] = time.monotonic()
+            return entrada
+        if versao is None:
+            with self._lock:
+                self._entradas[paciente] = {"id": None, "tem_analise": False, "evento": None, "etag": None,
+                                            "verificado_em": time.monotonic()}
+            return self._entradas[paciente]
+        evento = self.store.latest(paciente)
+        if evento is not None:
+            self._guardar(paciente, int(evento["id"]), evento)
+        return self._entradas.get(paciente)
+
+    # --- ESPERA POR MUDANÇA (long-poll / SSE) ---
+    def _notificar(self, paciente):
+        if self._loop is None or not self._esperando.get(paciente):
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._acordar, paciente)
+        except RuntimeError:
+            pass  # Loop já encerrado (shutdown)
+
+    def _acordar(self, paciente):
+        for futuro in self._esperando.pop(paciente, ()):
+            if not futuro.done():
+                futuro.set_result(True)
+
+    async def esperar(self, paciente, etag, timeout):
+        """
+        Espera até a ETag do paciente ser diferente de `etag` ou o timeout acabar.
+        Devolve (etag, evento) atuais.
+        """
+        limite = time.monotonic() + timeout
+        while True:
+            atual = self.get(paciente)
+            restante = limite - time.monotonic()
+            if atual[0] != etag or restante <= 0:
+                return atual
+            futuro = asyncio.get_running_loop().create_future()
+            self._esperando.setdefault(paciente, set()).add(futuro)
+            try:
+                # Acorda na ingestão; senão revalida a cada `revalidar` s (evento pode ter chegado em outro worker)
+                await asyncio.wait_for(futuro, min(restante, max(self.revalidar, 0.05)))
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                esperando = self._esperando.get(paciente)
+                if esperando is not None:
+                    esperando.discard(futuro)
+                    if not esperando:
+                        self._esperando.pop(paciente, None)
@@ -0,0 +1,149 @@
+"""
+Índice lexical (BM25) dos chunks do faiss_index_tcc, construído junto com o índice
+vetorial pelo llm_core.py e gravado em faiss_index_tcc/bm25.pkl.
+
+Cada chunk guarda também a fonte (nome do PDF/URL) e os tópicos (Chagas, rural,
+arritmia...), usados como filtro ANTES da pontuação na busca lexical e na densa.
+"""
+import pickle
+import re
+import unicodedata
+from collections import Counter
+import numpy as np
+
+BM25_FILE = "bm25.pkl"
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Tópicos atribuídos por palavra-chave (texto já sem acentos e em minúsculas)
+TOPICOS = {
+    "chagas": ("chagas", "chagasic", "trypanosoma", "cruzi", "benznidazol"),
+    "rural": ("rural", "telemedicina", "area remota", "zona endemica", "regiao endemica", "ribeirinh"),
+    "arritmia": ("arritmia", "taquicardia", "fibrilacao", "flutter", "extrassistol", "bloqueio"),
+    "ventricular": ("ventricular",),
+    "hipertensao": ("hipertens", "pressao arterial"),
+    "insuficiencia_cardiaca": ("insuficiencia cardiaca", "heart failure"),
+    "ecg": ("eletrocardiogra", "electrocardiogra", "qrs", "onda p", "intervalo qt"),
+}
+
+_STOPWORDS = set("""
+a o as os um uma uns umas de do da dos das em no na nos nas por pelo pela pelos pelas para
+com sem sob sobre e ou que se ao aos como mais menos muito entre ate ja nao sim foi ser sao
+esta este esse essa isso isto pode podem the of and in to is for with on by an be are
+""".split())
+
+_RE_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def normalizar_texto(texto):
+    """Minúsculas e sem acentos (a busca casa 'arritmia' com 'Arrítmia')."""
+    texto = unicodedata.normalize("NFKD", str(texto).lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def tokenizar(texto):
+    return [t for t in _RE_TOKEN.findall(normalizar_texto(texto)) if len(t) > 1 and t not in _STOPWORDS]
+
+
+def topicos_do_texto(texto):
+    texto = normalizar_texto(texto)
+    return [topico for topico, palavras in TOPICOS.items() if any(p in texto for p in palavras)]
+
+
+class BM25Index:
+    """
+    Índice invertido BM25 em arrays do numpy.
+
+    Os documentos ficam na MESMA ordem das posições do índice FAISS (ids), então um
+    filtro de metadados vira uma máscara booleana que serve para as duas buscas.
+    """
+
+    def __init__(self, ids, textos, metadatas, k1=BM25_K1, b=BM25_B):
+        self.ids = list(ids)
+        self.k1 = k1
+        self.b = b
+        self.fontes = [str(m.get("source", "")) for m in metadatas]
+        self.topicos = [
+            list(m["topicos"]) if m.get("topicos") is not None else topicos_do_texto(t)
+            for t, m in zip(textos, metadatas)
+        ]
+
+        postings = {}  # termo -> ([posição do doc], [frequência])
+        tamanhos = np.zeros(len(self.ids), dtype=np.float32)
+        for pos, texto in enumerate(textos):
+            contagem = Counter(tokenizar(texto))
+            tamanhos[pos] = sum(contagem.values())
+            for termo, tf in contagem.items():
+                docs, freqs = postings.setdefault(termo, ([], []))
+                docs.append(pos)
+                freqs.append(tf)
+
+        n = max(len(self.ids), 1)
+        self.tamanhos = tamanhos
+        self.tamanho_medio = max(float(tamanhos.mean()), 1.0) if len(tamanhos) else 1.0
+        self.postings = {}
+        for termo, (docs, freqs) in postings.items():
+            idf = np.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            self.postings[termo] = (np.asarray(docs, dtype=np.int32), np.asarray(freqs, dtype=np.float32), idf)
+
+    def __len__(self):
+        return len(self.ids)
+
+    # --- FILTROS DE METADADOS ---
+    def mascara(self, filtros):
+        """
+        Máscara booleana dos documentos que passam nos filtros, ou None (sem filtro).
+        filtros: {"source": [...], "topico": [...]} — E entre chaves, OU dentro da lista.
+        """
+        if not filtros:
+            return None
+        mascara = np.ones(len(self.ids), dtype=bool)
+        for chave, valores in filtros.items():
+            valores = {valores} if isinstance(valores, str) else set(valores)
+            if chave == "source":
+                mascara &= np.fromiter((f in valores for f in self.fontes), dtype=bool, count=len(self.ids))
+            elif chave == "topico":
+                mascara &= np.fromiter((bool(valores.intersection(t)) for t in self.topicos),
+                                       dtype=bool, count=len(self.ids))
+            else:
+                raise ValueError(f"Filtro desconhecido: {chave}. Use 'source' ou 'topico'.")
+        return mascara
+
+    # --- BUSCA ---
+    def buscar(self, query, k, mascara=None):
+        """Posições dos k documentos de maior BM25 (só os com pontuação > 0), do melhor para o pior."""
+        pontos = np.zeros(len(self.ids), dtype=np.float32)
+        for termo in set(tokenizar(query)):
+            posting = self.postings.get(termo)
+            if posting is None:
+                continue
+            docs, tf, idf = posting
+            if mascara is not None:
+                # Poda antes de pontuar: só os candidatos que passaram no filtro
+                manter = mascara[docs]
+                docs, tf = docs[manter], tf[manter]
+            norma = self.k1 * (1 - self.b + self.b * self.tamanhos[docs] / self.tamanho_medio)
+            pontos[docs] += idf * tf * (self.k1 + 1) / (tf + norma)
+        candidatos = np.flatnonzero(pontos)
+        if len(candidatos) > k:
+            candidatos = candidatos[np.argpartition(-pontos[candidatos], k - 1)[:k]]
+        return candidatos[np.argsort(-pontos[candidatos], kind="stable")].tolist()
+
+    # --- PERSISTÊNCIA ---
+    def salvar(self, caminho):
+        with open(caminho, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def carregar(caminho):
+        with open(caminho, "rb") as f:
+            return pickle.load(f)
+
+
+def fundir_rrf(listas, k, constante=60):
+    """Reciprocal Rank Fusion: junta rankings (listas de posições) sem precisar normalizar escores."""
+    pontos = {}
+    for lista in listas:
+        for rank, pos in enumerate(lista):
+            pontos[pos] = pontos.get(pos, 0.0) + 1.0 / (constante + rank + 1)
+    return sorted(pontos, key=pontos.get, reverse=True)[:k]
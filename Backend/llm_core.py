@@ -1,82 +1,300 @@
-from langchain_community.document_loaders import PyPDFLoader
+"""
+Construção do banco vetorial (faiss_index_tcc) a partir dos PDFs em Backend/Data.
+
+Uso:
+    python llm_core.py                  # incremental: só processa PDFs novos/alterados
+    python llm_core.py --rebuild        # reconstrói tudo do zero
+    python llm_core.py --web            # inclui também as páginas da lista URLS
+    python llm_core.py --ann hnsw       # grava também um índice aproximado (hnsw ou ivf)
+
+O manifesto (manifest.json, junto do índice) guarda o hash SHA-256 de cada
+documento e os ids dos seus chunks no índice. Documentos novos são divididos e
+embutidos; alterados têm os vetores antigos removidos e os novos adicionados;
+removidos da pasta têm os vetores apagados.
+
+Junto com o índice vetorial são gravados o índice lexical BM25 (bm25.pkl, com a
+fonte e os tópicos de cada chunk para os filtros) e, com --ann, um índice
+aproximado (index_ann.faiss: HNSW ou IVF) para corpora grandes. Os dois são
+derivados do índice exato, que continua sendo o que recebe as atualizações.
+
+Cada build vira uma pasta de versão dentro do faiss_index_tcc, publicada pelo
+ponteiro ATUAL (index_store.py): a API nunca encontra a pasta vazia.
+"""
+import argparse
+import hashlib
+import json
 import os
-from langchain_community.document_loaders import WebBaseLoader
-from langchain_community.document_loaders import WebBaseLoader, PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
-from langchain_huggingface import HuggingFaceEmbeddings
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from index_store import nova_pasta, pasta_atual, publicar
+from lexical_index import BM25Index, BM25_FILE, topicos_do_texto
 
 # Configurar User Agent para não ser bloqueado nos sites
 os.environ["USER_AGENT"] = "Estudante_TCC/1.0"
 
-print("--- 1. CARREGANDO DADOS ---")
-documentos_totais = []
-# A. Carregar da Web
-urls = [
+DATA_DIR = "Data"
+INDEX_DIR = "faiss_index_tcc"
+MANIFEST_FILE = "manifest.json"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+EMBED_BATCH_SIZE = 64
+
+# Índice aproximado opcional (busca sublinear em corpora grandes)
+ANN_FILE = "index_ann.faiss"
+ANN_TIPOS = ("flat", "hnsw", "ivf")
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+
+URLS = [
     "https://www.scielo.br/j/abc/a/pZnfbJzqhGcBgVHmyjRgDkb/?format=html&lang=pt"
 ]
 
-try:
-    loader_web = WebBaseLoader(urls)
-    docs_web = loader_web.load()
-    documentos_totais.extend(docs_web)
-    print(f"Web carregada: {len(docs_web)} documentos.")
-except Exception as e:
-    print(f"Erro na Web: {e}")
-
-
-lista_pdfs = [
-    "ECG-Manual-Prático-de-Eletrocardiograma-HCor.pdf",
-    "download (1).pdf",
-    "download (2).pdf",
-    "rdt_v22n4_166-168.pdf",
-    "38050006.pdf",
-    "0066-782X-abc-119-04-0638.x55156.pdf",
-    "download (3).pdf",
-    "a2004_v17_n04_art03.pdf",
-    "kumar-et-al-2023-tropical-cardiovascular-diseases.pdf",
-    "download (4).pdf",
-    "download (5).pdf"
 
-]
+# --- TEMPOS POR ETAPA ---
+class Cronometro:
+    def __init__(self):
+        self.etapas = []
 
-for pdf in lista_pdfs:
-    if os.path.exists(pdf):
+    @contextmanager
+    def etapa(self, nome):
+        print(f"--- {nome} ---")
+        inicio = time.perf_counter()
         try:
-            loader = PyPDFLoader(pdf)
-            docs = loader.load()
-            documentos_totais.extend(docs)
-            print(f"✅ PDF carregado: '{pdf}' ({len(docs)} páginas).")
-        except Exception as e:
-            print(f"❌ Erro ao ler '{pdf}': {e}")
+            yield
+        finally:
+            self.etapas.append((nome, time.perf_counter() - inicio))
+
+    def resumo(self):
+        print("\n⏱️ Tempo por etapa:")
+        for nome, segundos in self.etapas:
+            print(f"   {nome:<34} {segundos:8.2f}s")
+        print(f"   {'TOTAL':<34} {sum(s for _, s in self.etapas):8.2f}s")
+
+
+# --- FUNÇÕES DOS WORKERS (rodam em outros processos) ---
+def hash_arquivo(caminho):
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def ids_dos_chunks(nome, sha, n):
+    """Ids dos chunks do documento: nome + conteúdo, então dois PDFs idênticos com nomes diferentes não colidem."""
+    prefixo = hashlib.sha256(f"{nome}\0{sha}".encode("utf-8")).hexdigest()[:16]
+    return [f"{prefixo}-{i}" for i in range(n)]
+
+
+def dividir_textos(docs):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    # Corta o texto em pedaços de 1000 caracteres
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = splitter.split_documents(docs)
+    for c in chunks:
+        c.metadata["topicos"] = topicos_do_texto(c.page_content)
+    return [(c.page_content, c.metadata) for c in chunks]
+
+
+def carregar_e_dividir_pdf(caminho):
+    """Lê um PDF e devolve (nº de páginas, lista de (texto, metadata)) dos chunks."""
+    from langchain_community.document_loaders import PyPDFLoader
+
+    docs = PyPDFLoader(caminho).load()
+    for doc in docs:
+        doc.metadata["source"] = os.path.basename(caminho)
+    return len(docs), dividir_textos(docs)
+
+
+# --- MANIFESTO ---
+def carregar_manifesto(index_dir):
+    pasta = pasta_atual(index_dir)
+    caminho = os.path.join(pasta, MANIFEST_FILE)
+    if os.path.exists(caminho) and os.path.exists(os.path.join(pasta, "index.faiss")):
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f)
+    return {"documentos": {}}
+
+
+# --- ÍNDICES DERIVADOS (BM25 e aproximado) ---
+def construir_bm25(vectorstore):
+    """BM25 dos chunks na ordem das posições do índice FAISS."""
+    ids = [vectorstore.index_to_docstore_id[i] for i in range(vectorstore.index.ntotal)]
+    docs = [vectorstore.docstore.search(chunk_id) for chunk_id in ids]
+    return BM25Index(ids, [d.page_content for d in docs], [d.metadata for d in docs])
+
+
+def construir_ann(index, tipo):
+    """HNSW ou IVF com os mesmos vetores (e posições) do índice exato."""
+    import faiss
+    import numpy as np
+
+    vetores = index.reconstruct_n(0, index.ntotal).astype(np.float32)
+    d = vetores.shape[1]
+    if tipo == "hnsw":
+        ann = faiss.IndexHNSWFlat(d, HNSW_M)
+        ann.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif tipo == "ivf":
+        # ~4*sqrt(n) listas, com pelo menos 39 vetores de treino por lista (recomendação do FAISS)
+        n_listas = max(1, min(int(4 * np.sqrt(len(vetores))), len(vetores) // 39))
+        ann = faiss.IndexIVFFlat(faiss.IndexFlatL2(d), d, n_listas)
+        ann.train(vetores)
     else:
-        print(f"⚠️ Aviso: Arquivo '{pdf}' não encontrado.")
-
-if not documentos_totais:
-    print("Erro: Nenhum documento foi carregado. Verifique os links ou o PDF.")
-    exit() # Para o código se não tiver nada
-
-print(f"Total de documentos brutos: {len(documentos_totais)}")
-
-print("--- 2. DIVIDINDO O TEXTO (CHUNKING) ---")
-# Corta o texto em pedaços de 1000 caracteres
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-splits = text_splitter.split_documents(documentos_totais)
-print(f"Texto dividido em {len(splits)} pedaços (chunks).")
-
-print("--- 3. CRIANDO O BANCO VETORIAL (Local/Grátis) ---")
-try:
-    print("Baixando modelo de Embeddings gratuito (pode demorar um pouquinho na 1ª vez)...")
-    # Este modelo roda local no seu PC (CPU)
-    embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    
-    print("Criando banco de dados FAISS...")
-    vectorstore = FAISS.from_documents(documents=splits, embedding=embedding_model)
-    
-    # Salva na pasta do projeto
-    vectorstore.save_local("faiss_index_tcc")
-    print("Sucesso! Banco vetorial criado e salvo como 'faiss_index_tcc'.")
-    
-except Exception as e:
-    print(f"Erro ao criar Embeddings: {e}")
+        raise ValueError(f"Tipo de índice aproximado inválido: {tipo}. Use {ANN_TIPOS}.")
+    ann.add(vetores)
+    return ann
+
+
+def salvar_indice(vectorstore, manifesto, index_dir, ann="flat"):
+    """Grava uma versão nova e só então aponta o ATUAL para ela (a API nunca vê um índice pela metade)."""
+    import faiss
+
+    os.makedirs(index_dir, exist_ok=True)
+    pasta = nova_pasta(index_dir)
+    vectorstore.save_local(pasta)
+    bm25 = construir_bm25(vectorstore)
+    bm25.salvar(os.path.join(pasta, BM25_FILE))
+    print(f"🔤 Índice BM25: {len(bm25)} chunks, {len(bm25.postings)} termos.")
+    if ann != "flat":
+        faiss.write_index(construir_ann(vectorstore.index, ann), os.path.join(pasta, ANN_FILE))
+        print(f"🧭 Índice aproximado ({ann}) gravado.")
+    manifesto["ann"] = ann
+    with open(os.path.join(pasta, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    publicar(index_dir, pasta)
+
+
+# --- PIPELINE ---
+def construir_indice(data_dir=DATA_DIR, index_dir=INDEX_DIR, workers=None, batch_size=EMBED_BATCH_SIZE,
+                     incluir_web=False, rebuild=False, ann="flat"):
+    from langchain_community.vectorstores import FAISS
+    from rag_engine import EMBEDDINGS_MODEL, criar_embeddings
+
+    cron = Cronometro()
+    manifesto = {"documentos": {}} if rebuild else carregar_manifesto(index_dir)
+    if manifesto.get("modelo") not in (None, EMBEDDINGS_MODEL) or \
+            manifesto.get("chunk") not in (None, [CHUNK_SIZE, CHUNK_OVERLAP]):
+        print("⚠️ Modelo ou chunking mudaram desde o último build. Reconstruindo tudo.")
+        manifesto = {"documentos": {}}
+    antigos = manifesto["documentos"]
+
+    # 1. Descobre o que mudou
+    with cron.etapa("1. HASH DOS DOCUMENTOS"):
+        pdfs = sorted(
+            os.path.join(data_dir, nome) for nome in os.listdir(data_dir) if nome.lower().endswith(".pdf")
+        ) if os.path.isdir(data_dir) else []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            hashes = dict(zip((os.path.basename(p) for p in pdfs), pool.map(hash_arquivo, pdfs)))
+
+        novos = [p for p in pdfs if antigos.get(os.path.basename(p), {}).get("sha256") != hashes[os.path.basename(p)]]
+        removidos = [nome for nome in antigos if nome not in hashes and not nome.startswith("http")]
+        print(f"{len(pdfs)} PDFs na pasta: {len(novos)} novos/alterados, {len(removidos)} removidos.")
+
+    # 2. Carrega e divide só os novos/alterados, em paralelo
+    chunks_por_doc = {}  # nome -> (sha256, [(texto, metadata)])
+    with cron.etapa("2. LEITURA + CHUNKING (paralelo)"):
+        if novos:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futuros = [(caminho, pool.submit(carregar_e_dividir_pdf, caminho)) for caminho in novos]
+                for caminho, futuro in futuros:
+                    nome = os.path.basename(caminho)
+                    try:
+                        paginas, chunks = futuro.result()
+                    except Exception as e:
+                        # Fica fora do manifesto: a próxima execução tenta de novo
+                        print(f"❌ Erro ao ler '{nome}': {e}")
+                        continue
+                    chunks_por_doc[nome] = (hashes[nome], chunks)
+                    print(f"✅ PDF carregado: '{nome}' ({paginas} páginas, {len(chunks)} chunks).")
+
+        if incluir_web:
+            from langchain_community.document_loaders import WebBaseLoader
+            for url in URLS:
+                try:
+                    docs_web = WebBaseLoader([url]).load()
+                    sha = hashlib.sha256("".join(d.page_content for d in docs_web).encode("utf-8")).hexdigest()
+                    if antigos.get(url, {}).get("sha256") != sha:
+                        chunks_por_doc[url] = (sha, dividir_textos(docs_web))
+                        print(f"Web carregada: {url}")
+                except Exception as e:
+                    print(f"Erro na Web: {e}")
+
+    if not chunks_por_doc and not removidos:
+        if manifesto.get("ann") == ann and os.path.exists(os.path.join(pasta_atual(index_dir), BM25_FILE)):
+            print("Nada mudou. Índice já está atualizado.")
+        elif antigos:
+            # Só os índices derivados estão faltando ou mudaram de tipo (ex.: primeiro --ann hnsw)
+            with cron.etapa("5. ÍNDICES DERIVADOS (BM25/ANN)"):
+                vectorstore = FAISS.load_local(pasta_atual(index_dir), None, allow_dangerous_deserialization=True)
+                salvar_indice(vectorstore, manifesto, index_dir, ann)
+        cron.resumo()
+        return
+
+    # 3. Embeddings em lotes
+    textos, metadatas, ids = [], [], []
+    for nome, (sha, chunks) in chunks_por_doc.items():
+        doc_ids = ids_dos_chunks(nome, sha, len(chunks))
+        for (texto, metadata), chunk_id in zip(chunks, doc_ids):
+            textos.append(texto)
+            metadatas.append(metadata)
+            ids.append(chunk_id)
+
+    with cron.etapa("3. EMBEDDINGS (em lotes)"):
+        embedding_model = criar_embeddings()
+        vetores = []
+        for i in range(0, len(textos), batch_size):
+            vetores.extend(embedding_model.embed_documents(textos[i:i + batch_size]))
+        print(f"{len(vetores)} chunks embutidos (lotes de {batch_size}).")
+
+    # 4. Atualiza o índice (remove vetores antigos e anexa os novos)
+    with cron.etapa("4. ATUALIZAÇÃO DO ÍNDICE FAISS"):
+        vectorstore = None
+        pasta = pasta_atual(index_dir)
+        if antigos and os.path.exists(os.path.join(pasta, "index.faiss")):
+            vectorstore = FAISS.load_local(pasta, embedding_model, allow_dangerous_deserialization=True)
+            ids_antigos = []
+            for nome in removidos + [n for n in chunks_por_doc if n in antigos]:
+                ids_antigos.extend(antigos.pop(nome)["ids"])
+            if ids_antigos:
+                vectorstore.delete(ids_antigos)
+                print(f"🗑️ {len(ids_antigos)} vetores antigos removidos.")
+
+        pares = list(zip(textos, vetores))
+        if vectorstore is None:
+            if not pares:
+                print("Erro: Nenhum documento foi carregado. Verifique os links ou o PDF.")
+                return
+            vectorstore = FAISS.from_embeddings(pares, embedding_model, metadatas=metadatas, ids=ids)
+        elif pares:
+            vectorstore.add_embeddings(pares, metadatas=metadatas, ids=ids)
+
+        for nome, (sha, chunks) in chunks_por_doc.items():
+            antigos[nome] = {"sha256": sha, "ids": ids_dos_chunks(nome, sha, len(chunks))}
+        manifesto.update({"modelo": EMBEDDINGS_MODEL, "chunk": [CHUNK_SIZE, CHUNK_OVERLAP], "documentos": antigos})
+
+    with cron.etapa("5. GRAVAÇÃO"):
+        salvar_indice(vectorstore, manifesto, index_dir, ann)
+        print(f"Sucesso! Banco vetorial salvo em '{index_dir}' ({vectorstore.index.ntotal} vetores).")
+
+    cron.resumo()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Constrói/atualiza o banco vetorial do RAG (FAISS).")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Pasta com os PDFs")
+    parser.add_argument("--index-dir", default=INDEX_DIR, help="Pasta do índice FAISS")
+    parser.add_argument("--workers", type=int, default=None, help="Processos para ler os PDFs (padrão: nº de CPUs)")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Chunks por lote de embedding")
+    parser.add_argument("--web", action="store_true", help="Inclui as páginas da lista URLS")
+    parser.add_argument("--rebuild", action="store_true", help="Ignora o manifesto e reconstrói tudo")
+    parser.add_argument("--ann", choices=ANN_TIPOS, default="flat",
+                        help="Grava também um índice aproximado (hnsw/ivf) para corpora grandes")
+    args = parser.parse_args()
+    construir_indice(args.data_dir, args.index_dir, args.workers, args.batch_size, args.web, args.rebuild,
+                     args.ann)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Instrumentação leve do caminho quente: spans de tempo, contadores e exportação
+no formato texto do Prometheus (GET /metrics da API).
+
+    from metrics import span, contar
+    with span("history_append"):
+        ...
+    contar("heartguard_events_total", ritmo="V")
+
+Tudo fica em memória, por processo (com vários workers do uvicorn, cada um
+expõe as suas séries). O ProfilerAmostral perfila (cProfile) uma fração das
+requisições e guarda os últimos perfis junto com os spans de cada uma.
+"""
+import contextvars
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# Limites (segundos) dos buckets dos histogramas: de 0,1 ms (cache/dict) a 10 s (SMS lento)
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+SPAN_METRICA = "heartguard_span_seconds"
+
+# Fração das requisições perfiladas (0 desliga; pode ser mudada em /metrics/profiler)
+PROFILER_TAXA = float(os.getenv("HEARTGUARD_PROFILER_TAXA", "0"))
+PROFILER_GUARDAR = 20  # Últimos perfis mantidos em memória
+PROFILER_TOP = 25  # Funções por perfil (ordenadas pelo tempo acumulado)
+
+# Spans da requisição que está sendo perfilada (None fora dela: custo zero no caminho normal)
+_trilha = contextvars.ContextVar("heartguard_trilha", default=None)
+
+
+def _rotulos(rotulos):
+    return tuple(sorted((k, str(v)) for k, v in rotulos.items()))
+
+
+def _formatar_rotulos(rotulos, extra=()):
+    pares = list(rotulos) + list(extra)
+    if not pares:
+        return ""
+    escapar = lambda v: v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{escapar(v)}"' for k, v in pares) + "}"
+
+
+def _numero(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Metricas:
+    """Registro thread-safe de contadores e histogramas (um por processo)."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._descricoes = {}  # nome -> (tipo, ajuda)
+        self._contadores = {}  # (nome, rótulos) -> valor
+        self._histogramas = {}  # (nome, rótulos) -> [contagem por bucket..., +Inf], soma
+        self._coletores = []  # funções chamadas no export (filas, caches, contadores de outros módulos)
+        self.descrever(SPAN_METRICA, "histogram", "Duração das etapas do caminho quente (spans).")
+
+    def descrever(self, nome, tipo, ajuda):
+        self._descricoes[nome] = (tipo, ajuda)
+
+    # --- REGISTRO ---
+    def contar(self, nome, valor=1, **rotulos):
+        chave = (nome, _rotulos(rotulos))
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def observar(self, nome, segundos, **rotulos):
+        chave = (nome, _rotulos(rotulos))
+        pos = bisect_left(self.buckets, segundos)
+        with self._lock:
+            hist = self._histogramas.get(chave)
+            if hist is None:
+                hist = self._histogramas[chave] = [[0] * (len(self.buckets) + 1), 0.0]
+            hist[0][pos] += 1
+            hist[1] += segundos
+
+    @contextmanager
+    def span(self, nome, **rotulos):
+        """Mede o bloco no histograma de spans (e na trilha da requisição perfilada, se houver)."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            duracao = time.perf_counter() - inicio
+            self.observar(SPAN_METRICA, duracao, span=nome, **rotulos)
+            trilha = _trilha.get()
+            if trilha is not None:
+                trilha.append((nome, round(duracao * 1000, 3)))
+
+    def coletor(self, funcao):
+        """
+        Registra uma função chamada a cada export. Ela devolve uma lista de
+        (nome, tipo, ajuda, [(rótulos dict, valor), ...]).
+        """
+        self._coletores.append(funcao)
+        return funcao
+
+    # --- EXPORTAÇÃO ---
+    def exportar(self):
+        """Texto no formato de exposição do Prometheus (version 0.0.4)."""
+        with self._lock:
+            contadores = dict(self._contadores)
+            histogramas = {chave: (list(h[0]), h[1]) for chave, h in self._histogramas.items()}
+
+        familias = {}  # nome -> linhas
+        for (nome, rotulos), valor in sorted(contadores.items()):
+            familias.setdefault(nome, []).append(f"{nome}{_formatar_rotulos(rotulos)} {_numero(valor)}")
+        limites = [_numero(float(b)) for b in self.buckets] + ["+Inf"]
+        for (nome, rotulos), (contagens, soma) in sorted(histogramas.items()):
+            linhas = familias.setdefault(nome, [])
+            acumulado = 0
+            for le, n in zip(limites, contagens):
+                acumulado += n
+                linhas.append(f"{nome}_bucket{_formatar_rotulos(rotulos, [('le', le)])} {acumulado}")
+            linhas.append(f"{nome}_sum{_formatar_rotulos(rotulos)} {_numero(soma)}")
+            linhas.append(f"{nome}_count{_formatar_rotulos(rotulos)} {acumulado}")
+
+        descricoes = dict(self._descricoes)
+        for coletor in list(self._coletores):
+            try:
+                series = coletor()
+            except Exception as e:
+                print(f"⚠️ Coletor de métricas falhou: {e}")
+                continue
+            for nome, tipo, ajuda, amostras in series:
+                descricoes.setdefault(nome, (tipo, ajuda))
+                linhas = familias.setdefault(nome, [])
+                for rotulos, valor in amostras:
+                    if valor is not None:
+                        linhas.append(f"{nome}{_formatar_rotulos(_rotulos(rotulos))} {_numero(valor)}")
+
+        saida = []
+        for nome, linhas in familias.items():
+            tipo, ajuda = descricoes.get(nome, ("untyped", ""))
+            saida.append(f"# HELP {nome} {ajuda}")
+            saida.append(f"# TYPE {nome} {tipo}")
+            saida.extend(linhas)
+        return "\n".join(saida) + "\n"
+
+
+class ProfilerAmostral:
+    """
+    Perfila (cProfile) uma fração `taxa` das requisições, uma por vez.
+
+    O cProfile mede a thread inteira: com requisições concorrentes no mesmo event
+    loop, o perfil inclui o trabalho das outras. Os spans guardados junto com o
+    perfil são só os da requisição perfilada.
+    """
+
+    def __init__(self, taxa=PROFILER_TAXA, guardar=PROFILER_GUARDAR, top=PROFILER_TOP):
+        self.taxa = taxa
+        self.top = top
+        self.perfis = deque(maxlen=guardar)
+        self._ocupado = threading.Lock()
+
+    def iniciar(self, forcar=False):
+        """Sorteia a requisição; devolve o estado do perfil (ou None se não vai perfilar)."""
+        if not forcar and (self.taxa <= 0 or random.random() >= self.taxa):
+            return None
+        if not self._ocupado.acquire(blocking=False):
+            return None  # Já tem uma requisição sendo perfilada
+        perfil = cProfile.Profile()
+        trilha = []
+        token = _trilha.set(trilha)
+        perfil.enable()
+        return perfil, trilha, token, time.perf_counter()
+
+    def terminar(self, estado, metodo, rota, status):
+        perfil, trilha, token, inicio = estado
+        perfil.disable()
+        duracao = time.perf_counter() - inicio
+        _trilha.reset(token)
+        self._ocupado.release()
+        texto = io.StringIO()
+        pstats.Stats(perfil, stream=texto).sort_stats("cumulative").print_stats(self.top)
+        self.perfis.append({
+            "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "method": metodo,
+            "route": rota,
+            "status": status,
+            "duration_ms": round(duracao * 1000, 2),
+            "spans": [{"span": nome, "ms": ms} for nome, ms in trilha],
+            "profile": texto.getvalue(),
+        })
+
+
+# Registro do processo (usado pela API, RAG, histórico, cadastro e SMS)
+metricas = Metricas()
+span = metricas.span
+contar = metricas.contar
+observar = metricas.observar
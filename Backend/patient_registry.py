@@ -0,0 +1,172 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+import pandas as pd
+from history_store import DB_FILE
+from metrics import span
+
+LEGACY_PATIENTS_CSV = "cadastro_pacientes.csv"
+
+# Esquema único do cadastro (a API e o dashboard usavam colunas diferentes no CSV)
+COLUNAS = ["Nome", "Telefone", "Target_Sys", "Target_Dia", "Target_SpO2", "Medicacao"]
+
+_MAPA_COLUNAS = {
+    "nome": "Nome",
+    "telefone": "Telefone",
+    "target_sys": "Target_Sys",
+    "target_dia": "Target_Dia",
+    "target_spo2": "Target_SpO2",
+    "medicacao": "Medicacao",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pacientes (
+    id INTEGER PRIMARY KEY,
+    nome TEXT NOT NULL UNIQUE,
+    telefone TEXT,
+    target_sys INTEGER,
+    target_dia INTEGER,
+    target_spo2 INTEGER,
+    medicacao TEXT,
+    atualizado_em TEXT
+);
+CREATE TABLE IF NOT EXISTS pacientes_versao (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    versao INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO pacientes_versao (id, versao) VALUES (1, 0);
+"""
+
+
+class PatientRegistry:
+    """
+    Cadastro de pacientes em SQLite com um índice em memória (nome -> registro, id -> registro).
+
+    As buscas (SMS, medicação do /latest_status) são O(1) no dicionário. O índice é
+    recarregado quando alguém grava no cadastro: na hora, se a escrita foi neste
+    processo; e pelo contador `pacientes_versao` se foi em outro (ex.: o dashboard).
+    Para não consultar a tabela a cada busca, só olha o contador quando o
+    PRAGMA data_version indica que o banco mudou.
+    """
+
+    def __init__(self, db_file=DB_FILE, legacy_csv=LEGACY_PATIENTS_CSV):
+        self.db_file = db_file
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._por_nome = {}
+        self._por_id = {}
+        self._versao = None
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+        self._migrar_csv(legacy_csv)
+        self._recarregar()
+
+    # --- CONEXÃO (uma por thread) ---
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # --- MIGRAÇÃO ÚNICA DO CSV ANTIGO ---
+    def _migrar_csv(self, legacy_csv):
+        if not legacy_csv or not os.path.exists(legacy_csv):
+            return
+        try:
+            df = pd.read_csv(legacy_csv, dtype={"Telefone": str, "Telefone_Emergencia": str})
+            # O dashboard gravava "Telefone_Emergencia", a API gravava "Telefone"
+            if "Telefone_Emergencia" in df.columns:
+                df["Telefone"] = df["Telefone"].fillna(df["Telefone_Emergencia"]) if "Telefone" in df.columns \
+                    else df["Telefone_Emergencia"]
+            for col in COLUNAS:
+                if col not in df.columns:
+                    df[col] = None
+            df = df[COLUNAS].dropna(subset=["Nome"]).drop_duplicates(subset=["Nome"], keep="last")
+            registros = df.astype(object).where(pd.notna(df), None).to_dict("records")
+            for registro in registros:
+                self.upsert(**{k.lower(): v for k, v in registro.items()})
+            os.replace(legacy_csv, legacy_csv + ".migrado")
+            print(f"📦 Cadastro migrado do CSV: {len(registros)} pacientes.")
+        except FileNotFoundError:
+            # Outro worker já migrou
+            pass
+        except Exception as e:
+            print(f"❌ Erro ao migrar {legacy_csv}: {e}")
+
+    # --- ÍNDICE EM MEMÓRIA ---
+    def _recarregar(self):
+        conn = self._conn()
+        with self._lock:
+            versao = conn.execute("SELECT versao FROM pacientes_versao WHERE id = 1").fetchone()[0]
+            if versao == self._versao:
+                return
+            rows = conn.execute("SELECT id, " + ", ".join(_MAPA_COLUNAS) + " FROM pacientes").fetchall()
+            por_nome, por_id = {}, {}
+            for row in rows:
+                registro = {"id": row[0], **dict(zip(_MAPA_COLUNAS.values(), row[1:]))}
+                por_nome[registro["Nome"]] = registro
+                por_id[registro["id"]] = registro
+            self._por_nome, self._por_id, self._versao = por_nome, por_id, versao
+
+    def _atualizar_se_mudou(self):
+        # data_version é por conexão, então o último valor visto fica junto da conexão da thread
+        data_version = self._conn().execute("PRAGMA data_version").fetchone()[0]
+        if data_version != getattr(self._local, "data_version", None):
+            self._local.data_version = data_version
+            self._recarregar()
+
+    # --- ESCRITA ---
+    def upsert(self, nome, telefone=None, target_sys=None, target_dia=None, target_spo2=None, medicacao=None):
+        """
+        Cadastra ou atualiza um paciente pelo nome e devolve o registro.
+        Campos None mantêm o valor já cadastrado (o dashboard só edita o telefone).
+        """
+        valores = {
+            "telefone": None if telefone is None else str(telefone),
+            "target_sys": None if target_sys is None else int(target_sys),
+            "target_dia": None if target_dia is None else int(target_dia),
+            "target_spo2": None if target_spo2 is None else int(target_spo2),
+            "medicacao": medicacao,
+        }
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO pacientes (nome, telefone, target_sys, target_dia, target_spo2, medicacao, atualizado_em) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (nome) DO UPDATE SET "
+                + ", ".join(f"{col} = COALESCE(excluded.{col}, {col})" for col in valores)
+                + ", atualizado_em = excluded.atualizado_em",
+                (nome, *valores.values(), datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+            )
+            conn.execute("UPDATE pacientes_versao SET versao = versao + 1 WHERE id = 1")
+        self._recarregar()
+        return self._por_nome.get(nome)
+
+    # --- LEITURA (O(1) no índice em memória) ---
+    def get(self, nome):
+        """Registro do paciente (dict com as colunas públicas + id), ou None."""
+        with span("patient_lookup"):
+            self._atualizar_se_mudou()
+            return self._por_nome.get(nome)
+
+    def get_by_id(self, paciente_id):
+        with span("patient_lookup"):
+            self._atualizar_se_mudou()
+            return self._por_id.get(int(paciente_id))
+
+    def telefone(self, nome):
+        registro = self.get(nome)
+        return registro["Telefone"] if registro and registro["Telefone"] else None
+
+    def medicacao(self, nome):
+        registro = self.get(nome)
+        return registro["Medicacao"] if registro and registro["Medicacao"] else None
+
+    def all(self):
+        """Todos os pacientes como DataFrame (para a tela de cadastro do dashboard)."""
+        self._atualizar_se_mudou()
+        df = pd.DataFrame(list(self._por_nome.values()), columns=["id"] + COLUNAS)
+        return df.sort_values("Nome", ignore_index=True)
@@ -0,0 +1,130 @@
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from vitals import parse_pressao, parse_spo2
+
+
+# --- NORMALIZAÇÃO DA CONSULTA (faixas clínicas) ---
+# Os sinais vitais chegam já numéricos da API ((120, 80), 97) ou como texto antigo
+# ("120/80", "97%") e variam a cada evento.
+# Para o RAG o que importa é a faixa clínica, então a chave do cache usa faixas.
+
+def faixa_pressao(bp):
+    """Classifica a PA nas faixas da Diretriz Brasileira de Hipertensão (SBC)."""
+    pa = parse_pressao(bp)
+    if pa is None:
+        return "PA_DESCONHECIDA"
+    sys_, dia = pa
+    if sys_ < 90 or dia < 60:
+        return "HIPOTENSAO"
+    if sys_ >= 180 or dia >= 110:
+        return "HAS_ESTAGIO_3"
+    if sys_ >= 160 or dia >= 100:
+        return "HAS_ESTAGIO_2"
+    if sys_ >= 140 or dia >= 90:
+        return "HAS_ESTAGIO_1"
+    if sys_ >= 130 or dia >= 85:
+        return "PRE_HIPERTENSAO"
+    return "NORMAL"
+
+
+def faixa_spo2(spo2):
+    valor = parse_spo2(spo2)
+    if valor is None:
+        return "SPO2_DESCONHECIDA"
+    if valor >= 95:
+        return "NORMAL"
+    if valor >= 90:
+        return "HIPOXEMIA_LEVE"
+    if valor >= 85:
+        return "HIPOXEMIA_MODERADA"
+    return "HIPOXEMIA_GRAVE"
+
+
+def normalizar_consulta(ecg_class, bp, spo2, location_type):
+    """Chave normalizada (tupla) usada no cache e para montar a query do RAG."""
+    ecg = " ".join(str(ecg_class).upper().split())
+    local = str(location_type).strip().upper()
+    return (ecg, faixa_pressao(bp), faixa_spo2(spo2), local)
+
+
+# --- CACHE LRU COM TTL ---
+class LRUTTLCache:
+    """Cache LRU (tamanho máximo) com expiração por tempo e contadores de acerto."""
+
+    def __init__(self, max_size=1024, ttl=24 * 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._dados = OrderedDict()  # chave -> (expira_em, valor)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, chave):
+        with self._lock:
+            item = self._dados.get(chave)
+            if item is None or item[0] < time.time():
+                if item is not None:
+                    del self._dados[chave]
+                self.misses += 1
+                return None
+            self._dados.move_to_end(chave)
+            self.hits += 1
+            return item[1]
+
+    def set(self, chave, valor):
+        with self._lock:
+            self._dados[chave] = (time.time() + self.ttl, valor)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.max_size:
+                self._dados.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._dados.clear()
+
+    def __len__(self):
+        return len(self._dados)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._dados),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    # --- PERSISTÊNCIA EM DISCO (opcional) ---
+    def salvar(self, caminho, versao):
+        """Salva as entradas válidas junto com a versão (impressão digital) do índice."""
+        with self._lock:
+            agora = time.time()
+            itens = [(k, v) for k, v in self._dados.items() if v[0] >= agora]
+        tmp = caminho + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump({"versao": versao, "itens": itens}, f)
+        os.replace(tmp, caminho)
+
+    def carregar(self, caminho, versao):
+        """Carrega do disco apenas se o arquivo foi salvo para a mesma versão do índice."""
+        if not os.path.exists(caminho):
+            return 0
+        try:
+            with open(caminho, "rb") as f:
+                salvo = pickle.load(f)
+        except Exception as e:
+            print(f"⚠️ Cache do RAG ignorado ({caminho}): {e}")
+            return 0
+        if salvo.get("versao") != versao:
+            return 0
+        agora = time.time()
+        with self._lock:
+            for chave, item in salvo.get("itens", []):
+                if item[0] >= agora:
+                    self._dados[chave] = item
+            while len(self._dados) > self.max_size:
+                self._dados.popitem(last=False)
+        return len(self._dados)
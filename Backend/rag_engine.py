@@ -1,45 +1,433 @@
+import json
 import os
+import pickle
+import threading
+import time
+from collections import deque, namedtuple
+import faiss
+import numpy as np
 from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
+from rag_cache import LRUTTLCache, normalizar_consulta
+from vitals import RhythmClass, classificar_ritmo
+from index_store import pasta_atual
+from lexical_index import BM25Index, BM25_FILE, fundir_rrf
+from metrics import observar, SPAN_METRICA
+
+INDEX_DIR = "faiss_index_tcc"
+CACHE_DIR = "rag_cache"  # Cache persistido em disco (None desliga)
+EMBEDDINGS_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# "torch" (padrão), "onnx" ou "onnx_quantizado" (export ONNX int8: carrega e roda mais rápido em CPU)
+EMBEDDINGS_BACKEND = os.getenv("HEARTGUARD_EMBEDDINGS_BACKEND", "torch")
+ONNX_QUANTIZADO_ARQUIVO = "onnx/model_quint8_avx2.onnx"
+
+# Lê o índice FAISS via mmap (somente leitura): as páginas ficam no cache do SO
+# e são compartilhadas entre os workers do uvicorn em vez de copiadas por processo.
+FAISS_MMAP = os.getenv("HEARTGUARD_FAISS_MMAP", "1") == "1"
+
+# Recuperação: "densa" (só FAISS), "lexica" (só BM25) ou "hibrida" (as duas, fundidas por RRF)
+RETRIEVAL_MODO = os.getenv("HEARTGUARD_RAG_MODO", "hibrida")
+CANDIDATOS_FUSAO = 10  # Na híbrida, cada busca traz k*10 candidatos para a fusão
+
+# Índice aproximado gravado pelo llm_core.py --ann (usado no lugar do exato se existir)
+ANN_FILE = "index_ann.faiss"
+FAISS_ANN = os.getenv("HEARTGUARD_FAISS_ANN", "1") == "1"
+HNSW_EF_SEARCH = int(os.getenv("HEARTGUARD_HNSW_EF", "64"))
+IVF_NPROBE = int(os.getenv("HEARTGUARD_IVF_NPROBE", "8"))
+
+# Resultado do rag_eval.py (recall no conjunto de consultas rotuladas) para o índice atual
+EVAL_FILE = "eval.json"
+
+# Índice carregado (FAISS + BM25 com as mesmas posições) + caches da versão dele. O reload
+# monta um novo e troca a referência inteira (nunca altera no lugar): cada busca lê
+# self._indice uma vez e usa só aquele.
+Indice = namedtuple("Indice", "vector_db bm25 ann versao cache_embeddings cache_busca")
+
+
+def criar_embeddings(backend=EMBEDDINGS_BACKEND):
+    if backend == "onnx":
+        model_kwargs = {"backend": "onnx"}
+    elif backend == "onnx_quantizado":
+        model_kwargs = {"backend": "onnx", "model_kwargs": {"file_name": ONNX_QUANTIZADO_ARQUIVO}}
+    else:
+        model_kwargs = {}
+    return HuggingFaceEmbeddings(model_name=EMBEDDINGS_MODEL, model_kwargs=model_kwargs)
+
+
+def carregar_faiss_mmap(index_dir, embeddings):
+    """Carrega o faiss_index_tcc sem desserializar o índice para a memória do processo."""
+    flags = faiss.IO_FLAG_READ_ONLY | faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    index = faiss.read_index(os.path.join(index_dir, "index.faiss"), flags)
+    with open(os.path.join(index_dir, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+    )
+
 
 class MedicalAssistant:
-    def __init__(self):
-        print("🔄 Carregando Cérebro Médico (RAG)...")
+    def __init__(self, cache_size=1024, cache_ttl=24 * 3600, cache_dir=CACHE_DIR, intervalo_checagem=10,
+                 embeddings_backend=EMBEDDINGS_BACKEND, usar_mmap=FAISS_MMAP):
+        print(f"🔄 Carregando Cérebro Médico (RAG) [embeddings: {embeddings_backend}]...")
+        self.usar_mmap = usar_mmap
+        # Cache da query -> embedding e da chave normalizada -> trechos (top-k do FAISS), por versão do índice
+        self._cache_size = cache_size
+        self._cache_ttl = cache_ttl
+        self.cache_dir = cache_dir
+        self.intervalo_checagem = intervalo_checagem
+        self._ultima_checagem = 0.0
+        self._lock_indice = threading.Lock()
+        self._indice = self._indice_vazio()
+        self.avaliacao = None
+        self.modo = RETRIEVAL_MODO
+        # Latência da recuperação por etapa (ms), para o /stats/rag_retrieval
+        self._latencias = {etapa: deque(maxlen=1000) for etapa in ("embedding", "densa", "lexica", "total")}
+        self._lock_latencias = threading.Lock()
         try:
             # Carrega o modelo de embeddings (mesmo usado na criação)
-            self.embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-            
-            # Carrega o banco vetorial salvo
-            if os.path.exists("faiss_index_tcc"):
-                self.vector_db = FAISS.load_local("faiss_index_tcc", self.embeddings, allow_dangerous_deserialization=True)
-                print("✅ Banco FAISS carregado com sucesso!")
-            else:
-                print("⚠️ Banco FAISS não encontrado. O sistema usará respostas genéricas.")
-                self.vector_db = None
+            self.embeddings = criar_embeddings(embeddings_backend)
+            self._indice = self._carregar_indice()
+            # Aquecimento: a 1ª inferência é lenta (alocação/threads), fazemos antes do tráfego real
+            self.embeddings.embed_query("aquecimento")
         except Exception as e:
             print(f"❌ Erro ao carregar IA: {e}")
-            self.vector_db = None
+            self._indice = self._indice_vazio()
+
+    # --- ÍNDICE FAISS + INVALIDAÇÃO DO CACHE ---
+    def _versao_atual(self, pasta=None):
+        """Impressão digital do índice em disco (muda quando o faiss_index_tcc é reconstruído)."""
+        pasta = pasta or pasta_atual(INDEX_DIR)
+        versao = [os.path.basename(pasta)]
+        for nome in ("index.faiss", "index.pkl"):
+            caminho = os.path.join(pasta, nome)
+            if not os.path.exists(caminho):
+                return None
+            st = os.stat(caminho)
+            versao.append((nome, st.st_mtime_ns, st.st_size))
+        return tuple(versao)
+
+    def _indice_vazio(self, versao=None):
+        return Indice(None, None, "flat", versao, LRUTTLCache(self._cache_size, self._cache_ttl),
+                      LRUTTLCache(self._cache_size, self._cache_ttl))
+
+    # Atalhos para a versão atual (stats, rag_eval.py, /ready)
+    @property
+    def vector_db(self):
+        return self._indice.vector_db
+
+    @property
+    def bm25(self):
+        return self._indice.bm25
+
+    @property
+    def ann(self):
+        return self._indice.ann
+
+    @property
+    def _versao_indice(self):
+        return self._indice.versao
+
+    @property
+    def _cache_embeddings(self):
+        return self._indice.cache_embeddings
+
+    @property
+    def _cache_busca(self):
+        return self._indice.cache_busca
+
+    def _carregar_indice(self):
+        """Monta um Indice novo (com caches vazios ou os do disco) sem mexer no que está em uso."""
+        pasta = pasta_atual(INDEX_DIR)  # Resolvida uma vez: um build publicado no meio não mistura versões
+        versao = self._versao_atual(pasta)
+        indice = self._indice_vazio(versao)
+        # Carrega o banco vetorial salvo
+        if versao is None:
+            print("⚠️ Banco FAISS não encontrado. O sistema usará respostas genéricas.")
+            return indice
+        vector_db = None
+        if self.usar_mmap:
+            try:
+                vector_db = carregar_faiss_mmap(pasta, self.embeddings)
+            except Exception as e:
+                print(f"⚠️ mmap do FAISS indisponível ({e}). Carregando em memória.")
+        if vector_db is None:
+            vector_db = FAISS.load_local(pasta, self.embeddings, allow_dangerous_deserialization=True)
+        print("✅ Banco FAISS carregado com sucesso!")
+        bm25 = self._carregar_bm25(pasta, vector_db)
+        ann = self._carregar_ann(pasta, vector_db)
+        self.avaliacao = self._carregar_avaliacao(pasta)
+        if self.cache_dir:
+            n_emb = indice.cache_embeddings.carregar(os.path.join(self.cache_dir, "embeddings.pkl"), versao)
+            n_busca = indice.cache_busca.carregar(os.path.join(self.cache_dir, "busca.pkl"), versao)
+            if n_emb or n_busca:
+                print(f"♻️ Cache do RAG carregado do disco ({n_busca} buscas, {n_emb} embeddings).")
+        return indice._replace(vector_db=vector_db, bm25=bm25, ann=ann)
+
+    @staticmethod
+    def _ids_por_posicao(vector_db):
+        return [vector_db.index_to_docstore_id[i] for i in range(vector_db.index.ntotal)]
+
+    def _carregar_bm25(self, pasta, vector_db):
+        """BM25 gravado pelo llm_core.py; índices antigos (sem bm25.pkl) ganham um em memória."""
+        ids = self._ids_por_posicao(vector_db)
+        caminho = os.path.join(pasta, BM25_FILE)
+        if os.path.exists(caminho):
+            bm25 = BM25Index.carregar(caminho)
+            if bm25.ids == ids:
+                return bm25
+            print("⚠️ bm25.pkl não corresponde ao índice FAISS. Reconstruindo em memória.")
+        docs = [vector_db.docstore.search(i) for i in ids]
+        return BM25Index(ids, [d.page_content for d in docs], [d.metadata for d in docs])
+
+    def _carregar_ann(self, pasta, vector_db):
+        """Troca o índice exato pelo aproximado (HNSW/IVF) se o llm_core.py gravou um."""
+        caminho = os.path.join(pasta, ANN_FILE)
+        if not FAISS_ANN or not os.path.exists(caminho):
+            return "flat"
+        ann = faiss.read_index(caminho)
+        if ann.ntotal != vector_db.index.ntotal:
+            print("⚠️ index_ann.faiss desatualizado. Usando o índice exato.")
+            return "flat"
+        vector_db.index = ann  # Ainda é o vector_db novo, que ninguém está usando
+        tipo = "hnsw" if isinstance(ann, faiss.IndexHNSW) else "ivf" if isinstance(ann, faiss.IndexIVF) else "flat"
+        print(f"🧭 Índice aproximado ({tipo}) carregado.")
+        return tipo
+
+    def _carregar_avaliacao(self, pasta):
+        caminho = os.path.join(pasta, EVAL_FILE)
+        if not os.path.exists(caminho):
+            return None
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _verificar_indice(self):
+        """Recarrega o índice (e zera o cache) se o faiss_index_tcc foi reconstruído."""
+        agora = time.time()
+        if agora - self._ultima_checagem < self.intervalo_checagem:
+            return
+        self._ultima_checagem = agora
+        # None = arquivos sumiram (ex.: apagados à mão): mantém o índice em uso em vez de trocar por um vazio
+        versao = self._versao_atual()
+        if versao is None or versao == self._versao_indice:
+            return
+        with self._lock_indice:
+            versao = self._versao_atual()
+            if versao is not None and versao != self._versao_indice:
+                print("🔄 Índice FAISS mudou no disco. Recarregando e invalidando o cache...")
+                try:
+                    # Troca a referência de uma vez: buscas em andamento terminam no índice antigo
+                    # e gravam no cache antigo, que é descartado junto com ele
+                    novo = self._carregar_indice()
+                    if novo.versao is not None:
+                        self._indice = novo
+                except Exception as e:
+                    print(f"❌ Erro ao recarregar o índice: {e}")
+
+    def salvar_cache(self):
+        """Persiste o cache em disco (chamado no shutdown da API)."""
+        indice = self._indice
+        if not self.cache_dir or indice.versao is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            indice.cache_embeddings.salvar(os.path.join(self.cache_dir, "embeddings.pkl"), indice.versao)
+            indice.cache_busca.salvar(os.path.join(self.cache_dir, "busca.pkl"), indice.versao)
+        except Exception as e:
+            print(f"⚠️ Não foi possível salvar o cache do RAG: {e}")
+
+    def cache_stats(self):
+        indice = self._indice
+        return {
+            "embeddings": indice.cache_embeddings.stats(),
+            "busca": indice.cache_busca.stats(),
+        }
+
+    def _medir(self, etapa, inicio):
+        duracao = time.perf_counter() - inicio
+        with self._lock_latencias:
+            self._latencias[etapa].append(duracao * 1000)
+        observar(SPAN_METRICA, duracao, span=f"rag_{etapa}")  # Também no /metrics
 
-    def get_advice(self, ecg_class, bp, spo2, location_type):
+    def retrieval_stats(self):
+        """Latência por etapa (só buscas que foram ao índice, não as do cache) e o recall da última avaliação."""
+        with self._lock_latencias:
+            latencias = {etapa: np.array(v) for etapa, v in self._latencias.items()}
+        indice = self._indice
+        return {
+            "mode": self.modo,
+            "ann": indice.ann,
+            "chunks": len(indice.bm25) if indice.bm25 is not None else 0,
+            "latency_ms": {
+                etapa: {
+                    "n": len(v),
+                    "p50": round(float(np.percentile(v, 50)), 2) if len(v) else None,
+                    "p95": round(float(np.percentile(v, 95)), 2) if len(v) else None,
+                    "max": round(float(v.max()), 2) if len(v) else None,
+                }
+                for etapa, v in latencias.items()
+            },
+            "eval": self.avaliacao,
+        }
+
+    # --- BUSCA ---
+    def _montar_query(self, chave):
+        ecg_class, faixa_pa, faixa_spo2, location_type = chave
+        return f"Tratamento e protocolo para arritmia {ecg_class} com pressão {faixa_pa} e SpO2 {faixa_spo2} em contexto {location_type}"
+
+    def _vetores(self, indice, queries):
+        """Embeddings das queries (cache + UMA chamada ao modelo para as que faltam)."""
+        vetores = [indice.cache_embeddings.get(q) for q in queries]
+        sem_vetor = [i for i, v in enumerate(vetores) if v is None]
+        if len(sem_vetor) == 1:
+            novos = [self.embeddings.embed_query(queries[sem_vetor[0]])]
+        elif sem_vetor:
+            novos = self.embeddings.embed_documents([queries[i] for i in sem_vetor])
+        for i, vetor in zip(sem_vetor, novos if sem_vetor else []):
+            vetores[i] = vetor
+            indice.cache_embeddings.set(queries[i], vetor)
+        return vetores
+
+    def _parametros_faiss(self, indice, mascara):
+        """Parâmetros da busca FAISS: seletor com os candidatos do filtro e efSearch/nprobe do ANN."""
+        seletor = None
+        if mascara is not None:
+            seletor = faiss.IDSelectorBatch(np.flatnonzero(mascara).astype(np.int64))
+        index = indice.vector_db.index
+        if isinstance(index, faiss.IndexHNSW):
+            params = faiss.SearchParametersHNSW(efSearch=HNSW_EF_SEARCH, sel=seletor)
+        elif isinstance(index, faiss.IndexIVF):
+            params = faiss.SearchParametersIVF(nprobe=IVF_NPROBE, sel=seletor)
+        else:
+            params = faiss.SearchParameters(sel=seletor) if seletor is not None else None
+        return params, seletor  # O seletor precisa continuar vivo durante a busca
+
+    def _recuperar(self, indice, queries, k, filtros=None, modo=None):
+        """
+        Posições (no índice FAISS) dos k melhores chunks de cada query.
+        Os filtros de metadados viram uma máscara aplicada ANTES da pontuação nas
+        duas buscas; na híbrida, os rankings denso e BM25 são fundidos por RRF.
+        """
+        modo = modo or self.modo
+        bm25 = indice.bm25  # Mesma versão do vector_db: as posições das duas buscas batem
+        if bm25 is None:
+            modo = "densa"
+        mascara = bm25.mascara(filtros) if bm25 is not None else None
+        if mascara is not None and not mascara.any():
+            return [[] for _ in queries]
+        n = k * CANDIDATOS_FUSAO if modo == "hibrida" else k
+        inicio_total = time.perf_counter()
+
+        densas = [[] for _ in queries]
+        if modo in ("densa", "hibrida"):
+            inicio = time.perf_counter()
+            vetores = self._vetores(indice, queries)
+            self._medir("embedding", inicio)
+            inicio = time.perf_counter()
+            params, _seletor = self._parametros_faiss(indice, mascara)
+            x = np.asarray(vetores, dtype=np.float32)
+            _, indices = indice.vector_db.index.search(x, n, params=params) if params is not None \
+                else indice.vector_db.index.search(x, n)
+            densas = [[int(i) for i in linha if i != -1] for linha in indices]
+            self._medir("densa", inicio)
+
+        lexicas = [[] for _ in queries]
+        if modo in ("lexica", "hibrida"):
+            inicio = time.perf_counter()
+            lexicas = [bm25.buscar(q, n, mascara) for q in queries]
+            self._medir("lexica", inicio)
+
+        if modo == "hibrida":
+            resultado = [fundir_rrf([d, l], k) for d, l in zip(densas, lexicas)]
+        else:
+            resultado = [(d or l)[:k] for d, l in zip(densas, lexicas)]
+        self._medir("total", inicio_total)
+        return resultado
+
+    @staticmethod
+    def _documento(indice, pos):
+        return indice.vector_db.docstore.search(indice.vector_db.index_to_docstore_id[pos])
+
+    def buscar(self, query, k=2, filtros=None, modo=None):
+        """Chunks (Documents) mais relevantes para uma query livre. Usado também pelo rag_eval.py."""
+        self._verificar_indice()
+        indice = self._indice
+        if not indice.vector_db:
+            return []
+        return [self._documento(indice, pos) for pos in self._recuperar(indice, [query], k, filtros, modo)[0]]
+
+    @staticmethod
+    def _chave_filtros(filtros):
+        if not filtros:
+            return None
+        return tuple(sorted((c, (v,) if isinstance(v, str) else tuple(sorted(v))) for c, v in filtros.items()))
+
+    def _buscar_trechos(self, indice, chaves, k, filtros=None):
+        """Trechos de cada chave normalizada (do cache; as que faltam numa única recuperação em lote)."""
+        chave_filtros = self._chave_filtros(filtros)
+        trechos_por_chave = {}
+        faltando = []
+        for chave in dict.fromkeys(chaves):
+            trechos = indice.cache_busca.get((chave, k, chave_filtros, self.modo))
+            if trechos is None:
+                faltando.append(chave)
+            else:
+                trechos_por_chave[chave] = trechos
+        if faltando:
+            posicoes = self._recuperar(indice, [self._montar_query(c) for c in faltando], k, filtros)
+            for chave, linha in zip(faltando, posicoes):
+                trechos = [self._documento(indice, pos).page_content for pos in linha]
+                indice.cache_busca.set((chave, k, chave_filtros, self.modo), trechos)
+                trechos_por_chave[chave] = trechos
+        return trechos_por_chave
+
+    def get_advice(self, ecg_class, bp, spo2, location_type, filtros=None):
         """
         Gera um conselho médico baseado nos dados vitais e nos PDFs.
+        filtros: restringe as fontes, ex.: {"topico": ["chagas", "rural"]} ou {"source": ["38050006.pdf"]}.
         """
-        # 1. Monta a Query para buscar nos livros/artigos
-        query = f"Tratamento e protocolo para arritmia {ecg_class} com pressão {bp} e SpO2 {spo2} em contexto {location_type}"
+        self._verificar_indice()
+
+        # 1. Monta a chave normalizada (faixas clínicas) para buscar nos livros/artigos
+        chave = normalizar_consulta(ecg_class, bp, spo2, location_type)
         
         contexto = ""
-        if self.vector_db:
-            # Busca os 2 trechos mais relevantes nos seus PDFs
-            docs = self.vector_db.similarity_search(query, k=2)
-            contexto = "\n".join([doc.page_content for doc in docs])
-        
+        indice = self._indice
+        if indice.vector_db:
+            # Busca os 2 trechos mais relevantes nos seus PDFs (ou usa o cache)
+            contexto = "\n".join(self._buscar_trechos(indice, [chave], k=2, filtros=filtros)[chave])
+
+        return self._montar_resposta(ecg_class, location_type, contexto)
+
+    def get_advice_batch(self, eventos, k=2, filtros=None):
+        """
+        Versão em lote do get_advice para vários eventos de uma vez.
+        eventos: lista de tuplas (ecg_class, bp, spo2, location_type).
+        As chaves que não estão no cache são resolvidas com UMA chamada de
+        embed_documents e UMA busca FAISS para o lote inteiro.
+        """
+        self._verificar_indice()
+        chaves = [normalizar_consulta(*ev) for ev in eventos]
+        indice = self._indice
+        trechos_por_chave = self._buscar_trechos(indice, chaves, k, filtros) if indice.vector_db else {}
+
+        return [
+            self._montar_resposta(ev[0], ev[3], "\n".join(trechos_por_chave.get(chave, [])))
+            for ev, chave in zip(eventos, chaves)
+        ]
+
+    def _montar_resposta(self, ecg_class, location_type, contexto):
         # 2. Monta a Resposta Final (Aqui simulamos o LLM final gerando o texto)
         # Num sistema real com GPT-4, passaríamos o 'contexto' para ele.
         # Como estamos rodando local sem API paga, vamos usar o contexto para estruturar a resposta.
         
         resposta_base = f"ANÁLISE IA (Baseada em Protocolos SBC/MS):\n"
         
-        if "VENTRICULAR" in ecg_class.upper() or "PERIGO" in ecg_class.upper():
+        ritmo = classificar_ritmo(ecg_class)
+        if ritmo == RhythmClass.V:
             resposta_base += f"🚨 ALERTA CRÍTICO: Padrão ventricular detectado.\n"
             if location_type == "RURAL_REMOTA":
                 resposta_base += "📍 PROTOCOLO RURAL: Estabilização imediata necessária. Acionar telemedicina via satélite. Considerar uso de Amiodarona se disponível (conforme Consenso Chagas).\n"
@@ -48,11 +436,11 @@ class MedicalAssistant:
             
             resposta_base += f"\n📚 EVIDÊNCIA ENCONTRADA NOS MANUAIS:\n{contexto[:2000]}..." # Mostra um trecho do PDF para provar que leu
             
-        elif "ARRITMIA" in ecg_class.upper():
+        elif ritmo == RhythmClass.S:
             resposta_base += "⚠️ ATENÇÃO: Arritmia Supraventricular/Extrassístole.\n"
             resposta_base += "Monitorar evolução. Se paciente chagásico, investigar progressão da cardiopatia."
             
         else:
             resposta_base += "✅ Sinais estáveis. Manter monitoramento de rotina."
 
-        return resposta_base
\ No newline at end of file
+        return resposta_base
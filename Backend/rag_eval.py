@@ -0,0 +1,88 @@
+"""
+Avaliação da recuperação do RAG num conjunto pequeno de consultas rotuladas.
+
+Uso:
+    python rag_eval.py                      # k=2, modos densa, lexica e hibrida
+    python rag_eval.py --k 5 --modos hibrida
+
+Cada consulta do rag_eval_queries.json lista as fontes (PDFs) que deveriam
+aparecer nos k primeiros chunks e, opcionalmente, filtros de metadados.
+Mede recall@k (fração das fontes esperadas encontradas), hit rate e a latência
+da recuperação por consulta. O resultado vai para o eval.json da versão atual do
+faiss_index_tcc e aparece no /stats/rag_retrieval da API enquanto o índice não for
+reconstruído.
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+import numpy as np
+
+QUERIES_FILE = "rag_eval_queries.json"
+MODOS = ("densa", "lexica", "hibrida")
+
+
+def avaliar(assistant, consultas, k, modos=MODOS):
+    resultado = {}
+    for modo in modos:
+        assistant._cache_embeddings.clear()  # Mede a latência real, sem embeddings de outro modo
+        recalls, acertos, latencias = [], [], []
+        for consulta in consultas:
+            inicio = time.perf_counter()
+            docs = assistant.buscar(consulta["query"], k=k, filtros=consulta.get("filtros"), modo=modo)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            esperadas = set(consulta["fontes"])
+            encontradas = esperadas & {d.metadata.get("source") for d in docs}
+            recalls.append(len(encontradas) / min(len(esperadas), k))
+            acertos.append(bool(encontradas))
+        resultado[modo] = {
+            "recall": round(float(np.mean(recalls)), 3),
+            "hit_rate": round(float(np.mean(acertos)), 3),
+            "latency_ms": {
+                "p50": round(float(np.percentile(latencias, 50)), 2),
+                "p95": round(float(np.percentile(latencias, 95)), 2),
+            },
+        }
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall e latência da recuperação do RAG (consultas rotuladas).")
+    parser.add_argument("--queries", default=QUERIES_FILE, help="Arquivo JSON com as consultas rotuladas")
+    parser.add_argument("--k", type=int, default=2, help="Chunks recuperados por consulta")
+    parser.add_argument("--modos", nargs="+", choices=MODOS, default=list(MODOS))
+    args = parser.parse_args()
+
+    from index_store import pasta_atual
+    from rag_engine import INDEX_DIR, EVAL_FILE, MedicalAssistant
+
+    with open(args.queries, encoding="utf-8") as f:
+        consultas = json.load(f)
+    assistant = MedicalAssistant(cache_dir=None)
+    if assistant.vector_db is None:
+        print("❌ Índice FAISS não encontrado. Rode o llm_core.py antes.")
+        return
+
+    modos = avaliar(assistant, consultas, args.k, args.modos)
+    print(f"\n📊 {len(consultas)} consultas, k={args.k}, índice {assistant.ann}:")
+    print(f"   {'modo':<10} {'recall':>7} {'hit':>7} {'p50 ms':>9} {'p95 ms':>9}")
+    for modo, r in modos.items():
+        print(f"   {modo:<10} {r['recall']:>7.3f} {r['hit_rate']:>7.3f} "
+              f"{r['latency_ms']['p50']:>9.2f} {r['latency_ms']['p95']:>9.2f}")
+
+    avaliacao = {
+        "k": args.k,
+        "queries": len(consultas),
+        "ann": assistant.ann,
+        "evaluated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "modes": modos,
+    }
+    caminho = os.path.join(pasta_atual(INDEX_DIR), EVAL_FILE)
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(avaliacao, f, ensure_ascii=False, indent=2)
+    print(f"💾 Resultado salvo em {caminho}")
+
+
+if __name__ == "__main__":
+    main()
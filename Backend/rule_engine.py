@@ -0,0 +1,408 @@
+"""
+Regras de alerta dos sinais vitais, avaliadas a cada evento na ingestão (/analyze
+e /analyze_batch) contra os alvos do cadastro (Target_Sys, Target_Dia, Target_SpO2).
+
+Uso:
+    python rule_engine.py --exportar regras_alerta.json   # grava as regras padrão para editar
+    python rule_engine.py --validar regras_alerta.json    # confere um arquivo antes de publicar
+
+Cada paciente tem um estado pequeno e de tamanho fixo em memória (nada é lido do
+histórico): EWMA de cada sinal, janela deslizante das últimas leituras (com as somas
+para média e tendência em O(1)) e o início do período fora do alvo de cada regra.
+
+Tipos de regra (arquivo JSON, recarregado sozinho quando muda, sem reiniciar a API):
+
+    limite      {"sinal": "sys", "fonte": "ewma", "margem": 20}    EWMA > alvo + 20
+                {"sinal": "spo2", "fonte": "valor", "absoluto": 88} leitura < 88
+                fonte: "valor" (leitura atual), "ewma" ou "media" (janela)
+    tempo_fora  {"sinal": "sys", "margem": 10, "segundos": 1800}    30 min seguidos acima de alvo + 10
+    tendencia   {"sinal": "spo2", "por_hora": 4, "min_amostras": 5} caindo 4 pontos/h na janela
+
+"Fora do alvo" é acima do alvo para a PA (sys/dia) e abaixo para a SpO2. Regras com
+"margem" precisam do alvo cadastrado; sem ele, só valem as com "absoluto" e as de tendência.
+Cada regra dispara uma vez quando a condição começa e rearma quando ela volta ao normal
+(o AlertDispatcher ainda junta os alertas do mesmo paciente num SMS).
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from datetime import datetime
+from metrics import metricas, span
+
+REGRAS_FILE = os.getenv("HEARTGUARD_REGRAS", "regras_alerta.json")
+VERIFICAR_REGRAS = 2.0  # Segundos entre duas olhadas no arquivo de regras (os.stat)
+MAX_PACIENTES = 50000  # Estados em memória; acima disso sai o paciente sem evento há mais tempo
+RECALCULAR_A_CADA = 1000  # Eventos entre recálculos exatos das somas da janela (erro de ponto flutuante)
+MIN_INTERVALO_TENDENCIA = 60  # Segundos mínimos cobertos pela janela para estimar a tendência
+
+# sinal -> (campo do VitalSigns, coluna do alvo no cadastro, direção ruim: +1 acima, -1 abaixo)
+SINAIS = {
+    "sys": ("systolic", "Target_Sys", 1),
+    "dia": ("diastolic", "Target_Dia", 1),
+    "spo2": ("spo2", "Target_SpO2", -1),
+}
+_ORDEM = list(SINAIS)
+TIPOS = ("limite", "tempo_fora", "tendencia")
+FONTES = ("valor", "ewma", "media")
+FORMATOS_TIMESTAMP = ("%Y-%m-%d %H:%M:%S", "%d/%m/%Y %H:%M:%S")  # O relógio manda o primeiro
+
+REGRAS_PADRAO = {
+    "ewma_alfa": 0.3,
+    "janela": 20,
+    "regras": [
+        {"nome": "pa_sistolica_critica", "tipo": "limite", "sinal": "sys", "fonte": "valor", "absoluto": 180,
+         "severidade": "critico", "mensagem": "PA sistólica de {valor:.0f} mmHg (limite {limiar:.0f})"},
+        {"nome": "spo2_critica", "tipo": "limite", "sinal": "spo2", "fonte": "valor", "absoluto": 88,
+         "severidade": "critico", "mensagem": "SpO2 de {valor:.0f}% (limite {limiar:.0f}%)"},
+        {"nome": "pa_sistolica_acima_do_alvo", "tipo": "limite", "sinal": "sys", "fonte": "ewma", "margem": 20,
+         "mensagem": "PA sistólica média de {valor:.0f} mmHg, alvo {alvo} mmHg"},
+        {"nome": "pa_diastolica_acima_do_alvo", "tipo": "limite", "sinal": "dia", "fonte": "ewma", "margem": 15,
+         "mensagem": "PA diastólica média de {valor:.0f} mmHg, alvo {alvo} mmHg"},
+        {"nome": "spo2_abaixo_do_alvo", "tipo": "limite", "sinal": "spo2", "fonte": "ewma", "margem": 3,
+         "mensagem": "SpO2 média de {valor:.0f}%, alvo {alvo}%"},
+        {"nome": "pa_fora_do_alvo_prolongada", "tipo": "tempo_fora", "sinal": "sys", "margem": 10, "segundos": 1800,
+         "mensagem": "PA sistólica acima do alvo ({alvo} mmHg) há {minutos:.0f} min"},
+        {"nome": "spo2_em_queda", "tipo": "tendencia", "sinal": "spo2", "por_hora": 4, "min_amostras": 5,
+         "mensagem": "SpO2 caindo {por_hora:.1f} pontos por hora (agora {valor:.0f}%)"},
+        {"nome": "pa_em_subida", "tipo": "tendencia", "sinal": "sys", "por_hora": 30, "min_amostras": 5,
+         "mensagem": "PA sistólica subindo {por_hora:.0f} mmHg por hora (agora {valor:.0f} mmHg)"},
+    ],
+}
+
+Disparo = namedtuple("Disparo", "paciente regra severidade mensagem valor")
+
+metricas.descrever("heartguard_rule_alerts_total", "counter", "Regras de sinais vitais disparadas.")
+
+
+# --- ARQUIVO DE REGRAS ---
+def validar_regras(config):
+    """Confere e completa a configuração (ValueError com o motivo se algo estiver errado)."""
+    if not isinstance(config, dict) or not isinstance(config.get("regras"), list):
+        raise ValueError('Esperado um objeto com a lista "regras".')
+    alfa = float(config.get("ewma_alfa", REGRAS_PADRAO["ewma_alfa"]))
+    janela = int(config.get("janela", REGRAS_PADRAO["janela"]))
+    if not 0 < alfa <= 1:
+        raise ValueError(f"ewma_alfa deve estar em (0, 1]: {alfa}")
+    if janela < 2:
+        raise ValueError(f"janela deve ter pelo menos 2 leituras: {janela}")
+
+    regras, nomes = [], set()
+    for i, regra in enumerate(config["regras"]):
+        regra = dict(regra)
+        nome = regra.get("nome") or f"regra_{i}"
+        if nome in nomes:
+            raise ValueError(f"Regra repetida: {nome}")
+        nomes.add(nome)
+        if regra.get("tipo") not in TIPOS:
+            raise ValueError(f"{nome}: tipo deve ser um de {TIPOS}")
+        if regra.get("sinal") not in SINAIS:
+            raise ValueError(f"{nome}: sinal deve ser um de {tuple(SINAIS)}")
+        if regra["tipo"] == "limite":
+            if regra.setdefault("fonte", "valor") not in FONTES:
+                raise ValueError(f"{nome}: fonte deve ser uma de {FONTES}")
+            if ("margem" in regra) == ("absoluto" in regra):
+                raise ValueError(f"{nome}: informe margem (relativa ao alvo) OU absoluto")
+        elif regra["tipo"] == "tempo_fora":
+            regra.setdefault("margem", 0)
+            if float(regra.get("segundos", 0)) <= 0:
+                raise ValueError(f"{nome}: segundos deve ser positivo")
+        elif float(regra.get("por_hora", 0)) <= 0:
+            raise ValueError(f"{nome}: por_hora deve ser positivo")
+        regra["nome"] = nome
+        regra["severidade"] = regra.get("severidade", "alerta")
+        regra["min_amostras"] = max(2, int(regra.get("min_amostras", 3)))
+        regra.setdefault("mensagem", f"{nome}: {{valor:.0f}}")
+        try:
+            regra["mensagem"].format(valor=0.0, alvo=0, limiar=0.0, minutos=0.0, por_hora=0.0)
+        except (KeyError, IndexError, ValueError) as e:
+            raise ValueError(f"{nome}: mensagem inválida ({e})")
+        regras.append(regra)
+    return {"ewma_alfa": alfa, "janela": janela, "regras": regras}
+
+
+def instante(timestamp):
+    """Segundos (epoch) do timestamp do relógio; hora do servidor se não der para ler."""
+    for formato in FORMATOS_TIMESTAMP:
+        try:
+            return datetime.strptime(timestamp, formato).timestamp()
+        except (TypeError, ValueError):
+            continue
+    return time.time()
+
+
+def _mensagem(regra, detalhes):
+    try:
+        return regra["mensagem"].format(**detalhes)
+    except (TypeError, ValueError):  # Ex.: "{alvo:.0f}" num paciente sem alvo cadastrado
+        return f"{regra['nome']}: {detalhes['valor']:.0f}"
+
+
+# --- ESTADO POR PACIENTE (tamanho fixo) ---
+class _Estado:
+    __slots__ = ("t0", "ultimo_t", "eventos", "leituras", "st", "stt", "sy", "sty", "ewma", "fora_desde", "ativas")
+
+    def __init__(self, t, janela):
+        self.t0 = t  # Origem do tempo da janela (em horas a partir daqui, para as somas ficarem pequenas)
+        self.ultimo_t = t
+        self.eventos = 0
+        self.leituras = deque(maxlen=janela)  # (horas, sys, dia, spo2)
+        self.st = self.stt = 0.0
+        self.sy = [0.0] * len(SINAIS)
+        self.sty = [0.0] * len(SINAIS)
+        self.ewma = None
+        self.fora_desde = {}  # regra tempo_fora -> início do período fora do alvo
+        self.ativas = set()  # regras com a condição verdadeira (não disparam de novo até rearmar)
+
+    def adicionar(self, t, valores, alfa):
+        h = (t - self.t0) / 3600
+        if len(self.leituras) == self.leituras.maxlen:
+            velho = self.leituras[0]
+            self.st -= velho[0]
+            self.stt -= velho[0] * velho[0]
+            for i, y in enumerate(velho[1:]):
+                self.sy[i] -= y
+                self.sty[i] -= velho[0] * y
+        self.leituras.append((h, *valores))
+        self.st += h
+        self.stt += h * h
+        for i, y in enumerate(valores):
+            self.sy[i] += y
+            self.sty[i] += h * y
+        self.ewma = list(valores) if self.ewma is None else \
+            [e + alfa * (y - e) for e, y in zip(self.ewma, valores)]
+        self.ultimo_t = t
+        self.eventos += 1
+        if self.eventos % RECALCULAR_A_CADA == 0:
+            self._recalcular(t)
+
+    def _recalcular(self, t):
+        """Rebaseia o tempo e refaz as somas a partir da janela (o erro das subtrações não acumula)."""
+        desloc = (t - self.t0) / 3600
+        self.t0 = t
+        self.leituras = deque(((h - desloc, *v) for h, *v in self.leituras), maxlen=self.leituras.maxlen)
+        self.st = sum(l[0] for l in self.leituras)
+        self.stt = sum(l[0] * l[0] for l in self.leituras)
+        self.sy = [sum(l[i + 1] for l in self.leituras) for i in range(len(SINAIS))]
+        self.sty = [sum(l[0] * l[i + 1] for l in self.leituras) for i in range(len(SINAIS))]
+
+    def media(self, i):
+        return self.sy[i] / len(self.leituras)
+
+    def inclinacao(self, i):
+        """Tendência por hora (mínimos quadrados na janela), ou None se a janela cobre pouco tempo."""
+        n = len(self.leituras)
+        if (self.leituras[-1][0] - self.leituras[0][0]) * 3600 < MIN_INTERVALO_TENDENCIA:
+            return None
+        denominador = n * self.stt - self.st * self.st
+        if denominador <= 0:
+            return None
+        return (n * self.sty[i] - self.st * self.sy[i]) / denominador
+
+
+class RuleEngine:
+    """
+    Avaliação incremental das regras de sinais vitais por paciente.
+
+    avaliar(data) custa O(nº de regras) e não consulta o banco: usa o estado do
+    paciente em memória e os alvos do PatientRegistry (índice em memória). As regras
+    vêm de um JSON recarregado quando o arquivo muda; se o arquivo novo for inválido,
+    as regras anteriores continuam valendo.
+    """
+
+    def __init__(self, registry=None, regras_file=REGRAS_FILE, max_pacientes=MAX_PACIENTES,
+                 verificar=VERIFICAR_REGRAS):
+        self.registry = registry
+        self.regras_file = regras_file
+        self.max_pacientes = max_pacientes
+        self.verificar = verificar
+        self._lock = threading.Lock()
+        self._estados = OrderedDict()  # paciente -> _Estado (ordem = último evento, para descartar o mais antigo)
+        self._assinatura = None  # (mtime, tamanho) do arquivo carregado
+        self._proxima_verificacao = 0.0
+        self.origem = "padrão"
+        self.config = validar_regras(REGRAS_PADRAO)
+        self.disparos = {}  # regra -> vezes que disparou
+        self._recarregar_se_mudou(forcar=True)
+
+    # --- REGRAS (hot reload) ---
+    def _recarregar_se_mudou(self, forcar=False):
+        agora = time.monotonic()
+        if not forcar and agora < self._proxima_verificacao:
+            return
+        self._proxima_verificacao = agora + self.verificar
+        try:
+            info = os.stat(self.regras_file)
+            assinatura = (info.st_mtime_ns, info.st_size)
+        except (OSError, TypeError):
+            assinatura = None
+        if assinatura == self._assinatura:
+            return
+        self._assinatura = assinatura
+        if assinatura is None:
+            config, origem = REGRAS_PADRAO, "padrão"
+        else:
+            try:
+                with open(self.regras_file, encoding="utf-8") as f:
+                    config, origem = json.load(f), self.regras_file
+            except (OSError, ValueError) as e:
+                print(f"❌ Erro ao ler {self.regras_file}: {e}. Mantendo as regras atuais.")
+                return
+        try:
+            config = validar_regras(config)
+        except (ValueError, TypeError) as e:
+            print(f"❌ Regras inválidas em {self.regras_file}: {e}. Mantendo as regras atuais.")
+            return
+        if config["janela"] != self.config["janela"]:
+            self._estados.clear()  # Janela de outro tamanho: os estados recomeçam
+        self.config, self.origem = config, origem
+        print(f"📏 {len(config['regras'])} regras de sinais vitais carregadas ({origem}).")
+
+    def recarregar(self):
+        with self._lock:
+            self._recarregar_se_mudou(forcar=True)
+
+    # --- AVALIAÇÃO (a cada evento) ---
+    def _alvos(self, paciente):
+        registro = self.registry.get(paciente) if self.registry is not None else None
+        return {sinal: registro.get(coluna) if registro else None for sinal, (_, coluna, _) in SINAIS.items()}
+
+    def avaliar(self, data, t=None):
+        """Atualiza o estado do paciente com o VitalSigns e devolve a lista de Disparo novos."""
+        with span("rules_eval"):
+            alvos = self._alvos(data.patient_name)
+            t = instante(data.timestamp) if t is None else t
+            valores = tuple(float(getattr(data, campo)) for campo, _, _ in SINAIS.values())
+            with self._lock:
+                self._recarregar_se_mudou()
+                estado = self._estado(data.patient_name, t)
+                t = max(t, estado.ultimo_t)  # Evento atrasado não volta o relógio do paciente
+                estado.adicionar(t, valores, self.config["ewma_alfa"])
+                novos = []
+                for regra in self.config["regras"]:
+                    detalhes = self._condicao(regra, estado, valores, alvos, t)
+                    if detalhes is None:
+                        estado.ativas.discard(regra["nome"])
+                    elif regra["nome"] not in estado.ativas:
+                        estado.ativas.add(regra["nome"])
+                        self.disparos[regra["nome"]] = self.disparos.get(regra["nome"], 0) + 1
+                        novos.append(Disparo(data.patient_name, regra["nome"], regra["severidade"],
+                                             _mensagem(regra, detalhes), detalhes["valor"]))
+        for disparo in novos:
+            metricas.contar("heartguard_rule_alerts_total", regra=disparo.regra)
+        return novos
+
+    def _estado(self, paciente, t):
+        estado = self._estados.get(paciente)
+        if estado is None:
+            estado = self._estados[paciente] = _Estado(t, self.config["janela"])
+            if len(self._estados) > self.max_pacientes:
+                self._estados.popitem(last=False)
+        else:
+            self._estados.move_to_end(paciente)
+        return estado
+
+    @staticmethod
+    def _condicao(regra, estado, valores, alvos, t):
+        """Valores para a mensagem se a condição da regra é verdadeira agora, senão None."""
+        i = _ORDEM.index(regra["sinal"])
+        direcao = SINAIS[regra["sinal"]][2]
+        alvo = alvos[regra["sinal"]]
+        detalhes = {"valor": valores[i], "alvo": alvo, "limiar": 0.0, "minutos": 0.0, "por_hora": 0.0}
+
+        if regra["tipo"] == "tendencia":
+            if len(estado.leituras) < regra["min_amostras"]:
+                return None
+            inclinacao = estado.inclinacao(i)
+            if inclinacao is None or direcao * inclinacao < regra["por_hora"]:
+                return None
+            detalhes["por_hora"] = abs(inclinacao)
+            return detalhes
+
+        if "absoluto" in regra:
+            limiar = float(regra["absoluto"])
+        elif alvo is None:
+            return None  # Regra relativa ao alvo e paciente sem alvo cadastrado
+        else:
+            limiar = alvo + direcao * float(regra["margem"])
+        detalhes["limiar"] = limiar
+
+        if regra["tipo"] == "limite":
+            fonte = regra["fonte"]
+            valor = estado.ewma[i] if fonte == "ewma" else estado.media(i) if fonte == "media" else valores[i]
+            detalhes["valor"] = valor
+            return detalhes if direcao * (valor - limiar) > 0 else None
+
+        # tempo_fora: período contínuo com a leitura fora do alvo
+        if direcao * (valores[i] - limiar) <= 0:
+            estado.fora_desde.pop(regra["nome"], None)
+            return None
+        inicio = estado.fora_desde.setdefault(regra["nome"], t)
+        if t - inicio < float(regra["segundos"]):
+            return None
+        detalhes["minutos"] = (t - inicio) / 60
+        return detalhes
+
+    # --- CONSULTA ---
+    def estado(self, paciente):
+        """EWMA, média e tendência de cada sinal + regras ativas do paciente (ou None)."""
+        with self._lock:
+            estado = self._estados.get(paciente)
+            if estado is None:
+                return None
+            sinais = {}
+            for i, sinal in enumerate(_ORDEM):
+                inclinacao = estado.inclinacao(i) if len(estado.leituras) >= 2 else None
+                sinais[sinal] = {
+                    "last": estado.leituras[-1][i + 1],
+                    "ewma": round(estado.ewma[i], 2),
+                    "window_mean": round(estado.media(i), 2),
+                    "trend_per_hour": None if inclinacao is None else round(inclinacao, 2),
+                }
+            return {
+                "patient": paciente,
+                "readings_in_window": len(estado.leituras),
+                "last_reading": datetime.fromtimestamp(estado.ultimo_t).strftime("%Y-%m-%d %H:%M:%S"),
+                "signals": sinais,
+                "targets": self._alvos(paciente),
+                "out_of_target_since": {
+                    regra: datetime.fromtimestamp(inicio).strftime("%Y-%m-%d %H:%M:%S")
+                    for regra, inicio in estado.fora_desde.items()
+                },
+                "active_rules": sorted(estado.ativas),
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "source": self.origem,
+                "rules": [r["nome"] for r in self.config["regras"]],
+                "patients_tracked": len(self._estados),
+                "fired": dict(self.disparos),
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regras de alerta dos sinais vitais.")
+    parser.add_argument("--exportar", default=None, help="Grava as regras padrão neste arquivo JSON")
+    parser.add_argument("--validar", default=None, help="Confere um arquivo de regras")
+    args = parser.parse_args()
+
+    if args.exportar:
+        with open(args.exportar, "w", encoding="utf-8") as f:
+            json.dump(REGRAS_PADRAO, f, ensure_ascii=False, indent=2)
+        print(f"💾 Regras padrão salvas em {args.exportar}")
+    if args.validar:
+        with open(args.validar, encoding="utf-8") as f:
+            config = validar_regras(json.load(f))
+        print(f"✅ {len(config['regras'])} regras válidas em {args.validar}:")
+        for regra in config["regras"]:
+            print(f"   {regra['nome']:<32} {regra['tipo']:<11} {regra['sinal']:<5} {regra['severidade']}")
+    if not args.exportar and not args.validar:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
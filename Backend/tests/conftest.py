@@ -0,0 +1,5 @@
+# Os módulos do Backend são importados pelo nome (como a API faz rodando de dentro da pasta)
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,133 @@
+"""
+Regras dos sinais vitais (rule_engine.py): disparo único com rearme, somas da janela
+depois dos recálculos e hot reload que mantém as regras se o arquivo novo for inválido.
+
+Rodar de dentro de Backend/:  python -m pytest tests
+"""
+import json
+import os
+import random
+import numpy as np
+import pytest
+import rule_engine
+from rule_engine import RuleEngine
+from vitals import VitalSigns
+
+ALVOS = {"Target_Sys": 130, "Target_Dia": 85, "Target_SpO2": 95}
+
+
+class RegistroFalso:
+    def get(self, nome):
+        return dict(ALVOS)
+
+
+def sinais(sys=120, dia=80, spo2=97, paciente="Maria"):
+    return VitalSigns(patient_name=paciente, location_type="Rural", timestamp="2026-01-01 00:00:00",
+                      systolic=sys, diastolic=dia, spo2=spo2, rhythm="N")
+
+
+def gravar(caminho, config):
+    with open(caminho, "w", encoding="utf-8") as f:
+        if isinstance(config, dict):
+            json.dump(config, f)
+        else:
+            f.write(config)
+    # Garante outra assinatura (mtime, tamanho) mesmo em sistemas de arquivos com mtime grosso
+    info = os.stat(caminho)
+    os.utime(caminho, ns=(info.st_atime_ns, info.st_mtime_ns + 10 ** 9))
+
+
+def motor(tmp_path, regras, janela=20):
+    caminho = tmp_path / "regras.json"
+    gravar(caminho, {"ewma_alfa": 0.3, "janela": janela, "regras": regras})
+    return RuleEngine(RegistroFalso(), regras_file=str(caminho), verificar=0)
+
+
+def nomes(disparos):
+    return [d.regra for d in disparos]
+
+
+def test_limite_dispara_uma_vez_e_rearma(tmp_path):
+    engine = motor(tmp_path, [{"nome": "pa_critica", "tipo": "limite", "sinal": "sys", "absoluto": 180}])
+    sequencia = [170, 185, 190, 175, 186]
+    disparos = [nomes(engine.avaliar(sinais(sys=s), t=60.0 * i)) for i, s in enumerate(sequencia)]
+    assert disparos == [[], ["pa_critica"], [], [], ["pa_critica"]]
+    assert engine.stats()["fired"] == {"pa_critica": 2}
+
+
+def test_limite_relativo_ao_alvo(tmp_path):
+    engine = motor(tmp_path, [{"nome": "spo2_baixa", "tipo": "limite", "sinal": "spo2", "margem": 3}])
+    assert nomes(engine.avaliar(sinais(spo2=93), t=0.0)) == []
+    disparo, = engine.avaliar(sinais(spo2=91), t=60.0)  # Alvo 95 - 3
+    assert disparo.regra == "spo2_baixa" and disparo.valor == 91
+
+
+def test_tempo_fora_dispara_uma_vez_e_rearma(tmp_path):
+    engine = motor(tmp_path, [{"nome": "pa_fora", "tipo": "tempo_fora", "sinal": "sys", "margem": 10,
+                               "segundos": 1800}])
+    # Alvo 130 + 10: fora do alvo a partir de 141
+    eventos = [(0, 150), (900, 155), (1800, 150), (2700, 160), (3600, 130), (4000, 150), (5000, 150), (5800, 150)]
+    disparos = [nomes(engine.avaliar(sinais(sys=s), t=float(t))) for t, s in eventos]
+    assert disparos == [[], [], ["pa_fora"], [], [], [], [], ["pa_fora"]]
+
+
+def test_tendencia_dispara_uma_vez_e_rearma(tmp_path):
+    engine = motor(tmp_path, [{"nome": "spo2_em_queda", "tipo": "tendencia", "sinal": "spo2", "por_hora": 4,
+                               "min_amostras": 5}], janela=5)
+    # Leituras a cada 5 min: queda de 12 pontos/h, depois estável, depois queda de novo
+    spo2 = [98, 97, 96, 95, 94, 93, 92] + [92] * 6 + [91, 90, 89, 88, 87]
+    disparos = [nomes(engine.avaliar(sinais(spo2=v), t=300.0 * i)) for i, v in enumerate(spo2)]
+    assert [i for i, d in enumerate(disparos) if d] == [4, 14]
+    assert engine.stats()["fired"] == {"spo2_em_queda": 2}
+
+
+def conferir_janela(estado, tempos):
+    """Somas incrementais == recalculadas do zero a partir das leituras da janela."""
+    leituras = np.array(estado.leituras)
+    horas, valores = leituras[:, 0], leituras[:, 1:]
+    # Depois do rebase as horas continuam sendo as dos eventos, medidas a partir do novo t0
+    assert horas == pytest.approx((np.array(tempos[-len(horas):]) - estado.t0) / 3600, abs=1e-9)
+    assert estado.st == pytest.approx(horas.sum(), rel=1e-9)
+    assert estado.stt == pytest.approx((horas ** 2).sum(), rel=1e-9)
+    assert estado.sy == pytest.approx(valores.sum(axis=0).tolist(), rel=1e-9)
+    assert estado.sty == pytest.approx((horas[:, None] * valores).sum(axis=0).tolist(), rel=1e-9)
+    for i in range(valores.shape[1]):
+        assert estado.media(i) == pytest.approx(valores[:, i].mean())
+        assert estado.inclinacao(i) == pytest.approx(np.polyfit(horas, valores[:, i], 1)[0], rel=1e-6)
+
+
+def test_somas_da_janela_apos_recalculos(tmp_path):
+    engine = motor(tmp_path, [{"nome": "pa_critica", "tipo": "limite", "sinal": "sys", "absoluto": 180}])
+    aleatorio = random.Random(7)
+    # Logo depois do 2º rebase (janela com leituras de antes e depois) e bem depois dele (só subtrações)
+    conferir_em = {2 * rule_engine.RECALCULAR_A_CADA + 5, 2 * rule_engine.RECALCULAR_A_CADA + 357}
+    t, tempos = 1.7e9, []
+    for n in range(1, max(conferir_em) + 1):
+        t += aleatorio.uniform(30, 600)
+        tempos.append(t)
+        engine.avaliar(sinais(sys=aleatorio.randint(90, 200), dia=aleatorio.randint(50, 120),
+                              spo2=aleatorio.randint(80, 100)), t=t)
+        if n in conferir_em:
+            estado = engine._estados["Maria"]
+            assert estado.eventos == n
+            conferir_janela(estado, tempos)
+
+
+def test_arquivo_invalido_mantem_regras_anteriores(tmp_path):
+    engine = motor(tmp_path, [{"nome": "pa_critica", "tipo": "limite", "sinal": "sys", "absoluto": 180}])
+    caminho = engine.regras_file
+    assert engine.stats()["source"] == caminho
+    assert engine.stats()["rules"] == ["pa_critica"]
+
+    gravar(caminho, '{"regras": [')  # JSON quebrado
+    engine.recarregar()
+    assert engine.stats()["rules"] == ["pa_critica"]
+
+    gravar(caminho, {"regras": [{"nome": "x", "tipo": "desconhecido", "sinal": "sys"}]})
+    engine.recarregar()
+    assert engine.stats()["rules"] == ["pa_critica"]
+    assert nomes(engine.avaliar(sinais(sys=190), t=0.0)) == ["pa_critica"]
+
+    gravar(caminho, {"regras": [{"nome": "spo2_critica", "tipo": "limite", "sinal": "spo2", "absoluto": 88}]})
+    engine.recarregar()
+    assert engine.stats()["rules"] == ["spo2_critica"]
@@ -0,0 +1,154 @@
+import re
+from enum import Enum
+from typing import Optional
+from pydantic import BaseModel, model_validator
+
+# Faixas aceitas na entrada da API (fora disso é erro de leitura do sensor ou de digitação)
+LIMITES_SISTOLICA = (40, 300)
+LIMITES_DIASTOLICA = (20, 200)
+LIMITES_SPO2 = (50, 100)
+
+_RE_PA = re.compile(r"\s*(\d+)\s*/\s*(\d+)")
+_RE_SPO2 = re.compile(r"\s*(\d+)")
+
+
+class RhythmClass(str, Enum):
+    """Classes AAMI de ritmo (mesmas do notebook e do beat_classifier)."""
+
+    N = "N"  # Normal
+    S = "S"  # Supraventricular (arritmia / extrassístole)
+    V = "V"  # Ventricular (perigo)
+    F = "F"  # Fusão
+    Q = "Q"  # Não classificável
+
+    @property
+    def perigo(self):
+        return self is RhythmClass.V
+
+    @property
+    def descricao(self):
+        return _DESCRICOES[self]
+
+
+_DESCRICOES = {
+    RhythmClass.N: "Normal",
+    RhythmClass.S: "Arritmia Supraventricular",
+    RhythmClass.V: "PERIGO VENTRICULAR",
+    RhythmClass.F: "Batimento de Fusão",
+    RhythmClass.Q: "Não classificável",
+}
+
+# Textos livres que os apps já enviam em ecg_status (a ordem importa: o primeiro que casar vence)
+_PALAVRAS_RITMO = [
+    ("SUPRAVENTRICULAR", RhythmClass.S),  # Antes de "VENTRICULAR", que é substring dele
+    ("VENTRICULAR", RhythmClass.V),
+    ("PERIGO", RhythmClass.V),
+    ("ANORMALIDADE", RhythmClass.V),
+    ("ARRITMIA", RhythmClass.S),
+    ("EXTRASS", RhythmClass.S),
+    ("FUS", RhythmClass.F),
+    ("NORMAL", RhythmClass.N),
+]
+
+
+def classificar_ritmo(status):
+    """RhythmClass a partir da classe AAMI ('N', 'V'...) ou do texto antigo ('PERIGO VENTRICULAR')."""
+    if isinstance(status, RhythmClass):
+        return status
+    texto = " ".join(str(status or "").upper().split())
+    if texto in RhythmClass.__members__:
+        return RhythmClass[texto]
+    for palavra, classe in _PALAVRAS_RITMO:
+        if palavra in texto:
+            return classe
+    return RhythmClass.Q
+
+
+def parse_pressao(valor):
+    """(sistólica, diastólica) em int a partir de '120/80' ou de uma tupla. None se não houver número."""
+    if valor is None:
+        return None
+    if isinstance(valor, (tuple, list)):
+        return (int(valor[0]), int(valor[1])) if None not in valor[:2] else None
+    m = _RE_PA.match(str(valor))
+    return (int(m.group(1)), int(m.group(2))) if m else None
+
+
+def parse_spo2(valor):
+    """SpO2 em int a partir de '97%', '97' ou 97. None se não houver número."""
+    if valor is None:
+        return None
+    if isinstance(valor, (int, float)):
+        return int(valor)
+    m = _RE_SPO2.match(str(valor))
+    return int(m.group(1)) if m else None
+
+
+def validar_faixa(nome, valor, limites):
+    if valor is not None and not limites[0] <= valor <= limites[1]:
+        raise ValueError(f"{nome} fora da faixa aceita {limites}: {valor}")
+    return valor
+
+
+# --- MODELO DA ENTRADA DA API (JSON, msgpack ou binário: ver wire_format.py) ---
+class VitalSigns(BaseModel):
+    """
+    Sinais vitais do relógio. Os textos antigos ("120/80", "97%", "PERIGO VENTRICULAR")
+    continuam aceitos, mas são convertidos e validados UMA vez aqui: o resto da API usa
+    systolic/diastolic/spo2 (int) e rhythm (classe AAMI).
+    """
+    patient_name: str
+    location_type: str
+    timestamp: str
+    ecg_status: Optional[str] = None
+    bp_value: Optional[str] = None
+    spo2_value: Optional[str] = None
+    systolic: Optional[int] = None
+    diastolic: Optional[int] = None
+    spo2: Optional[int] = None
+    rhythm: Optional[RhythmClass] = None
+
+    @model_validator(mode="after")
+    def converter_sinais(self):
+        if self.systolic is None or self.diastolic is None:
+            pa = parse_pressao(self.bp_value)
+            if pa is None:
+                raise ValueError("Informe bp_value ('120/80') ou systolic e diastolic.")
+            self.systolic, self.diastolic = pa
+        if self.spo2 is None:
+            self.spo2 = parse_spo2(self.spo2_value)
+            if self.spo2 is None:
+                raise ValueError("Informe spo2_value ('97%') ou spo2.")
+        if self.rhythm is None:
+            if not self.ecg_status:
+                raise ValueError("Informe ecg_status ou rhythm.")
+            self.rhythm = classificar_ritmo(self.ecg_status)
+        validar_faixa("systolic", self.systolic, LIMITES_SISTOLICA)
+        validar_faixa("diastolic", self.diastolic, LIMITES_DIASTOLICA)
+        validar_faixa("spo2", self.spo2, LIMITES_SPO2)
+        # Textos para exibição (app da família, dashboard) quando o app manda só os campos tipados
+        self.bp_value = self.bp_value or f"{self.systolic}/{self.diastolic}"
+        self.spo2_value = self.spo2_value or f"{self.spo2}%"
+        self.ecg_status = self.ecg_status or self.rhythm.descricao
+        return self
+
+    def evento(self, data):
+        """Linha do histórico (colunas públicas do HistoryStore)."""
+        return {
+            "Data": data,
+            "Paciente": self.patient_name,
+            "ECG": self.ecg_status,
+            "PA": self.bp_value,
+            "SpO2": self.spo2_value,
+            "Local": self.location_type,
+            "Analise_IA": None,
+            "Timestamp_Dispositivo": self.timestamp,
+            "PA_Sys": self.systolic,
+            "PA_Dia": self.diastolic,
+            "SpO2_Num": self.spo2,
+            "Ritmo": self.rhythm.value,
+        }
+
+    def consulta_rag(self):
+        """(ecg, pa, spo2, local) para o get_advice, com PA e SpO2 já numéricos."""
+        return (self.ecg_status, (self.systolic, self.diastolic), self.spo2, self.location_type)
@@ -0,0 +1,274 @@
+"""
+"Caixa Preta" do evento: o ECG bruto (antes e depois do evento) enviado pelo relógio.
+
+As amostras ficam em arquivos binários int16 por paciente, divididos em chunks
+(ecg_waveforms/<paciente>/000000.i16, 000001.i16, ...), só com appends. Cada
+evento aponta para (arquivo, offset, n) numa tabela `ondas` do heartguard.db,
+então ler a onda de um evento é um np.memmap de uma fatia do arquivo, sem
+carregar o resto do histórico na memória.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import zlib
+import numpy as np
+from history_store import DB_FILE
+
+try:
+    import fcntl  # Trava entre processos (vários workers do uvicorn)
+except ImportError:
+    fcntl = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+WAVEFORM_DIR = "ecg_waveforms"
+CHUNK_AMOSTRAS = 1 << 22  # 4M amostras int16 (8 MB) por arquivo
+DTYPE = np.dtype("<i2")
+ESCALA_PADRAO = 1 / 200  # mV por unidade (ganho de 200 adu/mV do MIT-BIH)
+CODIFICACOES = ("int16", "delta")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ondas (
+    evento_id INTEGER PRIMARY KEY,
+    paciente TEXT NOT NULL,
+    arquivo TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    fs REAL NOT NULL,
+    pre_evento INTEGER NOT NULL,
+    escala REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_ondas_paciente ON ondas (paciente);
+"""
+
+
+# --- DECODIFICAÇÃO DO PAYLOAD DO RELÓGIO ---
+class CorpoGrandeError(ValueError):
+    """O corpo descomprimido passa do limite (a API responde 413)."""
+
+
+def _gunzip(corpo, limite):
+    # zlib com teto de saída: um corpo pequeno que infla para GBs para no limite + 1
+    saida = []
+    total = 0
+    while corpo:
+        d = zlib.decompressobj(wbits=31)
+        parte = d.decompress(corpo, 0 if limite is None else limite - total + 1)
+        total += len(parte)
+        if limite is not None and (total > limite or d.unconsumed_tail):
+            raise CorpoGrandeError(f"Corpo descomprimido passa de {limite} bytes.")
+        if not d.eof:
+            raise ValueError("gzip truncado.")
+        saida.append(parte)
+        corpo = d.unused_data  # gzip com vários membros (igual ao gzip.decompress)
+    return b"".join(saida)
+
+
+def _unzstd(corpo, limite):
+    leitor = zstandard.ZstdDecompressor().stream_reader(corpo)
+    if limite is None:
+        return leitor.readall()
+    saida = []
+    total = 0
+    while total <= limite:
+        parte = leitor.read(limite + 1 - total)
+        if not parte:
+            break
+        saida.append(parte)
+        total += len(parte)
+    if total > limite:
+        raise CorpoGrandeError(f"Corpo descomprimido passa de {limite} bytes.")
+    return b"".join(saida)
+
+
+def descomprimir(corpo, content_encoding=None, limite=None):
+    """
+    Aceita o corpo cru, gzip ou zstd (se o pacote zstandard estiver instalado).
+    Com `limite`, nunca descomprime mais que limite + 1 bytes: se passar, CorpoGrandeError.
+    """
+    content_encoding = (content_encoding or "identity").strip().lower()
+    if content_encoding in ("identity", ""):
+        dados = corpo
+    elif content_encoding == "gzip":
+        try:
+            dados = _gunzip(corpo, limite)
+        except zlib.error as e:
+            raise ValueError(f"gzip inválido: {e}")
+    elif content_encoding == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd não suportado neste servidor (pip install zstandard).")
+        try:
+            dados = _unzstd(corpo, limite)
+        except zstandard.ZstdError as e:
+            raise ValueError(f"zstd inválido: {e}")
+    else:
+        raise ValueError(f"Content-Encoding '{content_encoding}' não suportado.")
+    if limite is not None and len(dados) > limite:
+        raise CorpoGrandeError(f"Corpo passa de {limite} bytes.")
+    return dados
+
+
+def decodificar_amostras(dados, codificacao="int16"):
+    """
+    int16: amostras little-endian.
+    delta: 1ª amostra absoluta e as outras como diferença da anterior (int16).
+    As diferenças são pequenas, então comprimem bem melhor com gzip/zstd.
+    """
+    if codificacao not in CODIFICACOES:
+        raise ValueError(f"Codificação '{codificacao}' inválida. Use {CODIFICACOES}.")
+    if len(dados) % DTYPE.itemsize:
+        raise ValueError("Payload com número ímpar de bytes (esperado int16).")
+    amostras = np.frombuffer(dados, dtype=DTYPE)
+    if codificacao == "delta":
+        # Soma acumulada em int16: o estouro "dá a volta" igual ao do encoder, então é exata
+        amostras = np.cumsum(amostras, dtype=DTYPE)
+    return amostras
+
+
+def codificar_amostras(amostras, codificacao="int16"):
+    """Inverso de decodificar_amostras (usado em testes e no bench)."""
+    amostras = np.asarray(amostras, dtype=DTYPE)
+    if codificacao == "delta":
+        amostras = np.diff(amostras, prepend=np.zeros(1, dtype=DTYPE)).astype(DTYPE)
+    return amostras.tobytes()
+
+
+# --- DECIMAÇÃO PARA A TELA ---
+def decimar(amostras, pontos):
+    """
+    Reduz o sinal para ~`pontos` pontos guardando o mínimo e o máximo de cada
+    faixa (na ordem em que acontecem), para o QRS não sumir do gráfico.
+    Devolve (índices, valores).
+    """
+    n = len(amostras)
+    if pontos <= 0 or n <= pontos:
+        return np.arange(n), np.asarray(amostras)
+    faixas = max(1, pontos // 2)
+    tamanho = -(-n // faixas)  # Arredonda para cima
+    faixas = -(-n // tamanho)
+    cheio = np.full(faixas * tamanho, amostras[-1], dtype=amostras.dtype)
+    cheio[:n] = amostras
+    blocos = cheio.reshape(faixas, tamanho)
+    base = np.arange(faixas) * tamanho
+    i_min = base + blocos.argmin(axis=1)
+    i_max = base + blocos.argmax(axis=1)
+    indices = np.stack([np.minimum(i_min, i_max), np.maximum(i_min, i_max)], axis=1).ravel()
+    indices = np.minimum(indices, n - 1)
+    return indices, np.asarray(amostras)[indices]
+
+
+def _pasta_paciente(paciente):
+    """Nome de pasta seguro e estável para o paciente (nomes têm espaços, acentos e parênteses)."""
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", paciente).strip("_")[:40] or "paciente"
+    return f"{slug}_{hashlib.sha1(paciente.encode('utf-8')).hexdigest()[:8]}"
+
+
+class WaveformStore:
+    """Ondas de ECG por evento em arquivos int16 (memmap) + índice no SQLite."""
+
+    def __init__(self, base_dir=WAVEFORM_DIR, db_file=DB_FILE, chunk_amostras=CHUNK_AMOSTRAS):
+        self.base_dir = base_dir
+        self.db_file = db_file
+        self.chunk_amostras = chunk_amostras
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    # --- CONEXÃO (uma por thread) ---
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # --- ESCRITA ---
+    def _arquivo_atual(self, pasta, n):
+        """Último chunk do paciente, ou um novo se este não comportar mais n amostras."""
+        existentes = sorted(nome for nome in os.listdir(pasta) if nome.endswith(".i16"))
+        numero = int(existentes[-1][:-4]) if existentes else 0
+        caminho = os.path.join(pasta, f"{numero:06d}.i16")
+        usado = os.path.getsize(caminho) // DTYPE.itemsize if os.path.exists(caminho) else 0
+        if usado and usado + n > self.chunk_amostras:
+            caminho = os.path.join(pasta, f"{numero + 1:06d}.i16")
+        return caminho
+
+    def append(self, evento_id, paciente, amostras, fs, pre_evento=None, escala=ESCALA_PADRAO):
+        """
+        Grava a onda de um evento. Devolve False se o evento já tinha onda
+        (o relógio reenviou), True se gravou.
+        """
+        amostras = np.ascontiguousarray(amostras, dtype=DTYPE)
+        if self.get_info(evento_id) is not None:
+            return False
+        pre_evento = len(amostras) // 2 if pre_evento is None else int(pre_evento)
+        pasta = os.path.join(self.base_dir, _pasta_paciente(paciente))
+        os.makedirs(pasta, exist_ok=True)
+
+        with self._lock, open(os.path.join(pasta, ".lock"), "w") as trava:
+            if fcntl is not None:
+                fcntl.flock(trava, fcntl.LOCK_EX)
+            if self.get_info(evento_id) is not None:
+                return False
+            caminho = self._arquivo_atual(pasta, len(amostras))
+            with open(caminho, "ab") as f:
+                offset = f.tell() // DTYPE.itemsize
+                f.write(amostras.tobytes())
+            with self._conn() as conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO ondas (evento_id, paciente, arquivo, offset, n, fs, pre_evento, escala) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (evento_id, paciente, os.path.relpath(caminho, self.base_dir), offset,
+                     len(amostras), float(fs), pre_evento, float(escala)),
+                )
+        return True
+
+    # --- LEITURA ---
+    def get_info(self, evento_id):
+        row = self._conn().execute(
+            "SELECT evento_id, paciente, arquivo, offset, n, fs, pre_evento, escala FROM ondas WHERE evento_id = ?",
+            (evento_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(["evento_id", "paciente", "arquivo", "offset", "n", "fs", "pre_evento", "escala"], row))
+
+    def amostras(self, evento_id):
+        """(info, memmap int16 somente leitura) ou (None, None) se o evento não tem onda."""
+        info = self.get_info(evento_id)
+        if info is None:
+            return None, None
+        if info["n"] == 0:
+            return info, np.zeros(0, dtype=DTYPE)
+        dados = np.memmap(os.path.join(self.base_dir, info["arquivo"]), dtype=DTYPE, mode="r",
+                          offset=info["offset"] * DTYPE.itemsize, shape=(info["n"],))
+        return info, dados
+
+    def janela(self, evento_id, inicio=None, fim=None, pontos=2000):
+        """
+        Trecho da onda em mV, decimado para `pontos` pontos.
+        inicio/fim em segundos relativos ao instante do evento (negativo = antes).
+        Devolve None se o evento não tem onda.
+        """
+        info, dados = self.amostras(evento_id)
+        if info is None:
+            return None
+        fs, pre = info["fs"], info["pre_evento"]
+        a = 0 if inicio is None else int(np.clip(round(inicio * fs) + pre, 0, info["n"]))
+        b = info["n"] if fim is None else int(np.clip(round(fim * fs) + pre, a, info["n"]))
+        indices, valores = decimar(dados[a:b], pontos)
+        return {
+            "fs": fs,
+            "total_amostras": info["n"],
+            "decimado": len(indices) < b - a,
+            "t": (indices + a - pre) / fs,
+            "mv": valores.astype(np.float32) * info["escala"],
+        }
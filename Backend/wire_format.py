@@ -0,0 +1,211 @@
+"""
+Formatos de envio dos sinais vitais (relógio/celular -> API), negociados pelo
+Content-Type do /analyze e do /analyze_batch. JSON continua sendo o padrão.
+
+- application/json (e application/x-ndjson no lote): o formato de sempre.
+- application/msgpack: o mesmo objeto do JSON (uma lista no lote), aceitando as
+  chaves curtas de CHAVES_CURTAS. Precisa do pacote msgpack.
+- application/x-heartguard-vitals: registro binário definido aqui (sem dependência):
+
+    cabeçalho: "HG" | versão u8 | n_registros u16
+    registro:  sistólica u16 | diastólica u8 | spo2 u8 | ritmo u8 (posição em RhythmClass)
+               | local u8 (posição em LOCAIS; 255 = texto a seguir: len u8 + UTF-8)
+               | len u8 + timestamp (UTF-8) | len u8 + patient_name (UTF-8)
+
+  Inteiros little-endian. Um evento do relógio fica com ~45 bytes (o JSON tem ~170).
+
+Todos podem vir com Content-Encoding gzip ou zstd (a API descomprime com o
+waveform_store.descomprimir). O msgpack e o binário levam os campos já tipados
+(systolic/diastolic/spo2/rhythm), então vão direto para o VitalSigns sem o parse
+dos textos "120/80" e "97%".
+"""
+import json
+import struct
+from vitals import RhythmClass, VitalSigns
+
+# Tenta importar o msgpack; sem ele, só JSON e o binário próprio
+try:
+    import msgpack
+    MSGPACK_INSTALLED = True
+except ImportError:
+    MSGPACK_INSTALLED = False
+
+JSON = "application/json"
+NDJSON = "application/x-ndjson"
+MSGPACK = "application/msgpack"
+BINARIO = "application/x-heartguard-vitals"
+_TIPOS_MSGPACK = (MSGPACK, "application/x-msgpack", "application/vnd.msgpack")
+
+# Chaves curtas aceitas no msgpack (as longas também valem)
+CHAVES_CURTAS = {
+    "p": "patient_name",
+    "l": "location_type",
+    "t": "timestamp",
+    "s": "systolic",
+    "d": "diastolic",
+    "o": "spo2",
+    "r": "rhythm",
+    "e": "ecg_status",
+}
+
+LOCAIS = ("URBANA", "RURAL_REMOTA")  # TipoRegiao do app do relógio (um byte em vez do texto)
+LOCAL_TEXTO = 255
+_RITMOS = list(RhythmClass)
+MAGIC = b"HG"
+VERSAO = 1
+_CABECALHO = struct.Struct("<2sBH")
+_REGISTRO = struct.Struct("<HBBBB")
+MAX_REGISTROS = 0xFFFF
+
+
+class FormatoNaoSuportadoError(ValueError):
+    """Content-Type conhecido, mas sem suporte neste servidor (ex.: msgpack não instalado)."""
+
+
+def formato(content_type):
+    """Formato do corpo pelo Content-Type (sem Content-Type ou desconhecido: JSON)."""
+    tipo = (content_type or "").split(";")[0].strip().lower()
+    if tipo in _TIPOS_MSGPACK:
+        return MSGPACK
+    if tipo == BINARIO:
+        return BINARIO
+    if "ndjson" in tipo or "jsonlines" in tipo:
+        return NDJSON
+    return JSON
+
+
+# --- BINÁRIO PRÓPRIO ---
+def _texto(texto):
+    dados = str(texto).encode("utf-8")
+    if len(dados) > 255:
+        raise ValueError(f"Texto com mais de 255 bytes: {texto[:40]}...")
+    return bytes((len(dados),)) + dados
+
+
+def codificar_binario(eventos):
+    """Lista de VitalSigns (ou dicts aceitos por ele) -> corpo application/x-heartguard-vitals."""
+    if len(eventos) > MAX_REGISTROS:
+        raise ValueError(f"Máximo de {MAX_REGISTROS} registros por corpo.")
+    partes = [_CABECALHO.pack(MAGIC, VERSAO, len(eventos))]
+    for ev in eventos:
+        if not isinstance(ev, VitalSigns):
+            ev = VitalSigns.model_validate(ev)
+        local = LOCAIS.index(ev.location_type) if ev.location_type in LOCAIS else LOCAL_TEXTO
+        partes.append(_REGISTRO.pack(ev.systolic, ev.diastolic, ev.spo2, _RITMOS.index(ev.rhythm), local))
+        if local == LOCAL_TEXTO:
+            partes.append(_texto(ev.location_type))
+        partes.append(_texto(ev.timestamp))
+        partes.append(_texto(ev.patient_name))
+    return b"".join(partes)
+
+
+def decodificar_binario(dados):
+    """Corpo application/x-heartguard-vitals -> lista de dicts com os campos tipados do VitalSigns."""
+    try:
+        magic, versao, n = _CABECALHO.unpack_from(dados, 0)
+        if magic != MAGIC or versao != VERSAO:
+            raise ValueError(f"Cabeçalho binário inválido (esperado {MAGIC!r} versão {VERSAO}).")
+        pos = _CABECALHO.size
+        eventos = []
+        for _ in range(n):
+            sistolica, diastolica, spo2, ritmo, local = _REGISTRO.unpack_from(dados, pos)
+            pos += _REGISTRO.size
+            textos = []
+            for _ in range(3 if local == LOCAL_TEXTO else 2):
+                fim = pos + 1 + dados[pos]
+                if fim > len(dados):
+                    raise ValueError("Registro binário truncado.")
+                textos.append(dados[pos + 1:fim].decode("utf-8"))
+                pos = fim
+            if local == LOCAL_TEXTO:
+                local = textos.pop(0)
+            elif local < len(LOCAIS):
+                local = LOCAIS[local]
+            else:
+                raise ValueError(f"Código de local inválido: {local}")
+            if ritmo >= len(_RITMOS):
+                raise ValueError(f"Código de ritmo inválido: {ritmo}")
+            eventos.append({
+                "patient_name": textos[1],
+                "location_type": local,
+                "timestamp": textos[0],
+                "systolic": sistolica,
+                "diastolic": diastolica,
+                "spo2": spo2,
+                "rhythm": _RITMOS[ritmo],
+            })
+    except (struct.error, IndexError) as e:
+        raise ValueError(f"Registro binário truncado: {e}")
+    if pos != len(dados):
+        raise ValueError(f"{len(dados) - pos} bytes sobrando depois do último registro.")
+    return eventos
+
+
+# --- MSGPACK ---
+def codificar_msgpack(eventos, chaves_curtas=True):
+    """Lista de VitalSigns (ou um só) -> corpo msgpack só com os campos tipados."""
+    if not MSGPACK_INSTALLED:
+        raise FormatoNaoSuportadoError("msgpack não instalado (pip install msgpack).")
+    longas = {v: k for k, v in CHAVES_CURTAS.items()}
+
+    def compacto(ev):
+        campos = {
+            "patient_name": ev.patient_name,
+            "location_type": ev.location_type,
+            "timestamp": ev.timestamp,
+            "systolic": ev.systolic,
+            "diastolic": ev.diastolic,
+            "spo2": ev.spo2,
+            "rhythm": ev.rhythm.value,
+        }
+        return {longas[k] if chaves_curtas else k: v for k, v in campos.items()}
+
+    if isinstance(eventos, VitalSigns):
+        return msgpack.packb(compacto(eventos))
+    return msgpack.packb([compacto(ev) for ev in eventos])
+
+
+def _expandir(item):
+    if isinstance(item, dict):
+        return {CHAVES_CURTAS.get(k, k): v for k, v in item.items()}
+    return item
+
+
+def decodificar_msgpack(dados):
+    if not MSGPACK_INSTALLED:
+        raise FormatoNaoSuportadoError("msgpack não suportado neste servidor (pip install msgpack).")
+    try:
+        objeto = msgpack.unpackb(dados, raw=False, strict_map_key=True)
+    except (msgpack.exceptions.UnpackException, ValueError) as e:
+        raise ValueError(f"msgpack inválido: {e}")
+    return [_expandir(i) for i in objeto] if isinstance(objeto, list) else _expandir(objeto)
+
+
+# --- ENTRADA DA API (corpo já descomprimido pelo waveform_store.descomprimir) ---
+def ler_evento(dados, content_type=None):
+    """Corpo do /analyze -> VitalSigns (ValidationError se os campos forem inválidos)."""
+    tipo = formato(content_type)
+    if tipo in (JSON, NDJSON):
+        return VitalSigns.model_validate_json(dados)  # O pydantic lê o JSON direto para o modelo
+    item = decodificar_binario(dados) if tipo == BINARIO else decodificar_msgpack(dados)
+    if isinstance(item, list):
+        if len(item) != 1:
+            raise ValueError(f"Esperado 1 evento, recebidos {len(item)} (use o /analyze_batch).")
+        item = item[0]
+    return VitalSigns.model_validate(item)
+
+
+def ler_lote(dados, content_type=None):
+    """Corpo do /analyze_batch -> lista de itens (dicts), validados um a um pela API."""
+    tipo = formato(content_type)
+    if tipo == BINARIO:
+        return decodificar_binario(dados)
+    if tipo == MSGPACK:
+        itens = decodificar_msgpack(dados)
+    elif tipo == NDJSON:
+        itens = [json.loads(linha) for linha in dados.splitlines() if linha.strip()]
+    else:
+        itens = json.loads(dados)
+    if not isinstance(itens, list):
+        raise ValueError("Esperado um array de eventos.")
+    return itens
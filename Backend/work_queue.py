@@ -0,0 +1,81 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFullError(Exception):
+    """A fila de trabalho está cheia (o cliente deve tentar de novo mais tarde)."""
+
+
+class WorkQueue:
+    """
+    Pool de threads limitado para tarefas lentas (RAG, SMS) fora do caminho da requisição.
+
+    - max_pending limita quantas tarefas podem estar na fila + executando (backpressure):
+      quando cheia, reservar() devolve False e a API responde 503.
+    - Cada tarefa é repetida até max_retries vezes com backoff exponencial.
+    """
+
+    def __init__(self, max_workers=4, max_pending=200, max_retries=3, backoff=0.5, nome="heartguard-worker"):
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=nome)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def pending(self):
+        return self._pending
+
+    # --- RESERVA DE VAGA (para checar capacidade antes de persistir o evento) ---
+    def reservar(self):
+        if not self._slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            self._pending += 1
+        return True
+
+    def liberar(self):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    # --- SUBMISSÃO ---
+    def submit(self, func, *args, on_failure=None, reservado=False, **kwargs):
+        """
+        Agenda func(*args, **kwargs). Se reservado=False, tenta reservar uma vaga
+        e levanta QueueFullError se a fila estiver cheia.
+        on_failure(exc) é chamado se todas as tentativas falharem.
+        """
+        if not reservado and not self.reservar():
+            raise QueueFullError("Fila de trabalho cheia")
+        try:
+            return self._executor.submit(self._executar, func, args, kwargs, on_failure)
+        except Exception:
+            self.liberar()
+            raise
+
+    def _executar(self, func, args, kwargs, on_failure):
+        try:
+            for tentativa in range(1, self.max_retries + 1):
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    if tentativa == self.max_retries:
+                        print(f"❌ Tarefa {func.__name__} falhou após {tentativa} tentativas: {e}")
+                        if on_failure:
+                            try:
+                                on_failure(e)
+                            except Exception as e2:
+                                print(f"❌ Erro no on_failure de {func.__name__}: {e2}")
+                        return None
+                    espera = self.backoff * (2 ** (tentativa - 1))
+                    print(f"🔁 Tarefa {func.__name__} falhou ({e}). Nova tentativa em {espera:.1f}s...")
+                    time.sleep(espera)
+        finally:
+            self.liberar()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -22,12 +22,18 @@ import androidx.wear.compose.material.MaterialTheme
 import androidx.wear.compose.material.Text
 import kotlinx.coroutines.delay
 import kotlinx.coroutines.launch
+import okhttp3.MediaType
+import okhttp3.RequestBody
 import org.tensorflow.lite.Interpreter
 import retrofit2.Retrofit
 import retrofit2.converter.gson.GsonConverterFactory
 import retrofit2.http.Body
+import retrofit2.http.Header
 import retrofit2.http.POST
+import retrofit2.http.Path
+import retrofit2.http.Query
 import java.io.BufferedReader
+import java.io.ByteArrayOutputStream
 import java.io.FileInputStream
 import java.io.InputStreamReader
 import java.nio.ByteBuffer
@@ -37,6 +43,8 @@ import java.nio.channels.FileChannel
 import java.text.SimpleDateFormat
 import java.util.Date
 import java.util.Locale
+import java.util.zip.GZIPOutputStream
+import kotlin.math.roundToInt
 import kotlin.random.Random
 
 // --- 1. CONFIGURAÇÃO DE REDE (RETROFIT) ---
@@ -56,12 +64,30 @@ data class VitalSigns(
 
 data class ApiResponse(
     val status: String,
-    val medical_advice: String
+    val medical_advice: String,
+    val event_id: Int? = null
+)
+
+data class WaveformResponse(
+    val status: String,
+    val samples: Int
 )
 
 interface ApiService {
     @POST("analyze")
     suspend fun sendVitals(@Body data: VitalSigns): ApiResponse
+
+    // "Caixa Preta": ECG bruto do evento (int16 delta + gzip)
+    @POST("waveform/{event_id}")
+    suspend fun sendWaveform(
+        @Path("event_id") eventId: Int,
+        @Query("fs") fs: Int,
+        @Query("pre_event") preEvent: Int,
+        @Query("encoding") encoding: String,
+        @Query("scale") scale: Double,
+        @Header("Content-Encoding") contentEncoding: String,
+        @Body body: RequestBody
+    ): WaveformResponse
 }
 
 object RetrofitClient {
@@ -74,6 +100,26 @@ object RetrofitClient {
     }
 }
 
+// --- CAIXA PRETA (ECG BRUTO DO EVENTO) ---
+const val ECG_FS = 360
+const val ECG_ESCALA = 0.001 // O sinal simulado vai de 0 a 1: envia em milésimos
+const val SEGUNDOS_ANTES = 5
+const val SEGUNDOS_DEPOIS = 5
+
+// Cada amostra vira a diferença (int16) para a anterior: valores pequenos que o gzip comprime bem
+fun codificarOnda(amostras: List<Float>): ByteArray {
+    val buffer = ByteBuffer.allocate(amostras.size * 2).order(ByteOrder.LITTLE_ENDIAN)
+    var anterior = 0
+    for (valor in amostras) {
+        val atual = (valor / ECG_ESCALA).roundToInt().coerceIn(Short.MIN_VALUE.toInt(), Short.MAX_VALUE.toInt())
+        buffer.putShort((atual - anterior).toShort())
+        anterior = atual
+    }
+    val saida = ByteArrayOutputStream()
+    GZIPOutputStream(saida).use { it.write(buffer.array()) }
+    return saida.toByteArray()
+}
+
 // --- 2. PERFIL DO PACIENTE ---
 enum class TipoRegiao { URBANA, RURAL_REMOTA }
 
@@ -274,6 +320,21 @@ class MainActivity : ComponentActivity() {
                     )
 
                     val response = RetrofitClient.api.sendVitals(dadosParaEnvio)
+
+                    // Envia a "Caixa Preta" (ECG antes e depois do evento) para o dashboard
+                    val eventId = response.event_id
+                    if (maxIndex == 1 && eventId != null) {
+                        val inicio = maxOf(0, currentIndex - SEGUNDOS_ANTES * ECG_FS)
+                        val fim = minOf(ecgData.size, currentIndex + inputSize + SEGUNDOS_DEPOIS * ECG_FS)
+                        try {
+                            RetrofitClient.api.sendWaveform(
+                                eventId, ECG_FS, currentIndex - inicio, "delta", ECG_ESCALA, "gzip",
+                                RequestBody.create(MediaType.parse("application/octet-stream"), codificarOnda(ecgData.subList(inicio, fim)))
+                            )
+                        } catch (e: Exception) {
+                            Log.e("HeartGuardDebug", "Erro ao enviar a onda: ${e.message}")
+                        }
+                    }
                     if (maxIndex == 1) iaResponseText = "⚠️ DETECTADO: $acaoLogistica"
                     else iaResponseText = response.medical_advice.take(80) + "..."
 
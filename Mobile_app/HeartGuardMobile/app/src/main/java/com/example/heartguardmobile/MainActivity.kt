@@ -23,15 +23,22 @@ import androidx.compose.ui.unit.dp
 import androidx.compose.ui.unit.sp
 import kotlinx.coroutines.delay
 import kotlinx.coroutines.launch
+import retrofit2.Response
 import retrofit2.Retrofit
 import retrofit2.converter.gson.GsonConverterFactory
 import retrofit2.http.Body
 import retrofit2.http.GET
+import retrofit2.http.Header
 import retrofit2.http.POST
+import retrofit2.http.Path
+import retrofit2.http.Query
 
 // --- CONFIGURAÇÃO ---
 const val BASE_URL = "https://drawlingly-precurricular-eugena.ngrok-free.dev/" // <--- CONFIRA SEU LINK!
 
+// Tempo que o servidor segura o long-poll (menor que o timeout de leitura padrão do OkHttp, 10 s)
+const val LONG_POLL_SEGUNDOS = 8
+
 // --- MODELOS ---
 data class PatientStatus(
     val Paciente: String,
@@ -39,7 +46,8 @@ data class PatientStatus(
     val PA: String,
     val SpO2: String,
     val Analise_IA: String,
-    val Medicacao_Cadastrada: String? = "sua medicação"
+    val Medicacao_Cadastrada: String? = "sua medicação",
+    val Ritmo: String? = null // Classe AAMI já calculada pela API (N, S, V, F, Q)
 )
 
 data class PatientConfig(
@@ -51,13 +59,22 @@ data class PatientConfig(
     val medication: String
 )
 
-data class ApiResult(val status: String, val message: String)
+data class ApiResult(val status: String, val message: String, val patient_id: Int? = null)
 
 // --- API ---
 interface ApiService {
     @GET("latest_status")
     suspend fun getStatus(): PatientStatus
 
+    // Status só deste paciente. Com If-None-Match + wait, o servidor segura a resposta
+    // até chegar um evento novo (ou devolve 304 se nada mudou).
+    @GET("latest_status/{patient_id}")
+    suspend fun getPatientStatus(
+        @Path("patient_id") patientId: String,
+        @Header("If-None-Match") etag: String?,
+        @Query("wait") wait: Int
+    ): Response<PatientStatus>
+
     @POST("register_patient")
     suspend fun registerPatient(@Body config: PatientConfig): ApiResult
 }
@@ -87,17 +104,20 @@ class MainActivity : ComponentActivity() {
 fun AppNavigation() {
     var currentScreen by remember { mutableStateOf("form") }
     var userName by remember { mutableStateOf("") }
+    var patientId by remember { mutableStateOf("") } // id do cadastro na API (o status é buscado por ele)
 
     if (currentScreen == "form") {
         RegistrationScreen(
-            onRegistered = { name ->
+            onRegistered = { name, id ->
                 userName = name
+                patientId = id
                 currentScreen = "dashboard"
             }
         )
     } else {
         FamilyDashboard(
             userName = userName,
+            patientId = patientId,
             onEditSettings = { currentScreen = "form" } // Volta para o cadastro
         )
     }
@@ -106,7 +126,7 @@ fun AppNavigation() {
 // --- TELA 1: CADASTRO/CONFIGURAÇÃO ---
 @OptIn(ExperimentalMaterial3Api::class)
 @Composable
-fun RegistrationScreen(onRegistered: (String) -> Unit) {
+fun RegistrationScreen(onRegistered: (String, String) -> Unit) {
     var name by remember { mutableStateOf("Sr. João (Ribeirinho)") }
     var phone by remember { mutableStateOf("+55") }
     var medication by remember { mutableStateOf("Losartana 50mg") }
@@ -155,7 +175,10 @@ fun RegistrationScreen(onRegistered: (String) -> Unit) {
                         val config = PatientConfig(name, phone, sys.toInt(), dia.toInt(), spo2.toInt(), medication)
                         val res = RetrofitClient.api.registerPatient(config)
                         Toast.makeText(context, res.message, Toast.LENGTH_SHORT).show()
-                        onRegistered(name)
+                        if (res.status == "success") {
+                            // Servidor antigo (sem patient_id): usa o nome, como antes
+                            onRegistered(name, res.patient_id?.toString() ?: name)
+                        }
                     } catch (e: Exception) {
                         Toast.makeText(context, "Erro de Conexão", Toast.LENGTH_LONG).show()
                     }
@@ -174,9 +197,10 @@ fun RegistrationScreen(onRegistered: (String) -> Unit) {
 
 @OptIn(ExperimentalMaterial3Api::class)
 @Composable
-fun FamilyDashboard(userName: String, onEditSettings: () -> Unit) {
+fun FamilyDashboard(userName: String, patientId: String, onEditSettings: () -> Unit) {
     var status by remember { mutableStateOf(PatientStatus("Carregando...", "...", "--", "--", "", "medicamento")) }
     var isDanger by remember { mutableStateOf(false) }
+    var semEventos by remember { mutableStateOf(false) } // 404: o relógio ainda não enviou nada deste paciente
 
     // Estados do Alerta
     var showDialog by remember { mutableStateOf(false) }
@@ -188,14 +212,30 @@ fun FamilyDashboard(userName: String, onEditSettings: () -> Unit) {
 
     val context = LocalContext.current
 
-    // Loop de Monitoramento de Dados (Fica rodando sempre)
-    LaunchedEffect(Unit) {
+    // Loop de Monitoramento de Dados (Fica rodando sempre, em long-poll)
+    LaunchedEffect(patientId) {
+        var etag: String? = null
         while (true) {
             try {
-                val novoStatus = RetrofitClient.api.getStatus()
+                val resposta = RetrofitClient.api.getPatientStatus(patientId, etag, LONG_POLL_SEGUNDOS)
+                if (resposta.code() == 404) {
+                    // Nenhum evento deste paciente (ou cadastro não encontrado): mostra na tela e tenta de novo
+                    semEventos = true
+                    isDanger = false
+                    delay(2000)
+                    continue
+                }
+                val novoStatus = resposta.body()
+                if (resposta.code() == 304 || novoStatus == null) {
+                    if (!resposta.isSuccessful && resposta.code() != 304) delay(2000) // Erro do servidor
+                    continue
+                }
+                etag = resposta.headers()["ETag"]
+                semEventos = false
                 status = novoStatus
 
-                val perigoDetectado = "PERIGO" in novoStatus.ECG || "VENTRICULAR" in novoStatus.ECG || "ANORMALIDADE" in novoStatus.ECG
+                val perigoDetectado = if (!novoStatus.Ritmo.isNullOrEmpty()) novoStatus.Ritmo == "V"
+                    else "PERIGO" in novoStatus.ECG || "VENTRICULAR" in novoStatus.ECG || "ANORMALIDADE" in novoStatus.ECG
 
                 if (perigoDetectado && !alertDismissed) {
                     if (!showDialog) { // Se o alerta acabou de aparecer
@@ -210,8 +250,9 @@ fun FamilyDashboard(userName: String, onEditSettings: () -> Unit) {
                     showDialog = false
                     dialogStep = 0
                 }
-            } catch (e: Exception) {}
-            delay(2000)
+            } catch (e: Exception) {
+                delay(2000) // Sem conexão: tenta de novo em 2 s
+            }
         }
     }
 
@@ -340,8 +381,14 @@ fun FamilyDashboard(userName: String, onEditSettings: () -> Unit) {
                 modifier = Modifier.fillMaxWidth().height(150.dp)
             ) {
                 Column(modifier = Modifier.fillMaxSize(), verticalArrangement = Arrangement.Center, horizontalAlignment = Alignment.CenterHorizontally) {
-                    Text(if (isDanger) "🚨 PERIGO" else "✅ ESTÁVEL", color = Color.White, fontSize = 36.sp, fontWeight = FontWeight.Bold)
-                    Text(status.ECG, color = Color.White.copy(alpha = 0.7f), fontSize = 16.sp)
+                    if (semEventos) {
+                        Text("⏳ AGUARDANDO", color = Color.White, fontSize = 36.sp, fontWeight = FontWeight.Bold)
+                        Text("Sem eventos para este paciente", color = Color.White.copy(alpha = 0.7f), fontSize = 16.sp)
+                        Text("Confira se o relógio usa o mesmo nome do cadastro", color = Color.White.copy(alpha = 0.5f), fontSize = 12.sp)
+                    } else {
+                        Text(if (isDanger) "🚨 PERIGO" else "✅ ESTÁVEL", color = Color.White, fontSize = 36.sp, fontWeight = FontWeight.Bold)
+                        Text(status.ECG, color = Color.White.copy(alpha = 0.7f), fontSize = 16.sp)
+                    }
                 }
             }
             Spacer(modifier = Modifier.height(24.dp))